@@ -0,0 +1,129 @@
+"""Transfer latency while other clients log in.
+
+Starts an FTP server in a background thread, keeps one session
+downloading a small file in a loop and measures how long each RETR takes
+while several other clients log in concurrently. Run it once with
+password verification in the event loop and once with a thread pool::
+
+    $ python benchmarks/login_latency.py
+    $ python benchmarks/login_latency.py --auth-workers 4
+"""
+
+import argparse
+import ftplib
+import io
+import logging
+import math
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tests", "django_project"))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+HOST = "127.0.0.1"
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+def setup_database(home_dir):
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = os.path.join(home_dir, "bench.sqlite3")
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    from django_ftpserver import models
+
+    call_command("migrate", verbosity=0)
+    user = get_user_model().objects.create_user(USERNAME, password=PASSWORD)
+    group = models.FTPUserGroup.objects.create(name="bench", home_dir=home_dir)
+    models.FTPUserAccount.objects.create(user=user, group=group)
+
+
+def start_server(port, auth_workers):
+    from django_ftpserver.server import FTPServerConfig, FTPServerRunner
+
+    config = FTPServerConfig(host=HOST, port=port, auth_workers=auth_workers)
+    runner = FTPServerRunner(config)
+    server = runner.create_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def login_storm(port, stop):
+    while not stop.is_set():
+        ftp = ftplib.FTP()
+        ftp.connect(HOST, port)
+        ftp.login(USERNAME, PASSWORD)
+        ftp.quit()
+
+
+def measure_transfers(port, duration):
+    ftp = ftplib.FTP()
+    ftp.connect(HOST, port)
+    ftp.login(USERNAME, PASSWORD)
+    samples = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        ftp.retrbinary("RETR payload.bin", io.BytesIO().write)
+        samples.append(time.perf_counter() - started)
+    ftp.quit()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=2199)
+    parser.add_argument("--auth-workers", type=int, default=None)
+    parser.add_argument("--logins", type=int, default=4, help="concurrent logins")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as home_dir:
+        with open(os.path.join(home_dir, "payload.bin"), "wb") as f:
+            f.write(os.urandom(64 * 1024))
+        setup_database(home_dir)
+        server = start_server(args.port, args.auth_workers)
+
+        stop = threading.Event()
+        clients = [
+            threading.Thread(target=login_storm, args=(args.port, stop), daemon=True)
+            for _ in range(args.logins)
+        ]
+        for client in clients:
+            client.start()
+        try:
+            samples = measure_transfers(args.port, args.duration)
+        finally:
+            stop.set()
+            for client in clients:
+                client.join()
+            server.close_all()
+
+    samples.sort()
+    print("auth_workers: {}".format(args.auth_workers))
+    print("concurrent logins: {}".format(args.logins))
+    print("transfers: {}".format(len(samples)))
+    print("p50: {:.1f} ms".format(statistics.median(samples) * 1000))
+    # nearest rank
+    p99 = samples[min(len(samples) - 1, math.ceil(len(samples) * 0.99) - 1)]
+    print("p99: {:.1f} ms".format(p99 * 1000))
+    print("max: {:.1f} ms".format(samples[-1] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Command throughput with a slow storage backend.
+
+Starts an FTP server in a background thread on a StorageFS whose backend
+calls take ``--latency`` seconds each, and lets several clients send SIZE
+commands for different files concurrently. Run it once with backend calls
+in the event loop and once with a thread pool::
+
+    $ python benchmarks/storage_latency.py
+    $ python benchmarks/storage_latency.py --storage-workers 8
+"""
+
+import argparse
+import ftplib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tests", "django_project"))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+HOST = "127.0.0.1"
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+def setup_database(home_dir):
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = os.path.join(home_dir, "bench.sqlite3")
+    # avoid caching, every command makes backend calls
+    settings.FTPSERVER_METADATA_CACHE_TIMEOUT = 0
+    # keep logins out of the measurement
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    from django_ftpserver import models
+
+    call_command("migrate", verbosity=0)
+    user = get_user_model().objects.create_user(USERNAME, password=PASSWORD)
+    group = models.FTPUserGroup.objects.create(name="bench", home_dir=home_dir)
+    models.FTPUserAccount.objects.create(user=user, group=group)
+
+
+def make_filesystem(latency):
+    from django.core.files.storage import FileSystemStorage
+
+    from django_ftpserver.filesystems import StorageFS
+
+    class SlowStorage(FileSystemStorage):
+        def exists(self, name):
+            time.sleep(latency)
+            return super().exists(name)
+
+        def size(self, name):
+            time.sleep(latency)
+            return super().size(name)
+
+    class SlowStorageFS(StorageFS):
+        storage_class = SlowStorage
+
+        def get_storage(self):
+            return SlowStorage(location="/")
+
+    return SlowStorageFS
+
+
+def start_server(port, storage_workers, latency):
+    from django_ftpserver.server import FTPServerConfig, FTPServerRunner
+
+    config = FTPServerConfig(
+        host=HOST,
+        port=port,
+        storage_workers=storage_workers,
+        filesystem_class=make_filesystem(latency),
+    )
+    runner = FTPServerRunner(config)
+    server = runner.create_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def run_client(port, filename, duration, barrier, counts):
+    ftp = ftplib.FTP()
+    ftp.connect(HOST, port)
+    ftp.login(USERNAME, PASSWORD)
+    ftp.voidcmd("TYPE I")
+    barrier.wait()
+    deadline = time.monotonic() + duration
+    count = 0
+    while time.monotonic() < deadline:
+        ftp.sendcmd("SIZE " + filename)
+        count += 1
+    ftp.quit()
+    counts.append(count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=2198)
+    parser.add_argument("--storage-workers", type=int, default=None)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as home_dir:
+        for index in range(args.clients):
+            with open(os.path.join(home_dir, "file{}.bin".format(index)), "wb") as f:
+                f.write(b"x" * 1024)
+        setup_database(home_dir)
+        server = start_server(args.port, args.storage_workers, args.latency)
+
+        counts = []
+        barrier = threading.Barrier(args.clients)
+        clients = [
+            threading.Thread(
+                target=run_client,
+                args=(
+                    args.port,
+                    "file{}.bin".format(index),
+                    args.duration,
+                    barrier,
+                    counts,
+                ),
+            )
+            for index in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        server.close_all()
+
+    total = sum(counts)
+    print("storage_workers: {}".format(args.storage_workers))
+    print("clients: {}".format(args.clients))
+    print("backend latency: {:.1f} ms".format(args.latency * 1000))
+    print("commands: {}".format(total))
+    print("commands/s: {:.1f}".format(total / args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Download throughput with and without sendfile().
+
+Starts an FTP server in a background thread on a StorageFS for
+FileSystemStorage and lets several clients download a file of ``--size``
+MiB over and over. Run it once with files sent by sendfile() (the default
+for local files) and once with buffered producers, as used for remote
+storages::
+
+    $ python benchmarks/transfer_throughput.py
+    $ python benchmarks/transfer_throughput.py --buffered
+"""
+
+import argparse
+import ftplib
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "tests", "django_project"))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+HOST = "127.0.0.1"
+USERNAME = "bench"
+PASSWORD = "bench-password"
+FILENAME = "data.bin"
+
+
+def setup_database(home_dir):
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = os.path.join(home_dir, "bench.sqlite3")
+    # keep logins out of the measurement
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+    import django
+
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    from django_ftpserver import models
+
+    call_command("migrate", verbosity=0)
+    user = get_user_model().objects.create_user(USERNAME, password=PASSWORD)
+    group = models.FTPUserGroup.objects.create(name="bench", home_dir=home_dir)
+    models.FTPUserAccount.objects.create(user=user, group=group)
+
+
+def make_filesystem():
+    from django.core.files.storage import FileSystemStorage
+
+    from django_ftpserver.filesystems import StorageFS
+
+    class LocalStorageFS(StorageFS):
+        storage_class = FileSystemStorage
+
+        def get_storage(self):
+            return FileSystemStorage(location="/")
+
+    return LocalStorageFS
+
+
+def start_server(port, sendfile):
+    from django_ftpserver.server import FTPServerConfig, FTPServerRunner
+
+    config = FTPServerConfig(
+        host=HOST,
+        port=port,
+        sendfile=sendfile,
+        filesystem_class=make_filesystem(),
+    )
+    runner = FTPServerRunner(config)
+    server = runner.create_server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def run_client(port, duration, barrier, counts):
+    ftp = ftplib.FTP()
+    ftp.connect(HOST, port)
+    ftp.login(USERNAME, PASSWORD)
+    ftp.voidcmd("TYPE I")
+    received = [0]
+
+    def callback(data):
+        received[0] += len(data)
+
+    barrier.wait()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        ftp.retrbinary("RETR " + FILENAME, callback, blocksize=256 * 1024)
+    ftp.quit()
+    counts.append(received[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=2199)
+    parser.add_argument(
+        "--buffered",
+        action="store_true",
+        help="send files with producers instead of sendfile()",
+    )
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--size", type=int, default=64, help="MiB")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as home_dir:
+        with open(os.path.join(home_dir, FILENAME), "wb") as f:
+            f.write(os.urandom(args.size * 1024 * 1024))
+        setup_database(home_dir)
+        # None sends files on the local disk with sendfile()
+        server = start_server(args.port, False if args.buffered else None)
+
+        counts = []
+        barrier = threading.Barrier(args.clients)
+        clients = [
+            threading.Thread(
+                target=run_client, args=(args.port, args.duration, barrier, counts)
+            )
+            for _ in range(args.clients)
+        ]
+        cpu = time.process_time()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        cpu = time.process_time() - cpu
+        server.close_all()
+
+    total = sum(counts) / 1024 / 1024
+    print("transfer: {}".format("buffered" if args.buffered else "sendfile"))
+    print("clients: {}".format(args.clients))
+    print("file size: {} MiB".format(args.size))
+    print("received: {:.0f} MiB".format(total))
+    print("MiB/s: {:.1f}".format(total / args.duration))
+    print("CPU seconds per GiB: {:.2f}".format(cpu / (total / 1024)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,20 @@ from django.contrib import admin
 from . import models
 
 
+class FTPPathPermissionInline(admin.TabularInline):
+    """Inline admin class for FTPPathPermission"""
+
+    model = models.FTPPathPermission
+    fields = ("path", "permission")
+    extra = 0
+
+
 class FTPUserGroupAdmin(admin.ModelAdmin):
     """Admin class for FTPUserGroup"""
 
     list_display = ("name", "permission")
     search_fields = ("name", "permission")
+    inlines = (FTPPathPermissionInline,)
 
 
 class FTPUserAccountAdmin(admin.ModelAdmin):
@@ -16,7 +25,17 @@ class FTPUserAccountAdmin(admin.ModelAdmin):
     list_display = ("user", "group", "last_login")
     search_fields = ("user", "group", "last_login")
     raw_id_fields = ("user",)
+    inlines = (FTPPathPermissionInline,)
+
+
+class FTPUploadAdmin(admin.ModelAdmin):
+    """Admin class for FTPUpload"""
+
+    list_display = ("path", "username", "size", "updated")
+    search_fields = ("path", "username")
+    readonly_fields = ("storage", "upload_id", "parts", "size", "created", "updated")
 
 
 admin.site.register(models.FTPUserGroup, FTPUserGroupAdmin)
 admin.site.register(models.FTPUserAccount, FTPUserAccountAdmin)
+admin.site.register(models.FTPUpload, FTPUploadAdmin)
@@ -1,28 +1,200 @@
 import functools
+import hashlib
+import hmac
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
-from django.contrib.auth import authenticate, get_user_model
-from django.db import close_old_connections
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
+from django.db import (
+    DatabaseError,
+    InterfaceError,
+    OperationalError,
+    close_old_connections,
+    connections,
+)
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from pyftpdlib.authorizers import AuthenticationFailed
 
 from . import models
+from . import signals
+from .cache import get_shared_cache
+from .utils import get_ftp_setting
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionManager(object):
+    """Keeps database connections usable in the long-running server.
+
+    Old connections are closed (``close_old_connections``) at most once per
+    ``FTPSERVER_DB_CHECK_INTERVAL`` seconds for each thread. When a query
+    fails because the connection was lost, all connections of the thread
+    are closed so that the retried call reconnects.
+
+    ``checks`` and ``reconnects`` count how often this happened.
+    """
+
+    def __init__(self):
+        self.checks = 0
+        self.reconnects = 0
+        self._local = threading.local()
+
+    def check(self):
+        """close old connections if the check interval has elapsed."""
+        interval = get_ftp_setting("FTPSERVER_DB_CHECK_INTERVAL")
+        now = time.monotonic()
+        last_check = getattr(self._local, "last_check", None)
+        if last_check is not None and now - last_check < interval:
+            return
+        self._local.last_check = now
+        self.checks += 1
+        close_old_connections()
+
+    def reconnect(self):
+        """close all connections of this thread after a connection error."""
+        self.reconnects += 1
+        logger.warning("Database connection lost, reconnecting.")
+        for conn in connections.all(initialized_only=True):
+            conn.close()
+        self._local.last_check = time.monotonic()
+
+
+connection_manager = ConnectionManager()
 
 
 def ensure_db_connection(func):
-    """Decorator to close old database connections before executing the function.
+    """Decorator to keep the database connection usable for the function.
 
     This prevents "MySQL server has gone away" errors in long-running FTP server
-    processes by closing stale database connections before making new queries.
+    processes. Old connections are closed at most once per check interval, and
+    a call that fails because the connection was lost is retried once with a
+    new connection.
     """
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        close_old_connections()
-        return func(*args, **kwargs)
+        connection_manager.check()
+        try:
+            return func(*args, **kwargs)
+        except (InterfaceError, OperationalError):
+            if not _connection_lost():
+                raise
+            connection_manager.reconnect()
+            return func(*args, **kwargs)
 
     return wrapper
 
 
+def _connection_lost():
+    """return True if a connection of this thread is no longer usable."""
+    return any(
+        not conn.is_usable()
+        for conn in connections.all(initialized_only=True)
+        if conn.connection is not None
+    )
+
+
+class CredentialCache(object):
+    """Short-lived cache of successful password verifications.
+
+    Entries are keyed by username and hold an HMAC of the password, made
+    with a key that only lives in this process, together with the user's
+    password hash at the time of the verification. An entry only matches
+    while it is not expired and the password hash is unchanged.
+    """
+
+    def __init__(self, timeout, max_size=1024):
+        self.timeout = timeout
+        self.max_size = max_size
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, username, password):
+        message = "{0}\0{1}".format(username, password).encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def add(self, username, password, password_hash):
+        """remember a successful verification."""
+        entry = (
+            self._digest(username, password),
+            password_hash,
+            time.monotonic() + self.timeout,
+        )
+        with self._lock:
+            self._entries[username] = entry
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def check(self, username, password, password_hash):
+        """return True if password was verified recently for password_hash."""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return False
+            digest, cached_hash, expires = entry
+            if expires < time.monotonic() or cached_hash != password_hash:
+                del self._entries[username]
+                return False
+            self._entries.move_to_end(username)
+        return hmac.compare_digest(digest, self._digest(username, password))
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+class LastLoginBuffer(object):
+    """Collects last_login timestamps and writes them with one query.
+
+    flush() stores all pending values with a single ``bulk_update``.
+    Values that could not be written are kept for the next flush, unless
+    a newer value was added in the meantime.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, pk, value):
+        with self._lock:
+            self._pending[pk] = value
+
+    @ensure_db_connection
+    def _write(self, pending):
+        accounts = [
+            self.model(pk=pk, last_login=value) for pk, value in pending.items()
+        ]
+        self.model.objects.bulk_update(accounts, ["last_login"])
+
+    def flush(self):
+        """write pending timestamps, return the number of accounts."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self._write(pending)
+        except Exception:
+            logger.exception("Failed to update last_login of FTP user accounts.")
+            with self._lock:
+                for pk, value in pending.items():
+                    self._pending.setdefault(pk, value)
+            return 0
+        return len(pending)
+
+
 def _get_personate_user_class():
     """return personate user class"""
     if os.name == "nt":
@@ -40,9 +212,30 @@ class FTPAccountAuthorizer(object):
 
     model = models.FTPUserAccount
     personate_user_class = None
+    # max number of account snapshots kept for has_perm/get_perms
+    account_cache_size = 1024
+
+    # runs background tasks while the server runs, see run_in_background()
+    _background_executor = None
+    _own_background_executor = False
 
     def __init__(self, file_access_user=None):
-        self.username_field = get_user_model().USERNAME_FIELD
+        user_model = get_user_model()
+        self.username_field = user_model.USERNAME_FIELD
+        self.credential_fields = ("user__password",)
+        if any(field.name == "is_active" for field in user_model._meta.get_fields()):
+            self.credential_fields += ("user__is_active",)
+        self._accounts = OrderedDict()
+        self._accounts_lock = threading.Lock()
+        self.credential_cache = self.get_credential_cache()
+        self.shared_cache = get_shared_cache()
+        self.last_login_flush_interval = get_ftp_setting(
+            "FTPSERVER_LAST_LOGIN_FLUSH_INTERVAL"
+        )
+        self.last_login_buffer = LastLoginBuffer(self.model)
+        self._background_tasks = {}
+        self._background_lock = threading.Lock()
+        self._connect_signals()
         if file_access_user:
             personate_user_class = (
                 self.personate_user_class or _get_personate_user_class()
@@ -52,43 +245,292 @@ class FTPAccountAuthorizer(object):
             self.personate_user = None
 
     def _filter_user_by(self, username):
-        return {"user__%s" % self.username_field: username}
+        return {"username": username}
+
+    def get_credential_cache(self):
+        """return CredentialCache if FTPSERVER_AUTH_CACHE_TIMEOUT is set."""
+        timeout = get_ftp_setting("FTPSERVER_AUTH_CACHE_TIMEOUT")
+        if not timeout:
+            return None
+        return CredentialCache(
+            timeout, max_size=get_ftp_setting("FTPSERVER_AUTH_CACHE_SIZE")
+        )
+
+    def _connect_signals(self):
+        """drop account snapshots when related rows are changed."""
+        senders = (
+            self.model,
+            models.FTPUserGroup,
+            models.FTPPathPermission,
+            get_user_model(),
+        )
+        for sender in senders:
+            post_save.connect(self._invalidate_accounts, sender=sender)
+            post_delete.connect(self._invalidate_accounts, sender=sender)
+        signals.ftp_server_started.connect(self._on_server_started)
+        signals.ftp_server_stopped.connect(self._on_server_stopped)
+
+    def _on_server_started(self, sender, server, **kwargs):
+        if getattr(server.handler, "authorizer", None) is not self:
+            return
+        self._start_background(server)
+        if self.last_login_flush_interval:
+            server.ioloop.call_every(
+                self.last_login_flush_interval,
+                self.run_in_background,
+                self.last_login_buffer.flush,
+            )
+
+    def _on_server_stopped(self, sender, server, **kwargs):
+        if getattr(server.handler, "authorizer", None) is self:
+            self._stop_background()
+            self.last_login_buffer.flush()
+
+    def _start_background(self, server):
+        """run background tasks in the auth worker pool of the handler.
+
+        Without auth workers, a thread of the authorizer runs them.
+        """
+        get_executor = getattr(server.handler, "get_auth_executor", None)
+        executor = get_executor() if get_executor is not None else None
+        self._own_background_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="ftp-authorizer"
+            )
+        self._background_executor = executor
+
+    def _stop_background(self):
+        executor, self._background_executor = self._background_executor, None
+        if executor is not None and self._own_background_executor:
+            executor.submit(connections.close_all)
+            executor.shutdown(wait=True)
+
+    def run_in_background(self, func):
+        """run func in a worker thread while the server runs.
+
+        func is not submitted again while a previous call is pending.
+        Without a running server, func is called right away.
+        """
+        executor = self._background_executor
+        if executor is None:
+            return func()
+        with self._background_lock:
+            future = self._background_tasks.get(func)
+            if future is not None and not future.done():
+                return None
+            try:
+                future = executor.submit(self._run_background_task, func)
+            except RuntimeError:
+                # the executor was shut down
+                return None
+            self._background_tasks[func] = future
+        return None
+
+    def _run_background_task(self, func):
+        try:
+            func()
+        except Exception:
+            logger.exception("FTP authorizer task %r failed.", func)
+
+    def _invalidate_accounts(self, sender, instance, **kwargs):
+        if sender is models.FTPUserGroup:
+
+            def affected(account):
+                return account.group_id == instance.pk
+
+        elif sender is models.FTPPathPermission:
+
+            def affected(account):
+                return account.pk == instance.account_id or (
+                    instance.group_id is not None
+                    and account.group_id == instance.group_id
+                )
+
+        elif sender is self.model:
+
+            def affected(account):
+                return account.pk == instance.pk
+
+        else:
+
+            def affected(account):
+                return account.user_id == instance.pk
+
+        with self._accounts_lock:
+            for username, account in list(self._accounts.items()):
+                if affected(account):
+                    del self._accounts[username]
+                    if self.credential_cache is not None:
+                        self.credential_cache.invalidate(username)
+
+    def _cache_account(self, username, account):
+        with self._accounts_lock:
+            self._accounts[username] = account
+            self._accounts.move_to_end(username)
+            while len(self._accounts) > self.account_cache_size:
+                self._accounts.popitem(last=False)
+
+    def get_session_account(self, username):
+        """return account snapshot loaded at login.
+
+        The snapshot is reloaded when it was dropped by a change of
+        the account, its group or its user.
+        """
+        account = self._accounts.get(username)
+        if account is None:
+            account = self._load_account(username)
+            if account is not None:
+                self._cache_account(username, account)
+        return account
+
+    def _load_account(self, username):
+        """return account with its path permissions compiled.
+
+        With FTPSERVER_CACHE set, the account is taken from the shared
+        cache, so server processes don't all query the same account.
+        Shared accounts carry no password hash.
+        """
+        shared = self.shared_cache
+        if shared is None:
+            return self._query_account(username)
+        return shared.get_or_set(
+            "accounts", username, lambda: self._query_shared_account(username)
+        )
+
+    def _query_shared_account(self, username):
+        account = self._query_account(username)
+        if account is not None:
+            # passwords are checked against the database, keep the hash
+            # out of the cache
+            account.user.set_unusable_password()
+        return account
+
+    @ensure_db_connection
+    def _query_account(self, username):
+        account = self.get_account(username)
+        if account is not None:
+            account.compile_permissions()
+        return account
 
     @ensure_db_connection
     def has_user(self, username):
         """return True if exists user."""
+        if username in self._accounts:
+            return True
         return self.model.objects.filter(**self._filter_user_by(username)).exists()
 
+    def _get_unique(self, queryset, username):
+        """return the only row of queryset, or None.
+
+        FTPUserAccount.username is indexed but not unique, since
+        USERNAME_FIELD of custom user models need not be unique either.
+        A username matching several accounts is refused instead of
+        logging in to one of them.
+        """
+        rows = list(queryset[:2])
+        if len(rows) > 1:
+            logger.error("Several FTP user accounts match username %r.", username)
+            return None
+        return rows[0] if rows else None
+
     @ensure_db_connection
     def get_account(self, username):
         """return user by username."""
-        try:
-            account = self.model.objects.get(**self._filter_user_by(username))
-        except self.model.DoesNotExist:
+        return self._get_unique(
+            self.model.objects.select_related("user", "group").filter(
+                **self._filter_user_by(username)
+            ),
+            username,
+        )
+
+    @ensure_db_connection
+    def get_credentials(self, username):
+        """return (password hash, is_active) of the user, or None.
+
+        Reads only these columns, so a changed password is seen without
+        loading the account.
+        """
+        row = self._get_unique(
+            self.model.objects.filter(**self._filter_user_by(username)).values_list(
+                *self.credential_fields
+            ),
+            username,
+        )
+        if row is None:
             return None
-        return account
+        return row[0], row[1] if len(row) > 1 else True
 
     @ensure_db_connection
     def validate_authentication(self, username, password, handler):
-        """authenticate user with password"""
-        user = authenticate(**{self.username_field: username, "password": password})
-        account = self.get_account(username)
-        if not (user and account):
+        """authenticate user with password
+
+        The account, user and group are fetched with one joined query and
+        the password is checked against that row. After a successful check
+        the path permissions are compiled and the loaded account is kept
+        for get_home_dir, get_msg_login and the permission checks.
+
+        With the credential cache enabled, a repeated login with the same
+        password is accepted from the cache while the account snapshot is
+        still loaded, after checking that the password hash in the
+        database did not change. With FTPSERVER_CACHE set, the account is
+        taken from the shared cache and the password is checked against
+        the hash read by get_credentials().
+        """
+        cache = self.credential_cache
+        if cache is not None and username in self._accounts:
+            credentials = self.get_credentials(username)
+            if (
+                credentials is not None
+                and credentials[1]
+                and cache.check(username, password, credentials[0])
+            ):
+                return
+        shared = self.shared_cache
+        if shared is not None:
+            credentials = self.get_credentials(username)
+        else:
+            account = self.get_account(username)
+            credentials = account and (account.user.password, True)
+        if credentials is None:
+            # run the hasher anyway, like ModelBackend does, so response
+            # time does not reveal which usernames exist.
+            get_user_model()().set_password(password)
             raise AuthenticationFailed("Authentication failed.")
+        if shared is not None:
+            password_hash, is_active = credentials
+            if not (check_password(password, password_hash) and is_active):
+                raise AuthenticationFailed("Authentication failed.")
+            account = self._load_account(username)
+            if account is None:
+                raise AuthenticationFailed("Authentication failed.")
+        else:
+            if not self.check_password(account, password):
+                raise AuthenticationFailed("Authentication failed.")
+            account.compile_permissions()
+        self._cache_account(username, account)
+        if cache is not None:
+            cache.add(username, password, credentials[0])
+
+    def check_password(self, account, password):
+        """return True if password matches the account's user."""
+        user = account.user
+        return user.check_password(password) and getattr(user, "is_active", True)
 
     def get_home_dir(self, username):
-        account = self.get_account(username)
+        account = self.get_session_account(username)
         if not account:
             return ""
         return account.get_home_dir()
 
-    @ensure_db_connection
     def get_msg_login(self, username):
         """message for welcome."""
-        account = self.get_account(username)
+        account = self.get_session_account(username)
         if account:
             account.update_last_login()
-            account.save()
+            self.last_login_buffer.add(account.pk, account.last_login)
+            if not self.last_login_flush_interval:
+                self.last_login_buffer.flush()
         return "welcome."
 
     def get_msg_quit(self, username):
@@ -96,12 +538,12 @@ class FTPAccountAuthorizer(object):
 
     def has_perm(self, username, perm, path=None):
         """check user permission"""
-        account = self.get_account(username)
+        account = self.get_session_account(username)
         return account and account.has_perm(perm, path)
 
     def get_perms(self, username):
         """return user permissions"""
-        account = self.get_account(username)
+        account = self.get_session_account(username)
         return account and account.get_perms()
 
     def impersonate_user(self, username, password):
@@ -113,3 +555,159 @@ class FTPAccountAuthorizer(object):
         """delegate to terminate_impersonation method"""
         if self.personate_user:
             self.personate_user.terminate_impersonation(username)
+
+
+SnapshotEntry = namedtuple(
+    "SnapshotEntry", ["pk", "password", "is_active", "home_dir", "perms", "trie"]
+)
+
+
+class SnapshotAccountAuthorizer(FTPAccountAuthorizer):
+    """Authorizer answering from an in-memory snapshot of all accounts.
+
+    Every FTP user account is loaded with its user, group and path
+    permissions when the authorizer is created. has_user,
+    validate_authentication, get_home_dir, has_perm and get_perms are
+    answered from the snapshot without touching the database, so logins
+    keep working while the database is slow or briefly unavailable.
+
+    Every ``FTPSERVER_SNAPSHOT_REFRESH_INTERVAL`` seconds while the
+    server runs, the auth worker pool (see run_in_background()) reads
+    FTPAccountVersion and reloads the snapshot only if the version
+    changed. Changes in this process reload it right away. The new
+    snapshot replaces the old one when it is complete; a failed reload
+    keeps the previous snapshot.
+    """
+
+    def __init__(self, file_access_user=None):
+        super(SnapshotAccountAuthorizer, self).__init__(file_access_user)
+        self.refresh_interval = get_ftp_setting("FTPSERVER_SNAPSHOT_REFRESH_INTERVAL")
+        self._table = {}
+        self._version = None
+        self.refresh()
+
+    @ensure_db_connection
+    def load_table(self):
+        """return {username: SnapshotEntry} for all accounts."""
+        group_rules = defaultdict(list)
+        account_rules = defaultdict(list)
+        for rule in models.FTPPathPermission.objects.all():
+            if rule.account_id is not None:
+                account_rules[rule.account_id].append(rule)
+            else:
+                group_rules[rule.group_id].append(rule)
+        table = {}
+        duplicates = set()
+        for account in self.model.objects.select_related("user", "group"):
+            user = account.user
+            username = getattr(user, self.username_field)
+            if username in table:
+                duplicates.add(username)
+            rules = group_rules[account.group_id] + account_rules[account.pk]
+            table[username] = SnapshotEntry(
+                pk=account.pk,
+                password=user.password,
+                is_active=getattr(user, "is_active", True),
+                home_dir=account.get_home_dir(),
+                perms=account.get_perms(),
+                trie=account.compile_permissions(rules),
+            )
+        for username in duplicates:
+            logger.error("Several FTP user accounts match username %r.", username)
+            del table[username]
+        return table
+
+    @ensure_db_connection
+    def load_version(self):
+        """return the version of the accounts, see FTPAccountVersion."""
+        return models.FTPAccountVersion.get_version()
+
+    def refresh(self):
+        """reload the snapshot, return False if the database failed."""
+        try:
+            # read before the table, so a change made while loading is
+            # picked up by the next poll
+            version = self.load_version()
+            table = self.load_table()
+        except DatabaseError:
+            logger.exception("Failed to load FTP user accounts.")
+            return False
+        self._table = table
+        self._version = version
+        return True
+
+    def refresh_if_changed(self):
+        """reload the snapshot if the accounts changed since the last load."""
+        try:
+            version = self.load_version()
+        except DatabaseError:
+            logger.exception("Failed to load FTP user accounts.")
+            return False
+        if version == self._version:
+            return True
+        return self.refresh()
+
+    def _on_server_started(self, sender, server, **kwargs):
+        super(SnapshotAccountAuthorizer, self)._on_server_started(
+            sender, server, **kwargs
+        )
+        if getattr(server.handler, "authorizer", None) is not self:
+            return
+        if self.refresh_interval:
+            server.ioloop.call_every(
+                self.refresh_interval,
+                self.run_in_background,
+                self.refresh_if_changed,
+            )
+
+    def _invalidate_accounts(self, sender, instance, **kwargs):
+        self.run_in_background(self.refresh)
+
+    def has_user(self, username):
+        """return True if exists user."""
+        return username in self._table
+
+    def validate_authentication(self, username, password, handler):
+        """authenticate user with password against the snapshot"""
+        entry = self._table.get(username)
+        if entry is None:
+            get_user_model()().set_password(password)
+            raise AuthenticationFailed("Authentication failed.")
+        cache = self.credential_cache
+        if (
+            cache is not None
+            and entry.is_active
+            and cache.check(username, password, entry.password)
+        ):
+            return
+        # run the hasher for inactive users too, so they are not answered
+        # faster than a wrong password
+        if not (check_password(password, entry.password) and entry.is_active):
+            raise AuthenticationFailed("Authentication failed.")
+        if cache is not None:
+            cache.add(username, password, entry.password)
+
+    def get_home_dir(self, username):
+        entry = self._table.get(username)
+        if entry is None:
+            return ""
+        return entry.home_dir
+
+    def get_msg_login(self, username):
+        """message for welcome."""
+        entry = self._table.get(username)
+        if entry is not None:
+            self.last_login_buffer.add(entry.pk, timezone.now())
+            if not self.last_login_flush_interval:
+                self.last_login_buffer.flush()
+        return "welcome."
+
+    def has_perm(self, username, perm, path=None):
+        """check user permission"""
+        entry = self._table.get(username)
+        return entry is not None and entry.trie.has_perm(perm, path)
+
+    def get_perms(self, username):
+        """return user permissions"""
+        entry = self._table.get(username)
+        return entry and entry.perms
@@ -0,0 +1,186 @@
+"""
+Shared cache.
+
+SharedCache keeps account snapshots, path metadata and directory listings
+in a Django cache, selected with the ``FTPSERVER_CACHE`` setting, so that
+several FTP server processes share warm caches. Keys carry a version per
+namespace, so all keys of a namespace are invalidated at once by bumping
+its version.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+
+from .utils import get_ftp_setting
+
+MISSING = object()
+LOADING = object()
+
+
+class SharedCache:
+    """Versioned, coalescing layer over a Django cache alias.
+
+    Values are stored under ``namespace`` and a key, which can be any value
+    with a stable repr(). invalidate() bumps the version of a namespace,
+    which makes all of its keys unreachable; the old values expire with
+    ``timeout``.
+
+    get_or_set() and fetch() coalesce loads: when a key is missing, the
+    first caller takes a lock key and loads the value, other callers, in
+    this or another process, wait up to ``lock_timeout`` seconds for it
+    instead of loading it as well. Callers in the IOLoop pass
+    ``wait=False`` and load the value themselves instead of waiting.
+    """
+
+    key_prefix = "ftpserver"
+    poll_interval = 0.05
+
+    def __init__(self, alias, timeout=60, lock_timeout=10):
+        self.alias = alias
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidated = 0
+
+    def _version_key(self, namespace):
+        return "{0}:version:{1}".format(self.key_prefix, namespace)
+
+    def get_version(self, namespace):
+        """return the current version of namespace."""
+        version_key = self._version_key(namespace)
+        version = self.cache.get(version_key)
+        if version is None:
+            # start from the clock, so a version that was evicted from the
+            # cache does not make old values reachable again
+            self.cache.add(version_key, int(time.time() * 1000), None)
+            version = self.cache.get(version_key)
+        return version
+
+    def make_key(self, namespace, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return "{0}:{1}:{2}:{3}".format(
+            self.key_prefix, namespace, self.get_version(namespace), digest
+        )
+
+    def get(self, namespace, key, default=None):
+        value = self.cache.get(self.make_key(namespace, key), MISSING)
+        if value is MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, namespace, key, value):
+        """store value and release the load lock of key."""
+        cache_key = self.make_key(namespace, key)
+        self.cache.set(cache_key, value, self.timeout)
+        self.cache.delete(cache_key + ":lock")
+
+    def delete(self, namespace, key):
+        self.cache.delete(self.make_key(namespace, key))
+
+    def invalidate(self, namespace):
+        """invalidate all keys of namespace."""
+        self.invalidated += 1
+        version_key = self._version_key(namespace)
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            self.get_version(namespace)
+            self.cache.incr(version_key)
+
+    def fetch(self, namespace, key, wait=True):
+        """return the value of key, or MISSING if the caller should load it.
+
+        A caller that gets MISSING must call set() or release() when done.
+        Without wait, LOADING is returned while another caller loads the
+        value; the caller loads it as well, without storing it.
+        """
+        cache_key = self.make_key(namespace, key)
+        value = self.cache.get(cache_key, MISSING)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        lock_key = cache_key + ":lock"
+        if self.cache.add(lock_key, 1, self.lock_timeout):
+            return MISSING
+        if not wait:
+            return LOADING
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = self.cache.get(cache_key, MISSING)
+            if value is not MISSING:
+                self.coalesced += 1
+                return value
+            if self.cache.add(lock_key, 1, self.lock_timeout):
+                # the other loader gave up
+                return MISSING
+        return MISSING
+
+    def release(self, namespace, key):
+        """release the load lock of key without storing a value."""
+        self.cache.delete(self.make_key(namespace, key) + ":lock")
+
+    def get_or_set(self, namespace, key, load, wait=True):
+        """return the value of key, calling load() once to fill it."""
+        value = self.fetch(namespace, key, wait=wait)
+        if value is LOADING:
+            return load()
+        if value is MISSING:
+            try:
+                value = load()
+            except BaseException:
+                self.release(namespace, key)
+                raise
+            self.set(namespace, key, value)
+        return value
+
+    def get_stats(self):
+        """return counters for monitoring."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidated": self.invalidated,
+        }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """return the SharedCache of FTPSERVER_CACHE, or None if not set."""
+    global _shared_cache
+    alias = get_ftp_setting("FTPSERVER_CACHE")
+    if not alias:
+        return None
+    timeout = get_ftp_setting("FTPSERVER_CACHE_TIMEOUT")
+    shared = _shared_cache
+    if shared is None or (shared.alias, shared.timeout) != (alias, timeout):
+        with _shared_cache_lock:
+            shared = _shared_cache
+            if shared is None or (shared.alias, shared.timeout) != (alias, timeout):
+                shared = _shared_cache = SharedCache(alias, timeout=timeout)
+    return shared
+
+
+def invalidate_accounts(sender, update_fields=None, **kwargs):
+    """invalidate shared account snapshots when related rows change.
+
+    Connected in every process that loads django_ftpserver.models, so
+    changes made in the Django admin reach all FTP server processes.
+    """
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.invalidate("accounts")
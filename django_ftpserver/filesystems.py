@@ -1,11 +1,26 @@
+import errno
+import functools
+import io
 import logging
+import mimetypes
+import threading
 import time
 import os
-from collections import namedtuple
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 from pyftpdlib.filesystems import AbstractedFS
 
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.files.storage import storages
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+from . import models, signals
+from .cache import LOADING, MISSING, get_shared_cache
+from .resilience import discard_file, get_storage_guard
+from .utils import get_ftp_setting
+from .watchers import InotifyWatcher
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +39,1000 @@ PseudoStat = namedtuple(
 )
 
 
+class ListingCache:
+    """Process-wide LRU cache of directory listings and path metadata.
+
+    Values are shared by all StorageFS instances (FTP sessions) of the
+    process and expire after ``timeout`` seconds. The cache holds at most
+    ``max_size`` items, where a listing counts one item per entry; least
+    recently used values are evicted first.
+    """
+
+    def __init__(self, timeout, max_size=100000):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.invalidated = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """return the cached value of key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, weight=1):
+        """cache value for key, unless it is larger than the cache."""
+        if weight > self.max_size:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + self.timeout, weight, value)
+            self._size += weight
+            while self._size > self.max_size:
+                self._size -= self._entries.popitem(last=False)[1][1]
+                self.evicted += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._pop(key):
+                self.invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+        return entry
+
+    def get_stats(self):
+        """return counters for monitoring."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+            "entries": len(self._entries),
+            "size": self._size,
+        }
+
+
+class _Flight:
+    __slots__ = ("thread", "done", "result", "error", "shared")
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = True
+
+
+class SingleFlight:
+    """Share one backend call between concurrent callers with the same key.
+
+    The first caller of a key runs the call; callers arriving while it is
+    in flight wait up to ``timeout`` seconds and receive its result or
+    exception. A caller in the thread of the running call, e.g. another
+    session served by the same IOLoop while a listing is streamed, makes
+    its own call instead of waiting for itself.
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.calls = 0
+        self.shared = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """return (flight, leader); the leader must call finish()."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                return flight, True
+        return flight, False
+
+    def finish(self, key, flight, result=None, error=None, shared=True):
+        """publish the result of the leader's call to waiting callers."""
+        flight.result = result
+        flight.error = error
+        flight.shared = shared
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def wait(self, flight):
+        """return True if flight finished with a result to share."""
+        if flight.thread == threading.get_ident():
+            return False
+        if not flight.done.wait(self.timeout) or not flight.shared:
+            return False
+        with self._lock:
+            self.shared += 1
+        return True
+
+    def do(self, key, func):
+        """return func(), sharing the call with concurrent callers of key."""
+        flight, leader = self.join(key)
+        if not leader:
+            if self.wait(flight):
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result
+            return func()
+        try:
+            result = func()
+        except Exception as exc:
+            self.finish(key, flight, error=exc)
+            raise
+        except BaseException:
+            self.finish(key, flight, shared=False)
+            raise
+        self.finish(key, flight, result=result)
+        return result
+
+    def get_stats(self):
+        """return counters for monitoring."""
+        return {"calls": self.calls, "shared": self.shared}
+
+
+def file_metadata(size, mtime):
+    """return metadata values of a file for StorageFS.seed_metadata."""
+    return {
+        "_exists": True,
+        "isdir": False,
+        "getsize": size,
+        "getmtime": mtime,
+    }
+
+
+def directory_metadata():
+    """return metadata values of an object store prefix."""
+    return {"_exists": True, "isdir": True, "getsize": 0, "getmtime": 0}
+
+
+def is_local_file(file):
+    """return True if file reads a file on the local disk.
+
+    Django File objects are unwrapped. Files of remote storages, like the
+    spooled temporary file of S3File, are not local files.
+    """
+    file = getattr(file, "file", file)
+    return isinstance(getattr(file, "raw", file), io.FileIO)
+
+
+def _storage_prefix(storage, path):
+    """return the object name prefix of the directory path."""
+    prefix = storage._normalize_name("" if path == "/" else path)
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return prefix
+
+
+def _list_blobs(bucket, prefix):
+    """list a GCS "directory" with list_blobs, one page at a time."""
+    iterator = bucket.list_blobs(prefix=prefix, delimiter="/")
+    for page in iterator.pages:
+        for name in page.prefixes:
+            if name[len(prefix) :]:
+                yield name[len(prefix) :], directory_metadata()
+        for blob in page:
+            name = blob.name[len(prefix) :]
+            if name:
+                yield name, file_metadata(blob.size, blob.updated.timestamp())
+
+
+class MultipartUploadWriter:
+    """File object that streams a new file to object storage.
+
+    Written data is cut into parts of ``part_size`` bytes. Each part is
+    uploaded by a thread pool as soon as it is full, up to
+    ``concurrency`` parts at the same time. Memory use per upload is
+    therefore limited to about ``part_size * (concurrency + 1)`` bytes,
+    nothing is written to local disk, and only the last part and the
+    completion are left to do when the file is closed. Files smaller than
+    one part are uploaded with a single request.
+
+    write() waits while ``concurrency`` parts are in flight; ready() tells
+    if it would, the data channels of DjangoFTPHandler stop reading until
+    it returns True. All backend calls are made by the thread pool, and
+    close_async() returns a Future instead of waiting for them.
+
+    Backend calls are made through ``guard`` (a StorageGuard) when given;
+    part uploads are retried. Errors are raised from write() and close()
+    as OSError, the upload is then aborted.
+
+    When the writer is ``resumable`` and gets a ``state`` (an unsaved or
+    stored FTPUpload), the upload can be continued later: the state is
+    saved once the upload is started, and discard() keeps the parts
+    uploaded so far in it instead of aborting the upload. A writer created
+    with a stored state continues that upload, see seek().
+
+    Subclasses implement start_upload(), upload_part(), complete_upload(),
+    abort_upload() and put_object().
+    """
+
+    mode = "wb"
+    # True if the backend keeps uploaded parts until the upload is completed
+    resumable = False
+    # threads uploading parts, shared by all uploads
+    upload_workers = 16
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(
+        self, name, part_size=8 * 1024 * 1024, concurrency=4, guard=None, state=None
+    ):
+        self.name = name
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.guard = guard
+        self.state = state if self.resumable else None
+        self.upload_id = None
+        self.closed = False
+        self._buffer = bytearray()
+        self._parts = []
+        self._sizes = []
+        # parts being uploaded, guarded by _slots
+        self._in_flight = 0
+        self._slots = threading.Condition()
+        self._started = False
+        # future of start_upload()
+        self._start = None
+        self._error = None
+        # resumed and nothing written yet
+        self._resumed = False
+        if self.state is not None and self.state.upload_id:
+            self.upload_id = self.state.upload_id
+            for result, size in self.state.parts:
+                future = Future()
+                future.set_result(result)
+                self._parts.append(future)
+                self._sizes.append(size)
+            self._start = Future()
+            self._start.set_result(None)
+            self._started = self._resumed = True
+
+    @classmethod
+    def get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.upload_workers, thread_name_prefix="ftp-upload"
+                )
+        return cls._executor
+
+    def writable(self):
+        return True
+
+    def ready(self):
+        """return False while write() would wait for a part upload."""
+        with self._slots:
+            return self._can_submit()
+
+    def seekable(self):
+        return self.state is not None and self.state.pk is not None
+
+    def tell(self):
+        return sum(self._sizes) + len(self._buffer)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """continue a resumed upload at offset.
+
+        Only the end of a stored part can be continued, the parts after it
+        are replaced by the data written next.
+        """
+        if whence != os.SEEK_SET or self._buffer or not self.seekable():
+            raise OSError(errno.ESPIPE, "Illegal seek")
+        ends = [0]
+        for size in self._sizes:
+            ends.append(ends[-1] + size)
+        if offset not in ends:
+            raise OSError(
+                errno.EINVAL,
+                "Can't resume at {}, the upload can be resumed at {}".format(
+                    offset, ends[-1]
+                ),
+            )
+        count = ends.index(offset)
+        del self._parts[count:]
+        del self._sizes[count:]
+        return offset
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self._check()
+        self._resumed = False
+        self._buffer += data
+        part_size = self.part_size
+        while len(self._buffer) >= part_size:
+            with memoryview(self._buffer) as view:
+                part = bytes(view[:part_size])
+            del self._buffer[:part_size]
+            self._submit(part)
+        return len(data)
+
+    def close(self):
+        """upload the rest and complete the upload.
+
+        A resumed upload nothing was written to is kept to be resumed
+        again, e.g. when the transfer didn't start; finish() completes it.
+        """
+        self.close_async().result()
+
+    def close_async(self):
+        """like close(), but return a Future instead of waiting.
+
+        The Future is done once the file is stored; its exception is the
+        OSError close() raises.
+        """
+        stored = Future()
+        if self.closed:
+            stored.set_result(None)
+            return stored
+        if self._resumed:
+            self.discard()
+            stored.set_result(None)
+            return stored
+        self.closed = True
+        data, self._buffer = bytes(self._buffer), bytearray()
+        try:
+            if self._started and not self._parts and not data:
+                # a resumed upload without parts, store an empty file
+                self._abort()
+            if not self._started:
+                return self.get_executor().submit(self._store, None, data)
+            if data:
+                self._submit(data, wait=False)
+            parts = list(self._parts)
+            return self._after([self._start] + parts, self._store, parts, None)
+        except Exception as err:
+            self._abort()
+            stored.set_exception(self._upload_error(err))
+            return stored
+
+    def finish(self):
+        """complete the upload, also when nothing was written to it."""
+        self._resumed = False
+        self.close()
+
+    def finish_async(self):
+        """like finish(), but return a Future like close_async()."""
+        self._resumed = False
+        return self.close_async()
+
+    def discard(self):
+        """close the file without storing it.
+
+        A started upload with a state is kept to be resumed, others are
+        aborted.
+        """
+        if not self.closed:
+            self.closed = True
+            self._buffer = bytearray()
+            if self.state is not None and self._started and self._error is None:
+                self._suspend()
+            else:
+                self._abort()
+
+    def abort(self):
+        """abort the upload now and delete its state, e.g. when it expired."""
+        self.closed = True
+        self._buffer = bytearray()
+        self._started = False
+        parts, self._parts = self._parts, []
+        for future in parts:
+            future.cancel()
+        wait(parts if self._start is None else [self._start] + parts)
+        if self.upload_id is not None:
+            self._call("abort_upload", self.abort_upload)
+        self._delete_state()
+
+    def _call(self, operation, func, *args, idempotent=False):
+        if self.guard is None:
+            return func(*args)
+        return self.guard.call(operation, func, *args, idempotent=idempotent)
+
+    def _check(self):
+        if self._error is not None:
+            self.closed = True
+            self._abort()
+            raise OSError(
+                errno.EIO, "Upload failed: {}".format(self._error)
+            ) from self._error
+
+    def _upload_error(self, err):
+        if isinstance(err, OSError):
+            return err
+        error = OSError(errno.EIO, "Upload failed: {}".format(err))
+        error.__cause__ = err
+        return error
+
+    def _can_submit(self):
+        return self._error is not None or self._in_flight < self.concurrency
+
+    def _after(self, futures, func, *args):
+        """run func(*args) in the executor once all futures are done.
+
+        Waiting for them in the executor could block the parts queued
+        there. Return a Future of the result.
+        """
+        result = Future()
+        remaining = [len(futures) + 1]
+        lock = threading.Lock()
+
+        def run():
+            if not result.set_running_or_notify_cancel():
+                return
+            try:
+                result.set_result(func(*args))
+            except BaseException as err:
+                result.set_exception(err)
+
+        def done(future=None):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.get_executor().submit(run)
+
+        for future in futures:
+            future.add_done_callback(done)
+        done()
+        return result
+
+    def _submit(self, data, wait=True):
+        if not self._started:
+            self._started = True
+            self._start = self.get_executor().submit(self._start_upload)
+        if wait:
+            with self._slots:
+                self._slots.wait_for(self._can_submit)
+        self._check()
+        with self._slots:
+            free = self._in_flight < self.concurrency
+            self._in_flight += 1
+        number = len(self._parts) + 1
+        if free:
+            part = self.get_executor().submit(self._upload, number, data)
+        else:
+            # the last part, uploaded after the parts in flight to keep the
+            # order for concurrency=1
+            part = self._after(list(self._parts), self._upload, number, data)
+        self._parts.append(part)
+        self._sizes.append(len(data))
+
+    def _start_upload(self):
+        try:
+            self._call("start_upload", self.start_upload)
+        except BaseException as err:
+            self._error = err
+            raise
+        state = self.state
+        if state is None:
+            return
+        state.upload_id = self.upload_id
+        state.parts = []
+        state.size = 0
+        try:
+            state.save()
+        except Exception:
+            logger.warning(
+                "Failed to save upload state of %s.", self.name, exc_info=True
+            )
+            self.state = None
+        finally:
+            close_old_connections()
+
+    def _upload(self, number, data):
+        try:
+            # queued before the parts, so it's running or done
+            self._start.result()
+            return self._call(
+                "upload_part", self.upload_part, number, data, idempotent=True
+            )
+        except BaseException as err:
+            self._error = err
+            raise
+        finally:
+            with self._slots:
+                self._in_flight -= 1
+                self._slots.notify_all()
+
+    def _store(self, parts, data):
+        """complete the upload of parts, or put data without parts."""
+        try:
+            if parts is None:
+                self._call("put_object", self.put_object, data, idempotent=True)
+            else:
+                results = [future.result() for future in parts]
+                self._call("complete_upload", self.complete_upload, results)
+        except Exception as err:
+            self._abort()
+            raise self._upload_error(err)
+        else:
+            self._delete_state()
+        finally:
+            if self.state is not None:
+                close_old_connections()
+
+    def _abort(self):
+        if not self._started:
+            return
+        self._started = False
+        parts, self._parts = self._parts, []
+        for future in parts:
+            future.cancel()
+        # parts still in flight would be stored after the abort
+        self._after([self._start] + parts, self._abort_upload)
+
+    def _abort_upload(self):
+        try:
+            if self._start.exception() is not None:
+                # nothing to abort
+                return
+            self._call("abort_upload", self.abort_upload)
+        except Exception:
+            logger.warning("Failed to abort upload of %s.", self.name, exc_info=True)
+        else:
+            self._delete_state()
+        finally:
+            if self.state is not None:
+                close_old_connections()
+
+    def _suspend(self):
+        parts, self._parts = self._parts, []
+        self._after([self._start] + parts, self._save_parts, parts, self._sizes)
+
+    def _save_parts(self, parts, sizes):
+        """store the parts uploaded without a gap in the state."""
+        state = self.state
+        if state is None or self._start.exception() is not None:
+            # the state wasn't saved
+            return
+        stored = []
+        for future, size in zip(parts, sizes):
+            if future.cancelled() or future.exception() is not None:
+                break
+            stored.append([future.result(), size])
+        state.parts = stored
+        state.size = sum(size for result, size in stored)
+        try:
+            state.save()
+        except Exception:
+            logger.warning(
+                "Failed to save upload state of %s.", self.name, exc_info=True
+            )
+        finally:
+            close_old_connections()
+
+    def _delete_state(self):
+        state = self.state
+        if state is None or state.pk is None:
+            return
+        try:
+            state.delete()
+        except Exception:
+            logger.warning(
+                "Failed to delete upload state of %s.", self.name, exc_info=True
+            )
+
+    def start_upload(self):
+        raise NotImplementedError
+
+    def upload_part(self, number, data):
+        """upload part number (from 1), return what complete_upload needs."""
+        raise NotImplementedError
+
+    def complete_upload(self, parts):
+        raise NotImplementedError
+
+    def abort_upload(self):
+        raise NotImplementedError
+
+    def put_object(self, data):
+        """store a file smaller than part_size."""
+        raise NotImplementedError
+
+
+class S3MultipartUploadWriter(MultipartUploadWriter):
+    """MultipartUploadWriter for S3Boto3Storage(provided by django-storages).
+
+    Objects get the parameters (content type, ACL, ...) S3Boto3Storage
+    would use. At most 10000 parts are allowed, so ``part_size`` limits
+    the size of a file to 10000 times the part size. Uploaded parts are
+    kept by S3 until the upload is completed or aborted, so uploads are
+    resumable.
+    """
+
+    resumable = True
+
+    def __init__(self, storage, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self.client = storage.connection.meta.client
+        self.bucket_name = storage.bucket_name
+        self.key = storage._normalize_name(name.lstrip("/"))
+        if hasattr(storage, "_get_write_parameters"):
+            self.parameters = storage._get_write_parameters(self.key)
+        else:
+            self.parameters = storage.get_object_parameters(self.key)
+
+    def start_upload(self):
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key, **self.parameters
+        )
+        self.upload_id = response["UploadId"]
+
+    def upload_part(self, number, data):
+        response = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=data,
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def complete_upload(self, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort_upload(self):
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id
+            )
+        except Exception as err:
+            # botocore ClientError, matched without importing botocore
+            response = getattr(err, "response", None)
+            if not isinstance(response, dict):
+                raise
+            if response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+            # already aborted, e.g. by a lifecycle rule of the bucket
+
+    def put_object(self, data):
+        self.client.put_object(
+            Bucket=self.bucket_name, Key=self.key, Body=data, **self.parameters
+        )
+
+
+class GoogleCloudUploadWriter(MultipartUploadWriter):
+    """MultipartUploadWriter for GoogleCloudStorage(provided by django-storages).
+
+    Parts are sent to a resumable upload, which accepts them only in
+    order, so one part is uploaded at a time. ``part_size`` must be a
+    multiple of 256 KiB.
+    """
+
+    def __init__(self, storage, name, **kwargs):
+        kwargs["concurrency"] = 1
+        super().__init__(name, **kwargs)
+        self.blob = storage.bucket.blob(storage._normalize_name(name.lstrip("/")))
+        self.content_type = mimetypes.guess_type(name)[0]
+        self.writer = None
+
+    def start_upload(self):
+        self.writer = self.blob.open(
+            "wb", chunk_size=self.part_size, content_type=self.content_type
+        )
+
+    def upload_part(self, number, data):
+        self.writer.write(data)
+
+    def complete_upload(self, parts):
+        self.writer.close()
+
+    def abort_upload(self):
+        # an unfinished resumable upload is discarded by GCS after a week
+        self.writer = None
+
+    def put_object(self, data):
+        self.blob.upload_from_string(data, content_type=self.content_type)
+
+
+class RangedDownloadReader:
+    """File object that streams a file from object storage.
+
+    The file is fetched with ranged requests of ``chunk_size`` bytes by a
+    thread pool, up to ``read_ahead`` ranges ahead of the range being
+    read, so the next ranges are downloaded while the current one is
+    sent. Memory use per download is therefore limited to about
+    ``chunk_size * (read_ahead + 1)`` bytes. start() fetches a first range
+    of at most ``first_chunk_size`` bytes from the given offset, which
+    also tells the size of the file, so that sending starts early and a
+    resumed download costs a single request before sending.
+
+    read() waits while the next range is downloading; ready() tells if it
+    would, the data channels of DjangoFTPHandler stop sending until it
+    returns True. Backend calls are made through ``guard`` (a
+    StorageGuard) when given and are retried. Errors are raised from
+    read() as OSError.
+
+    Subclasses implement read_range().
+    """
+
+    mode = "rb"
+    first_chunk_size = 256 * 1024
+    # threads downloading ranges, shared by all downloads
+    download_workers = 32
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, name, chunk_size=1024 * 1024, read_ahead=2, guard=None):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.read_ahead = max(read_ahead, 1)
+        self.guard = guard
+        self.closed = False
+        self.size = None
+        self._chunk = b""
+        # offset of _chunk in the file and read position in _chunk
+        self._chunk_start = 0
+        self._pos = 0
+        # offset of the next range to fetch
+        self._next = 0
+        self._pending = deque()
+
+    @classmethod
+    def get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.download_workers, thread_name_prefix="ftp-download"
+                )
+        return cls._executor
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def start(self, offset=0):
+        """fetch the first range from offset and start reading ahead."""
+        end = offset + min(self.first_chunk_size, self.chunk_size) - 1
+        self._chunk, self.size = self._call(
+            "read_range", self.read_range, offset, end, idempotent=True
+        )
+        self._chunk_start = self._next = offset
+        self._pos = 0
+        self._next += len(self._chunk)
+        self._fill()
+
+    def ready(self):
+        """return True if read() returns without waiting for a range."""
+        return (
+            self.closed
+            or self._pos < len(self._chunk)
+            or not self._pending
+            or self._pending[0].done()
+        )
+
+    def read(self, size=-1):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        remaining = None if size is None or size < 0 else size
+        parts = []
+        while remaining != 0:
+            if self._pos >= len(self._chunk) and not self._next_chunk():
+                break
+            end = len(self._chunk)
+            if remaining is not None:
+                end = min(end, self._pos + remaining)
+                remaining -= end - self._pos
+            parts.append(self._chunk[self._pos : end])
+            self._pos = end
+        return b"".join(parts)
+
+    def tell(self):
+        return self._chunk_start + self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += self.size
+        elif whence != os.SEEK_SET:
+            raise ValueError("invalid whence ({}, should be 0, 1 or 2)".format(whence))
+        if offset < 0:
+            raise ValueError("negative seek position {}".format(offset))
+        if self._chunk_start <= offset <= self._chunk_start + len(self._chunk):
+            self._pos = offset - self._chunk_start
+        else:
+            self._cancel()
+            self._chunk, self._chunk_start, self._pos = b"", offset, 0
+            self._next = offset
+            self._fill()
+        return offset
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._chunk = b""
+            self._cancel()
+
+    def _call(self, operation, func, *args, idempotent=False):
+        if self.guard is None:
+            return func(*args)
+        return self.guard.call(operation, func, *args, idempotent=idempotent)
+
+    def _fill(self):
+        while len(self._pending) < self.read_ahead and self._next < self.size:
+            start = self._next
+            self._next = min(start + self.chunk_size, self.size)
+            self._pending.append(
+                self.get_executor().submit(self._fetch, start, self._next - 1)
+            )
+
+    def _fetch(self, start, end):
+        data, size = self._call(
+            "read_range", self.read_range, start, end, idempotent=True
+        )
+        return start, data
+
+    def _next_chunk(self):
+        if not self._pending:
+            return False
+        future = self._pending.popleft()
+        try:
+            self._chunk_start, self._chunk = future.result()
+        except Exception as err:
+            self.close()
+            if isinstance(err, OSError):
+                raise
+            raise OSError(errno.EIO, "Download failed: {}".format(err)) from err
+        self._pos = 0
+        self._fill()
+        return bool(self._chunk)
+
+    def _cancel(self):
+        pending, self._pending = self._pending, deque()
+        for future in pending:
+            future.cancel()
+
+    def read_range(self, start, end):
+        """return the bytes from start to end (inclusive) and the file size.
+
+        Return no bytes if start is at or after the end of the file, raise
+        FileNotFoundError if the file doesn't exist.
+        """
+        raise NotImplementedError
+
+
+class S3RangedDownloadReader(RangedDownloadReader):
+    """RangedDownloadReader for S3Boto3Storage(provided by django-storages).
+
+    Ranges after the first are requested with the ETag of the first one,
+    so a file replaced during the download fails the transfer instead of
+    mixing both versions.
+    """
+
+    def __init__(self, storage, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self.client = storage.connection.meta.client
+        self.bucket_name = storage.bucket_name
+        self.key = storage._normalize_name(name.lstrip("/"))
+        self.etag = None
+
+    def read_range(self, start, end):
+        params = {
+            "Bucket": self.bucket_name,
+            "Key": self.key,
+            "Range": "bytes={}-{}".format(start, end),
+        }
+        if self.etag is not None:
+            params["IfMatch"] = self.etag
+        try:
+            response = self.client.get_object(**params)
+        except Exception as err:
+            # botocore ClientError, matched without importing botocore
+            response = getattr(err, "response", None)
+            if not isinstance(response, dict):
+                raise
+            code = response.get("Error", {}).get("Code")
+            if code in ("NoSuchKey", "404"):
+                raise FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), self.name
+                ) from err
+            if code == "InvalidRange":
+                # start is at or after the end of the file
+                return b"", self._get_size(response)
+            raise
+        body = response["Body"]
+        try:
+            data = body.read(end - start + 1)
+        finally:
+            body.close()
+        if self.etag is None:
+            self.etag = response.get("ETag")
+        content_range = response.get("ContentRange")
+        if content_range:
+            size = int(content_range.rsplit("/", 1)[1])
+        else:
+            size = response["ContentLength"]
+        return data, size
+
+    def _get_size(self, response):
+        content_range = (
+            response.get("ResponseMetadata", {})
+            .get("HTTPHeaders", {})
+            .get("content-range", "")
+        )
+        if content_range.startswith("bytes */"):
+            return int(content_range[len("bytes */") :])
+        head = self.client.head_object(Bucket=self.bucket_name, Key=self.key)
+        return head["ContentLength"]
+
+
+class GoogleCloudDownloadReader(RangedDownloadReader):
+    """RangedDownloadReader for GoogleCloudStorage(provided by django-storages).
+
+    Ranges are requested for the generation of the file found by the
+    first one, so a file replaced during the download fails the transfer
+    instead of mixing both versions.
+    """
+
+    def __init__(self, storage, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self.bucket = storage.bucket
+        self.key = storage._normalize_name(name.lstrip("/"))
+        self.blob = None
+
+    def read_range(self, start, end):
+        if self.blob is None:
+            blob = self.bucket.get_blob(self.key)
+            if blob is None:
+                raise FileNotFoundError(
+                    errno.ENOENT, os.strerror(errno.ENOENT), self.name
+                )
+            self.blob = blob
+        size = self.blob.size
+        if start >= size:
+            return b"", size
+        data = self.blob.download_as_bytes(
+            start=start,
+            end=min(end, size - 1),
+            if_generation_match=self.blob.generation,
+        )
+        return data, size
+
+
 class StoragePatch:
     """Base class for patches to StorageFS."""
 
     patch_methods = ()
+    # MultipartUploadWriter subclass returned by open_upload()
+    upload_writer_class = None
 
     @classmethod
     def apply(cls, fs):
@@ -47,11 +1052,28 @@ class FileSystemStoragePatch(StoragePatch):
     """StoragePatch for Django's FileSystemStorage."""
 
     patch_methods = (
+        "open",
         "mkdir",
         "rmdir",
         "stat",
+        "lstat",
+        "listdir_with_stats",
+        "change_token",
     )
 
+    def open(self, filename, mode, offset=0):
+        """open files for reading as OS files, which sendfile() can send."""
+        if mode != "rb":
+            return self._origin_open(filename, mode, offset)
+        file = io.open(self.storage.path(os.path.join(self._cwd, filename)), "rb")
+        if offset:
+            try:
+                file.seek(offset)
+            except BaseException:
+                file.close()
+                raise
+        return file
+
     def mkdir(self, path):
         os.mkdir(self.storage.path(path))
 
@@ -61,6 +1083,40 @@ class FileSystemStoragePatch(StoragePatch):
     def stat(self, path):
         return os.stat(self.storage.path(path))
 
+    # links are followed, like StorageFS does for all storages
+    lstat = stat
+
+    def listdir_with_stats(self, path):
+        """list with os.scandir, reusing the stat result of each entry."""
+        with os.scandir(self.storage.path("" if path == "/" else path)) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    # e.g. broken symlink, listed as a file like storage.listdir
+                    yield entry.name, None
+                    continue
+                if entry.is_dir():
+                    values = {"_exists": True, "isdir": True, "getsize": 0}
+                    name = entry.name + "/"
+                else:
+                    values = file_metadata(st.st_size, st.st_mtime)
+                    name = entry.name
+                values["getmtime"] = st.st_mtime
+                # format_list() uses lstat(), format_mlsx() stat()
+                values["stat"] = values["lstat"] = st
+                yield name, values
+
+    def change_token(self, path):
+        """return the inotify change counter of directory path."""
+        watcher = self.watcher
+        if watcher is None:
+            return None
+        try:
+            return watcher.version(self.storage.path("" if path == "/" else path))
+        except SuspiciousFileOperation:
+            return None
+
 
 class S3Boto3StoragePatch(StoragePatch):
     """StoragePatch for S3Boto3Storage(provided by django-storages)."""
@@ -69,7 +1125,12 @@ class S3Boto3StoragePatch(StoragePatch):
         "_exists",
         "isdir",
         "getmtime",
+        "load_metadata",
+        "listdir_with_stats",
+        "open_download",
+        "open_upload",
     )
+    upload_writer_class = S3MultipartUploadWriter
 
     def _exists(self, path):
         """S3 directory is not S3Ojbect."""
@@ -85,6 +1146,59 @@ class S3Boto3StoragePatch(StoragePatch):
             return 0
         return self._origin_getmtime(path)
 
+    def load_metadata(self, path):
+        """fetch existence, size and mtime with one HEAD request."""
+        if path.endswith("/"):
+            return {}
+        from botocore.exceptions import ClientError
+
+        storage = self.storage
+        try:
+            head = storage.connection.meta.client.head_object(
+                Bucket=storage.bucket_name, Key=storage._normalize_name(path)
+            )
+        except ClientError as err:
+            if err.response.get("ResponseMetadata", {}).get("HTTPStatusCode") != 404:
+                raise
+            return {"_exists": False}
+        return file_metadata(head["ContentLength"], head["LastModified"].timestamp())
+
+    def listdir_with_stats(self, path):
+        """list with paginated ListObjects calls, keeping size and mtime.
+
+        Pages are requested as the listing is consumed.
+        """
+        storage = self.storage
+        prefix = _storage_prefix(storage, path)
+        paginator = storage.connection.meta.client.get_paginator("list_objects")
+        pages = paginator.paginate(
+            Bucket=storage.bucket_name, Delimiter="/", Prefix=prefix
+        )
+        for page in pages:
+            for entry in page.get("CommonPrefixes", ()):
+                name = entry["Prefix"][len(prefix) :]
+                if name:
+                    yield name, directory_metadata()
+            for entry in page.get("Contents", ()):
+                name = entry["Key"][len(prefix) :]
+                if name:
+                    mtime = entry["LastModified"].timestamp()
+                    yield name, file_metadata(entry["Size"], mtime)
+
+    def open_download(self, path):
+        """stream the file with ranged GetObject requests."""
+        options = self.get_download_options()
+        if options is None:
+            return None
+        return S3RangedDownloadReader(self.storage, path, **options)
+
+    def open_upload(self, path, state=None):
+        """stream the file into a multipart upload."""
+        options = self.get_upload_options()
+        if options is None:
+            return None
+        return S3MultipartUploadWriter(self.storage, path, state=state, **options)
+
 
 class DjangoGCloudStoragePatch(StoragePatch):
     """StoragePatch for DjangoGCloudStorage(provided by django-gcloud-storage)."""
@@ -94,6 +1208,7 @@ class DjangoGCloudStoragePatch(StoragePatch):
         "isdir",
         "getmtime",
         "listdir",
+        "listdir_with_stats",
     )
 
     def _exists(self, path):
@@ -115,6 +1230,13 @@ class DjangoGCloudStoragePatch(StoragePatch):
             path += "/"
         return self._origin_listdir(path)
 
+    def listdir_with_stats(self, path):
+        """list with paginated list_blobs calls, keeping size and mtime."""
+        prefix = "" if path == "/" else path.lstrip("/")
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        return _list_blobs(self.storage.bucket, prefix)
+
 
 class GoogleCloudStoragePatch(StoragePatch):
     """StoragePatch for GoogleCloudStorage(provided by django-storages)."""
@@ -123,7 +1245,12 @@ class GoogleCloudStoragePatch(StoragePatch):
         "_exists",
         "isdir",
         "getmtime",
+        "load_metadata",
+        "listdir_with_stats",
+        "open_download",
+        "open_upload",
     )
+    upload_writer_class = GoogleCloudUploadWriter
 
     def _exists(self, path):
         """GCS directory is not blob."""
@@ -139,11 +1266,102 @@ class GoogleCloudStoragePatch(StoragePatch):
             return 0
         return self._origin_getmtime(path)
 
+    def load_metadata(self, path):
+        """fetch existence, size and mtime with one metadata request."""
+        if path.endswith("/"):
+            return {}
+        storage = self.storage
+        blob = storage.bucket.get_blob(storage._normalize_name(path))
+        if blob is None:
+            return {"_exists": False}
+        return file_metadata(blob.size, blob.updated.timestamp())
+
+    def listdir_with_stats(self, path):
+        """list with paginated list_blobs calls, keeping size and mtime."""
+        storage = self.storage
+        return _list_blobs(storage.bucket, _storage_prefix(storage, path))
+
+    def open_download(self, path):
+        """stream the file with ranged downloads."""
+        options = self.get_download_options()
+        if options is None:
+            return None
+        return GoogleCloudDownloadReader(self.storage, path, **options)
+
+    def open_upload(self, path, state=None):
+        """stream the file into a resumable upload."""
+        options = self.get_upload_options()
+        if options is None:
+            return None
+        return GoogleCloudUploadWriter(self.storage, path, state=state, **options)
+
+
+class DeferredCall(BaseException):
+    """Raised by StorageFS for a backend call while calls are deferred.
+
+    The handler runs call() in a worker thread, passes the outcome to
+    StorageFS.resolve_deferred() and runs the command again. It derives
+    from BaseException so that ``except Exception`` clauses of commands
+    don't catch it.
+    """
+
+    def __init__(self, key, func, args):
+        super().__init__(key)
+        self.key = key
+        self.func = func
+        self.args = args
+
+    def call(self):
+        return self.func(*self.args)
+
 
 class StorageFS(AbstractedFS):
     """FileSystem for bridge to Django storage."""
 
     storage_class = None
+    # methods whose results are kept in the metadata cache
+    cached_methods = ("_exists", "isdir", "getsize", "getmtime", "stat", "lstat")
+    # methods that change metadata of their path arguments
+    invalidating_methods = ("mkdir", "rmdir", "remove", "rename")
+    # methods that raise DeferredCall while calls are deferred
+    deferred_methods = cached_methods + (
+        "listdir",
+        "open",
+        "remove",
+        "rename",
+        "mkdir",
+        "rmdir",
+    )
+    # methods that call the backend, run through the StorageGuard
+    guarded_methods = cached_methods + (
+        "load_metadata",
+        "listdir_with_stats",
+        "open",
+        "remove",
+        "rename",
+        "mkdir",
+        "rmdir",
+    )
+    # guarded_methods that may be retried; open() only for reading
+    idempotent_methods = cached_methods + (
+        "load_metadata",
+        "listdir_with_stats",
+        "open",
+        "remove",
+    )
+    # methods that report interrupted uploads of the account as files
+    upload_state_methods = ("_exists", "getsize", "getmtime")
+    metadata_cache_size = 10000
+    # larger listings are not stored in FTPSERVER_CACHE, whose backends
+    # may limit the size of values
+    shared_listing_size = 5000
+    # process-wide ListingCache, created from settings when None
+    listing_cache = None
+    # InotifyWatcher, set while a server with FTPSERVER_INOTIFY is running
+    watcher = None
+    # shares identical concurrent backend calls of all sessions
+    single_flight = SingleFlight()
+    _listing_cache_lock = threading.Lock()
     patches = {
         "FileSystemStorage": FileSystemStoragePatch,
         "S3Boto3Storage": S3Boto3StoragePatch,
@@ -162,15 +1380,543 @@ class StorageFS(AbstractedFS):
         super(StorageFS, self).__init__(root, cmd_channel)
         self.storage = self.get_storage()
         self.apply_patch()
+        self.storage_guard = self.get_storage_guard()
+        if self.storage_guard is not None:
+            self.apply_guard()
+        self.metadata_timeout = get_ftp_setting("FTPSERVER_METADATA_CACHE_TIMEOUT")
+        self._metadata = {}
+        self._listing_metadata = {}
+        # number of listings being formatted
+        self._formatting = 0
+        self.listing_cache = self.get_listing_cache()
+        self.shared_cache = get_shared_cache()
+        if self.metadata_timeout:
+            self.apply_metadata_cache()
+        else:
+            self.apply_listing_metadata()
+        self.resumable_uploads = bool(
+            get_ftp_setting("FTPSERVER_RESUMABLE_UPLOADS")
+            and get_ftp_setting("FTPSERVER_UPLOAD_PART_SIZE")
+            and getattr(self.upload_writer_class, "resumable", False)
+        )
+        if self.resumable_uploads:
+            self.apply_upload_states()
+        self._deferral = None
+        self.apply_deferral()
+
+    @classmethod
+    def get_listing_cache(cls):
+        """return the shared ListingCache, or None if not enabled."""
+        if cls.listing_cache is None:
+            timeout = get_ftp_setting("FTPSERVER_LISTING_CACHE_TIMEOUT")
+            if not timeout:
+                return None
+            with cls._listing_cache_lock:
+                if cls.listing_cache is None:
+                    cls.listing_cache = ListingCache(
+                        timeout,
+                        max_size=get_ftp_setting("FTPSERVER_LISTING_CACHE_SIZE"),
+                    )
+        return cls.listing_cache
+
+    @property
+    def storage_key(self):
+        """identify the storage in keys of the shared listing cache."""
+        return self.get_storage_key()
+
+    @classmethod
+    def get_storage_key(cls):
+        if cls.storage_class is None:
+            return "default"
+        return "{0.__module__}.{0.__qualname__}".format(cls.storage_class)
+
+    @classmethod
+    def get_storage_guard(cls):
+        """return the StorageGuard shared by all sessions of the storage."""
+        return get_storage_guard(cls.get_storage_key())
+
+    def _listing_key(self, path):
+        return ("listing", self.storage_key, path.rstrip("/") or "/")
+
+    @property
+    def shared_namespace(self):
+        """namespace of the storage in FTPSERVER_CACHE."""
+        return "storage:" + self.storage_key
+
+    def apply_guard(self):
+        """run guarded_methods through the StorageGuard of the storage.
+
+        Applied before the caches, so cached values don't go through it.
+        """
+        for method_name in self.guarded_methods:
+            method = getattr(self, method_name)
+            if method_name == "listdir_with_stats":
+                wrapper = self._guarded_listing(method)
+            else:
+                wrapper = self._guarded(method_name, method)
+            setattr(self, method_name, wrapper)
+
+    def _guarded(self, method_name, method):
+        guard = self.storage_guard
+        idempotent = method_name in self.idempotent_methods
+
+        @functools.wraps(method)
+        def wrapper(*args):
+            if method_name == "open":
+                mode = args[1]
+                retry = idempotent and "r" in mode and "+" not in mode
+            else:
+                retry = idempotent
+            return guard.call(method_name, method, *args, idempotent=retry)
+
+        return wrapper
+
+    def _guarded_listing(self, method):
+        guard = self.storage_guard
+
+        def start(path):
+            entries = iter(method(path))
+            # the first backend request is made for the first entry
+            return next(entries, None), entries
+
+        @functools.wraps(method)
+        def wrapper(path):
+            first, entries = guard.call(
+                "listdir_with_stats", start, path, idempotent=True
+            )
+            if first is not None:
+                yield first
+                yield from guard.iterate("listdir_with_stats", entries)
+
+        return wrapper
+
+    def apply_metadata_cache(self):
+        """serve cached_methods from the metadata cache.
+
+        Results are kept per path for metadata_timeout seconds. The first
+        lookup of a path asks load_metadata() for all values at once, so
+        patches can resolve a path with one backend request. Paths passed
+        to invalidating_methods and files opened for writing are dropped
+        from the cache.
+        """
+        for method_name in self.cached_methods:
+            method = getattr(self, method_name)
+            setattr(self, method_name, self._cached(method_name, method))
+        for method_name in self.invalidating_methods:
+            method = getattr(self, method_name)
+            setattr(self, method_name, self._invalidating(method))
+
+    def _cached(self, method_name, method):
+        @functools.wraps(method)
+        def wrapper(path):
+            values = self.get_metadata(path)
+            if method_name not in values:
+                values[method_name] = self.single_flight.do(
+                    (self.storage_key, method_name, path), lambda: method(path)
+                )
+            return values[method_name]
+
+        return wrapper
+
+    def apply_listing_metadata(self):
+        """serve cached_methods from the listing being formatted.
+
+        Used without the metadata cache: the values listdir_with_stats()
+        returned with the entries are used by format_list() and
+        format_mlsx() while they format the listing, and dropped after.
+        """
+        for method_name in self.cached_methods:
+            method = getattr(self, method_name)
+            setattr(self, method_name, self._from_listing(method_name, method))
+
+    def _from_listing(self, method_name, method):
+        @functools.wraps(method)
+        def wrapper(path):
+            if self._formatting:
+                values = self._listing_metadata.get(path)
+                if values is not None and method_name in values:
+                    return values[method_name]
+            return method(path)
+
+        return wrapper
+
+    def _invalidating(self, method):
+        @functools.wraps(method)
+        def wrapper(*paths):
+            try:
+                return method(*paths)
+            finally:
+                for path in paths:
+                    self.invalidate_metadata(path)
+
+        return wrapper
+
+    @property
+    def upload_writer_class(self):
+        patch = getattr(self, "_patch", None)
+        return getattr(patch, "upload_writer_class", None)
+
+    def apply_upload_states(self):
+        """let upload_state_methods report interrupted uploads as files.
+
+        A client resuming an upload asks for the size of the file first,
+        like it would for a partially written local file. Applied after
+        the caches, so other accounts don't see the uploads.
+        """
+        for method_name in self.upload_state_methods:
+            method = getattr(self, method_name)
+            setattr(self, method_name, self._with_upload_state(method_name, method))
+
+    def _with_upload_state(self, method_name, method):
+        @functools.wraps(method)
+        def wrapper(path):
+            try:
+                result = method(path)
+            except Exception:
+                if method_name == "_exists":
+                    raise
+                state = self.get_upload_state(path)
+                if state is None:
+                    raise
+            else:
+                if method_name != "_exists" or result or path.endswith("/"):
+                    return result
+                state = self.get_upload_state(path)
+                if state is None:
+                    return result
+            values = file_metadata(state.size, state.updated.timestamp())
+            return values[method_name]
+
+        return wrapper
+
+    def apply_deferral(self):
+        """let deferred_methods raise DeferredCall between begin_deferral()
+        and end_deferral().
+
+        Values already in the session's metadata cache are returned
+        right away.
+        """
+        for method_name in self.deferred_methods:
+            method = getattr(self, method_name)
+            setattr(self, method_name, self._deferrable(method_name, method))
+
+    def _deferrable(self, method_name, method):
+        cached = method_name in self.cached_methods
+
+        @functools.wraps(method)
+        def wrapper(*args):
+            if self._deferral is None or (
+                cached and self.has_metadata(method_name, args[0])
+            ):
+                return method(*args)
+            return self.run_deferrable((method_name,) + args, method, *args)
+
+        return wrapper
+
+    def begin_deferral(self):
+        """defer backend calls made by the current thread.
+
+        Until end_deferral(), a backend call whose result is unknown raises
+        DeferredCall. Results passed to resolve_deferred() are returned
+        when the same call is made again.
+        """
+        self._deferral = (threading.get_ident(), {})
+
+    def resolve_deferred(self, key, result=None, error=None):
+        """store the outcome of a DeferredCall."""
+        self._deferral[1][key] = (result, error)
+
+    def end_deferral(self, abort=False):
+        """stop deferring calls; with abort, close files opened for it."""
+        deferral, self._deferral = self._deferral, None
+        if abort and deferral is not None:
+            for result, error in deferral[1].values():
+                discard_file(result)
+
+    def in_worker(self):
+        """return True if called by a worker running a DeferredCall."""
+        deferral = self._deferral
+        return deferral is not None and deferral[0] != threading.get_ident()
+
+    def run_deferrable(self, key, func, *args):
+        """return func(*args), or raise DeferredCall while deferring."""
+        deferral = self._deferral
+        if deferral is None or deferral[0] != threading.get_ident():
+            return func(*args)
+        if key in deferral[1]:
+            result, error = deferral[1][key]
+            if error is not None:
+                raise error
+            return result
+        raise DeferredCall(key, func, args)
+
+    def has_metadata(self, method_name, path):
+        """return True if method_name(path) is answered from the cache."""
+        values = self._listing_metadata.get(path)
+        if (
+            values is not None
+            and method_name in values
+            and (self.metadata_timeout or self._formatting)
+        ):
+            return True
+        if not self.metadata_timeout:
+            return False
+        entry = self._metadata.get(path)
+        if entry is None or method_name not in entry[1]:
+            return False
+        token = self.change_token(os.path.dirname(path.rstrip("/")) or "/")
+        return entry[2] == token if token else entry[0] > time.monotonic()
+
+    def get_metadata(self, path):
+        """return the dict of cached values for path.
+
+        Values with a change token (see change_token()) stay valid until
+        the token changes, others until metadata_timeout expires.
+        """
+        now = time.monotonic()
+        token = self.change_token(os.path.dirname(path.rstrip("/")) or "/")
+        entry = self._metadata.get(path)
+        if entry is None or (entry[2] != token if token else entry[0] <= now):
+            values = self._listing_metadata.pop(path, None)
+            cache = self.listing_cache
+            key = ("metadata", self.storage_key, path)
+            if values is None and cache is not None:
+                cached = cache.get(key)
+                if cached is not None and cached[0] == token:
+                    values = cached[1]
+            if values is None:
+                values = self._load_shared_metadata(path, token)
+                if cache is not None:
+                    # shared: values computed later by this session are
+                    # visible to other sessions too
+                    cache.set(key, (token, values))
+            entry = self._store_metadata(path, values, now, token)
+        return entry[1]
+
+    def _load_shared_metadata(self, path, token):
+        """return load_metadata(path), through FTPSERVER_CACHE if set.
+
+        Values with a change token are process local and not shared.
+        """
+        shared = self.shared_cache
+        if shared is None or token is not None:
+            return self._load_metadata(path)
+        return shared.get_or_set(
+            self.shared_namespace,
+            ("metadata", path),
+            lambda: self._load_metadata(path),
+            wait=self.in_worker(),
+        )
+
+    def _load_metadata(self, path):
+        values = self.single_flight.do(
+            (self.storage_key, "load_metadata", path),
+            lambda: self.load_metadata(path),
+        )
+        # callers add values to the dict, don't share it between sessions
+        return dict(values)
+
+    def _store_metadata(self, path, values, now, token=None):
+        if len(self._metadata) >= self.metadata_cache_size:
+            self._metadata = {
+                key: entry for key, entry in self._metadata.items() if entry[0] > now
+            }
+            if len(self._metadata) >= self.metadata_cache_size:
+                self._metadata.clear()
+        entry = self._metadata[path] = (now + self.metadata_timeout, values, token)
+        return entry
+
+    def seed_metadata(self, path, values):
+        """cache metadata values of path known from another request."""
+        if self.metadata_timeout:
+            self._store_metadata(path, dict(values), time.monotonic())
+
+    def change_token(self, path):
+        """return a value that changes whenever directory path changes.
+
+        None means changes can't be detected and cached values expire
+        after a timeout. Patches override this for storages that can
+        report changes, like FileSystemStorage with FTPSERVER_INOTIFY.
+        """
+        return None
+
+    def invalidate_metadata(self, path=None):
+        """drop cached metadata of path and its parent, or everything.
+
+        Listings of path and its parent are dropped from the shared
+        listing cache as well.
+        """
+        if path is None:
+            self._metadata.clear()
+            self._listing_metadata.clear()
+            return
+        name = path.rstrip("/")
+        parent = os.path.dirname(name)
+        for key in (path, name, name + "/", parent):
+            self._metadata.pop(key, None)
+            self._listing_metadata.pop(key, None)
+        cache = self.listing_cache
+        if cache is not None:
+            for key in {path, name, name + "/", parent}:
+                cache.invalidate(("metadata", self.storage_key, key))
+            cache.invalidate(self._listing_key(name))
+            cache.invalidate(self._listing_key(parent))
+        shared = self.shared_cache
+        if shared is not None:
+            namespace = self.shared_namespace
+            for key in {path, name, name + "/", parent}:
+                shared.delete(namespace, ("metadata", key))
+            for key in {name or "/", parent or "/"}:
+                shared.delete(namespace, ("listing", key))
+
+    def load_metadata(self, path):
+        """return metadata values of path known without extra requests.
+
+        Patches override this to resolve a path with a single backend
+        request. Keys are names of cached_methods.
+        """
+        return {}
 
     def get_storage(self):
         if self.storage_class is None:
             return storages["default"]
         return self.storage_class()
 
-    def open(self, filename, mode):
+    def open(self, filename, mode, offset=0):
+        """open filename, positioned at offset.
+
+        Files streamed from object storage are requested from offset on,
+        instead of seeking after opening them.
+        """
         path = os.path.join(self._cwd, filename)
-        return self.storage.open(path, mode)
+        if "r" not in mode or "+" in mode:
+            self.invalidate_metadata(path)
+        if mode == "rb":
+            reader = self.open_download(path)
+            if reader is not None:
+                reader.start(offset)
+                return reader
+        elif mode == "wb":
+            state = None
+            if self.resumable_uploads:
+                self.abort_uploads(path)
+                state = models.FTPUpload(
+                    storage=self.storage_key, username=self.username, path=path
+                )
+            writer = self.open_upload(path, state)
+            if writer is not None:
+                return writer
+        elif self.resumable_uploads:
+            # REST+STOR or APPE
+            state = self.get_upload_state(path)
+            writer = None if state is None else self.open_upload(path, state)
+            if writer is not None:
+                if offset:
+                    writer.seek(offset)
+                return writer
+        file = self.storage.open(path, mode)
+        if offset:
+            try:
+                file.seek(offset)
+            except BaseException:
+                file.close()
+                raise
+        return file
+
+    def open_download(self, path):
+        """return a file object streaming a file from the storage.
+
+        Patches for object storages return a RangedDownloadReader, None
+        means storage.open() is used.
+        """
+        return None
+
+    def open_upload(self, path, state=None):
+        """return a file object streaming a new file to the storage.
+
+        Patches for object storages return a MultipartUploadWriter, None
+        means storage.open() is used. state is the FTPUpload the writer
+        saves its progress to, or continues when it is stored.
+        """
+        return None
+
+    @property
+    def username(self):
+        """login name of the session's account."""
+        return getattr(self.cmd_channel, "username", "") or ""
+
+    def get_upload_state(self, path):
+        """return the FTPUpload of the account's interrupted upload of path.
+
+        None if there is none, or uploads are not resumable.
+        """
+        if not self.resumable_uploads:
+            return None
+        return (
+            models.FTPUpload.objects.filter(
+                storage=self.storage_key, path=path, username=self.username
+            )
+            .exclude(upload_id="")
+            .order_by("-updated")
+            .first()
+        )
+
+    def abort_uploads(self, path):
+        """abort the interrupted uploads of path, of all accounts."""
+        states = models.FTPUpload.objects.filter(storage=self.storage_key, path=path)
+        for state in states:
+            writer = self.open_upload(path, state)
+            try:
+                if writer is None:
+                    state.delete()
+                else:
+                    writer.abort()
+            except Exception:
+                logger.warning("Failed to abort upload of %s.", path, exc_info=True)
+
+    @classmethod
+    def abort_stored_upload(cls, state):
+        """abort the upload of an FTPUpload outside of a session.
+
+        The storage is created from the name in state.storage (see
+        get_storage_key()): the default storage, or an instance of the
+        storage class.
+        """
+        if state.storage == "default":
+            storage = storages["default"]
+        else:
+            storage = import_string(state.storage)()
+        patch = cls.patches.get(storage.__class__.__name__)
+        writer_class = getattr(patch, "upload_writer_class", None)
+        if writer_class is None or not writer_class.resumable or not state.upload_id:
+            state.delete()
+            return
+        writer = writer_class(
+            storage, state.path, state=state, guard=get_storage_guard(state.storage)
+        )
+        writer.abort()
+
+    def get_upload_options(self):
+        """return MultipartUploadWriter options, or None if disabled."""
+        part_size = get_ftp_setting("FTPSERVER_UPLOAD_PART_SIZE")
+        if not part_size:
+            return None
+        return {
+            "part_size": part_size,
+            "concurrency": get_ftp_setting("FTPSERVER_UPLOAD_CONCURRENCY"),
+            "guard": self.storage_guard,
+        }
+
+    def get_download_options(self):
+        """return RangedDownloadReader options, or None if disabled."""
+        chunk_size = get_ftp_setting("FTPSERVER_DOWNLOAD_CHUNK_SIZE")
+        if not chunk_size:
+            return None
+        return {
+            "chunk_size": chunk_size,
+            "read_ahead": get_ftp_setting("FTPSERVER_DOWNLOAD_READ_AHEAD"),
+            "guard": self.storage_guard,
+        }
 
     def mkstemp(self, suffix="", prefix="", dir=None, mode="wb"):
         raise NotImplementedError
@@ -183,12 +1929,164 @@ class StorageFS(AbstractedFS):
         raise NotImplementedError
 
     def listdir(self, path):
+        return list(self.iter_listdir(path))
+
+    def iter_listdir(self, path, metadata=True):
+        """iterate over the entry names of directory path.
+
+        Backend pages are fetched as the iterator is consumed, so memory
+        use does not depend on the size of the directory. With metadata,
+        the values listed with the entries are kept for format_list() and
+        format_mlsx(); NLST doesn't need them.
+        """
         assert isinstance(path, str), path
+        # kept until the entries are formatted by format_list/format_mlsx
+        self._listing_metadata = listing_metadata = {}
+        cache = self.listing_cache
+        shared = self.shared_cache
+        entries = token = None
+        key = self._listing_key(path)
+        if cache is not None or shared is not None:
+            token = self.change_token(path)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None and cached[0] == token:
+                entries = cached[1]
+        if shared is not None and token is not None:
+            # change tokens are process local
+            shared = None
+        if entries is None and shared is not None:
+            # the listing is consumed in the IOLoop, don't wait for another
+            # session to store it
+            shared_entries = shared.fetch(
+                self.shared_namespace, ("listing", key[2]), wait=False
+            )
+            if shared_entries is LOADING:
+                shared = None
+            elif shared_entries is not MISSING:
+                entries = shared_entries
+                if cache is not None:
+                    cache.set(key, (token, entries), weight=len(entries) + 1)
+        if entries is None:
+            entries = self._single_flight_listing(key[2], path)
+            if shared is not None:
+                entries = self._share_listing(key[2], entries)
+            if cache is not None:
+                entries = self._cache_listing(key, token, entries)
+        for name, values in entries:
+            if values and metadata:
+                if len(listing_metadata) >= self.metadata_cache_size:
+                    # entries after a sorted head are formatted one by
+                    # one, the oldest ones are done
+                    del listing_metadata[next(iter(listing_metadata))]
+                listing_metadata[os.path.join(path, name)] = values
+            yield name
+
+    def format_list(self, basedir, listing, ignore_err=True):
+        return self._formatted(super().format_list(basedir, listing, ignore_err))
+
+    def format_mlsx(self, basedir, listing, perms, facts, ignore_err=True):
+        return self._formatted(
+            super().format_mlsx(basedir, listing, perms, facts, ignore_err)
+        )
+
+    def _formatted(self, lines):
+        """yield lines using the listing metadata, then drop it."""
+        listing_metadata = self._listing_metadata
+        self._formatting += 1
+        try:
+            yield from lines
+        finally:
+            self._formatting -= 1
+            if self._listing_metadata is listing_metadata:
+                self._listing_metadata = {}
+
+    def _cache_listing(self, key, token, entries):
+        """yield entries, caching them if the listing fits into the cache."""
+        cache = self.listing_cache
+        listing = []
+        for entry in entries:
+            if listing is not None:
+                listing.append(entry)
+                if len(listing) > cache.max_size:
+                    listing = None
+            yield entry
+        if listing is not None:
+            cache.set(key, (token, listing), weight=len(listing) + 1)
+
+    def _single_flight_listing(self, key, path):
+        """yield listdir_with_stats(path), shared with concurrent listings.
+
+        The leader streams its listing and keeps up to
+        metadata_cache_size entries for callers that wait for it; larger
+        and abandoned listings are not shared.
+        """
+        single_flight = self.single_flight
+        flight_key = (self.storage_key, "listdir_with_stats", key)
+        flight, leader = single_flight.join(flight_key)
+        if not leader:
+            if single_flight.wait(flight):
+                if flight.error is not None:
+                    raise flight.error
+                yield from flight.result
+            else:
+                yield from self.listdir_with_stats(path)
+            return
+        listing = []
+        try:
+            for entry in self.listdir_with_stats(path):
+                if listing is not None:
+                    listing.append(entry)
+                    if len(listing) > self.metadata_cache_size:
+                        listing = None
+                yield entry
+        except Exception as exc:
+            single_flight.finish(flight_key, flight, error=exc)
+            raise
+        except BaseException:
+            single_flight.finish(flight_key, flight, shared=False)
+            raise
+        single_flight.finish(
+            flight_key, flight, result=listing, shared=listing is not None
+        )
+
+    def _share_listing(self, path, entries):
+        """yield entries, storing them in FTPSERVER_CACHE when complete.
+
+        The load lock is released as soon as the listing is too large to
+        be stored, so other sessions list the directory themselves.
+        """
+        shared = self.shared_cache
+        namespace = self.shared_namespace
+        listing = []
+        try:
+            for entry in entries:
+                if listing is not None:
+                    listing.append(entry)
+                    if len(listing) > self.shared_listing_size:
+                        listing = None
+                        shared.release(namespace, ("listing", path))
+                yield entry
+        except BaseException:
+            if listing is not None:
+                shared.release(namespace, ("listing", path))
+            raise
+        if listing is not None:
+            shared.set(namespace, ("listing", path), listing)
+
+    def listdir_with_stats(self, path):
+        """return an iterable of (name, values) of the entries of path.
+
+        values are metadata values as returned by load_metadata(), or None.
+        They are used for the following stat() calls of the entries, so
+        patches for backends whose list call returns sizes and mtimes
+        override this to save one request per entry.
+        """
         if path == "/":
             path = ""
         directories, files = self.storage.listdir(path)
-        return [name + "/" for name in directories if name] + [
-            name for name in files if name
+        return [(name + "/", None) for name in directories if name] + [
+            (name, None) for name in files if name
         ]
 
     def rmdir(self, path):
@@ -257,3 +2155,62 @@ class StorageFS(AbstractedFS):
 
     def get_group_by_gid(self, gid):
         return "group"
+
+
+def invalidate_listing_cache(sender, handler=None, **kwargs):
+    """drop changed paths from the listing cache of the handler's StorageFS."""
+    fs = getattr(handler, "fs", None)
+    if not isinstance(fs, StorageFS):
+        return
+    for name in ("path", "path_from", "path_to"):
+        if kwargs.get(name):
+            fs.invalidate_metadata(kwargs[name])
+
+
+for _signal in (
+    signals.ftp_file_received,
+    signals.ftp_file_received_incomplete,
+    signals.ftp_file_deleted,
+    signals.ftp_file_renamed,
+    signals.ftp_directory_created,
+    signals.ftp_directory_deleted,
+):
+    _signal.connect(
+        invalidate_listing_cache, dispatch_uid="django_ftpserver.listing_cache"
+    )
+
+
+def start_watcher(sender, server, **kwargs):
+    """start the InotifyWatcher when FTPSERVER_INOTIFY is enabled."""
+    filesystem = getattr(server.handler, "abstracted_fs", None)
+    if not get_ftp_setting("FTPSERVER_INOTIFY") or not (
+        isinstance(filesystem, type) and issubclass(filesystem, StorageFS)
+    ):
+        return
+    if filesystem.watcher is not None:
+        return
+    try:
+        watcher = InotifyWatcher(
+            max_watches=get_ftp_setting("FTPSERVER_INOTIFY_MAX_WATCHES")
+        )
+    except OSError:
+        logger.warning("inotify is not available, FTPSERVER_INOTIFY is ignored.")
+        return
+    watcher.register(server.ioloop)
+    filesystem.watcher = watcher
+
+
+def stop_watcher(sender, server, **kwargs):
+    filesystem = getattr(server.handler, "abstracted_fs", None)
+    watcher = getattr(filesystem, "watcher", None)
+    if isinstance(watcher, InotifyWatcher):
+        watcher.close()
+        filesystem.watcher = None
+
+
+signals.ftp_server_started.connect(
+    start_watcher, dispatch_uid="django_ftpserver.start_watcher"
+)
+signals.ftp_server_stopped.connect(
+    stop_watcher, dispatch_uid="django_ftpserver.stop_watcher"
+)
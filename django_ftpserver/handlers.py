@@ -5,25 +5,639 @@ This module provides FTP handlers that emit Django signals for various
 FTP events, enabling logging and custom event processing.
 """
 
+import errno
+import functools
+import itertools
 import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
-from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.authorizers import AuthenticationFailed, AuthorizerError
+from pyftpdlib.filesystems import FilesystemError
+from pyftpdlib.handlers import DTPHandler, FTPHandler
+from pyftpdlib.utils import strerror
 
 from django_ftpserver import signals
+from django_ftpserver.filesystems import (
+    DeferredCall,
+    RangedDownloadReader,
+    StorageFS,
+    is_local_file,
+)
+from django_ftpserver.resilience import (
+    StorageUnavailable,
+    close_abandoned,
+    discard_file,
+    mark_loop_thread,
+)
+from django_ftpserver.throttling import LoginThrottle
+from django_ftpserver.utils import get_ftp_setting
 
 
 logger = logging.getLogger(__name__)
 
+# errors of a data connection that broke, the client didn't close it
+CONNECTION_RESET_ERRNOS = frozenset(
+    (errno.ECONNRESET, errno.ECONNABORTED, errno.ETIMEDOUT)
+)
+
+try:
+    from pyftpdlib.handlers.ftp.producers import BufferedIteratorProducer, FileProducer
+except ImportError:  # pyftpdlib < 2.0
+    from pyftpdlib.handlers import BufferedIteratorProducer, FileProducer
+
 # TLS_FTPHandler requires pyOpenSSL
 try:
-    from pyftpdlib.handlers import TLS_FTPHandler
+    from pyftpdlib.handlers import TLS_DTPHandler, TLS_FTPHandler
 
     HAS_TLS = True
 except ImportError:
-    TLS_FTPHandler = None
+    TLS_DTPHandler = TLS_FTPHandler = None
     HAS_TLS = False
 
 
+class LoginThrottleMixin:
+    """
+    Mixin class that throttles login attempts.
+
+    When ``FTPSERVER_LOGIN_THROTTLE_RATE`` is set, PASS commands exceeding
+    the budget of the remote IP or the username are rejected before the
+    authorizer is called, and failed logins are answered with a
+    progressive delay.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # LoginThrottle instance, created from settings when None
+    login_throttle = None
+
+    _login_throttle_lock = threading.Lock()
+
+    @classmethod
+    def get_login_throttle(cls):
+        """Return the shared LoginThrottle, or None if not enabled."""
+        if cls.login_throttle is None:
+            rate = get_ftp_setting("FTPSERVER_LOGIN_THROTTLE_RATE")
+            if not rate:
+                return None
+            with cls._login_throttle_lock:
+                if cls.login_throttle is None:
+                    cls.login_throttle = LoginThrottle(
+                        rate,
+                        burst=get_ftp_setting("FTPSERVER_LOGIN_THROTTLE_BURST"),
+                        max_delay=get_ftp_setting("FTPSERVER_LOGIN_THROTTLE_MAX_DELAY"),
+                        max_entries=get_ftp_setting("FTPSERVER_LOGIN_THROTTLE_SIZE"),
+                    )
+        return cls.login_throttle
+
+    def ftp_PASS(self, line):
+        throttle = self.get_login_throttle()
+        if throttle is not None and not self.authenticated and self.username:
+            if not throttle.allow(self.remote_ip, self.username):
+                logger.debug(
+                    "FTP login throttled: username=%s, remote_ip=%s",
+                    self.username,
+                    self.remote_ip,
+                )
+                self.handle_auth_failed("Too many login attempts.", line)
+                return
+        return super().ftp_PASS(line)
+
+    def handle_auth_failed(self, msg, password):
+        throttle = self.get_login_throttle()
+        if throttle is not None:
+            self.auth_failed_timeout = throttle.failure_delay(
+                self.remote_ip, self.username
+            )
+        super().handle_auth_failed(msg, password)
+
+    def handle_auth_success(self, home, password, msg_login):
+        throttle = self.get_login_throttle()
+        if throttle is not None:
+            throttle.success(self.remote_ip, self.username)
+        super().handle_auth_success(home, password, msg_login)
+
+
+class FuturePoller:
+    """Run callbacks in the IOLoop when futures are done.
+
+    All futures of one IOLoop are checked by a single timer every
+    ``interval`` seconds, which only runs while futures are pending.
+    Callbacks are called with the future; when one raises, ``errback``
+    given to add() is called instead.
+    """
+
+    def __init__(self, ioloop, interval):
+        self.ioloop = ioloop
+        self.interval = interval
+        self._pending = {}
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, future, callback, errback=None):
+        self._pending[future] = (callback, errback)
+        if self._timer is None:
+            self._timer = self.ioloop.call_every(self.interval, self.poll)
+
+    def discard(self, future):
+        self._pending.pop(future, None)
+        if not self._pending:
+            self._cancel()
+
+    def poll(self):
+        for future in [future for future in self._pending if future.done()]:
+            callback, errback = self._pending.pop(future)
+            try:
+                callback(future)
+            except Exception:
+                if errback is None:
+                    raise
+                errback()
+        if not self._pending:
+            self._cancel()
+
+    def _cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class DeferredAuthMixin:
+    """
+    Mixin class that verifies credentials outside of the IOLoop.
+
+    When ``auth_workers`` is set, the authorizer calls made for PASS
+    (validate_authentication, get_home_dir and get_msg_login) run in a
+    bounded thread pool. The control channel stops reading until the
+    result arrives and the 230/530 reply is sent from the IOLoop, so
+    password hashing does not stall other sessions. Pending logins of all
+    sessions of an IOLoop are checked by one FuturePoller.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # number of threads used for authentication, None runs it in the IOLoop
+    auth_workers = None
+    # seconds between checks for finished authentications
+    auth_poll_interval = 0.005
+
+    _auth_executor = None
+    _auth_executor_lock = threading.Lock()
+    # FuturePoller of each IOLoop, shared by its sessions
+    _auth_pollers = weakref.WeakKeyDictionary()
+    _auth_future = None
+
+    @classmethod
+    def get_auth_executor(cls):
+        """Return the shared executor, or None if not enabled."""
+        if not cls.auth_workers:
+            return None
+        with cls._auth_executor_lock:
+            if cls._auth_executor is None:
+                cls._auth_executor = ThreadPoolExecutor(
+                    max_workers=cls.auth_workers, thread_name_prefix="ftp-auth"
+                )
+        return cls._auth_executor
+
+    def get_auth_poller(self):
+        """Return the FuturePoller of the IOLoop of this session."""
+        poller = self._auth_pollers.get(self.ioloop)
+        if poller is None:
+            poller = self._auth_pollers[self.ioloop] = FuturePoller(
+                self.ioloop, self.auth_poll_interval
+            )
+        return poller
+
+    def ftp_PASS(self, line):
+        executor = self.get_auth_executor()
+        if executor is None or self.authenticated or not self.username:
+            return super().ftp_PASS(line)
+        self.del_channel()
+        self._auth_future = executor.submit(self._authenticate, self.username, line)
+        self.get_auth_poller().add(
+            self._auth_future,
+            functools.partial(self._authentication_done, line),
+            self.handle_error,
+        )
+
+    def _authenticate(self, username, password):
+        """Run the authorizer calls of the login sequence (in a worker)."""
+        authorizer = self.authorizer
+        authorizer.validate_authentication(username, password, self)
+        home = authorizer.get_home_dir(username)
+        msg_login = authorizer.get_msg_login(username)
+        return home, msg_login
+
+    def _authentication_done(self, password, future):
+        self._auth_future = None
+        if self._closed:
+            return
+        self.add_channel()
+        try:
+            home, msg_login = future.result()
+        except (AuthenticationFailed, AuthorizerError) as err:
+            self.handle_auth_failed(str(err), password)
+        else:
+            self.handle_auth_success(home, password, msg_login)
+
+    def close(self):
+        if self._auth_future is not None:
+            self.get_auth_poller().discard(self._auth_future)
+            self._auth_future = None
+        super().close()
+
+
+class ReadAheadProducer:
+    """Producer that prepares the chunks of another producer in an executor.
+
+    The next chunk is made while the current one is sent; ready() tells
+    if more() would wait for it, DownloadReadAheadMixin stops sending
+    until it returns True.
+    """
+
+    def __init__(self, producer, executor):
+        self.producer = producer
+        self.executor = executor
+        self._next = executor.submit(producer.more)
+
+    def ready(self):
+        return self._next.done()
+
+    def more(self):
+        data = self._next.result()
+        if data:
+            self._next = self.executor.submit(self.producer.more)
+        return data
+
+
+class DeferredStorageMixin:
+    """
+    Mixin class that runs storage backend calls outside of the IOLoop.
+
+    When ``storage_workers`` is set and the filesystem supports deferred
+    calls (StorageFS does), a command that needs a backend call is
+    suspended: the call runs in a bounded thread pool, the control channel
+    stops reading, and the command is run again in the IOLoop once the
+    result is available. Calls that take longer than ``storage_timeout``
+    seconds are answered with 451 and the command is abandoned.
+
+    Handler attributes listed in ``storage_replay_attributes`` are
+    restored before a command is run again, as commands reset them before
+    their first backend call.
+
+    Replies of LIST, NLST and MLSD are produced by the thread pool too
+    (see ReadAheadProducer), so the following listing pages and the
+    metadata of the entries are fetched outside of the IOLoop as well.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # number of threads used for storage calls, None runs them in the IOLoop
+    storage_workers = None
+    # seconds a storage call may take, read from settings when None
+    storage_timeout = None
+    # seconds between checks for a finished storage call
+    storage_poll_interval = 0.005
+    storage_replay_attributes = ("_rnfr", "_restart_position")
+
+    _storage_executor = None
+    _storage_executor_lock = threading.Lock()
+    _storage_poller = None
+    _queued_lines = ()
+
+    @classmethod
+    def get_storage_executor(cls):
+        """Return the shared executor, or None if not enabled."""
+        if not cls.storage_workers:
+            return None
+        with cls._storage_executor_lock:
+            if cls._storage_executor is None:
+                cls._storage_executor = ThreadPoolExecutor(
+                    max_workers=cls.storage_workers, thread_name_prefix="ftp-storage"
+                )
+        return cls._storage_executor
+
+    def found_terminator(self):
+        if self._storage_poller is not None:
+            # a command waits for the storage, keep the following in order
+            self._queued_lines = list(self._queued_lines)
+            self._queued_lines.append(b"".join(self._in_buffer))
+            self._in_buffer = []
+            self._in_buffer_len = 0
+            return
+        super().found_terminator()
+
+    def _process_queued_lines(self):
+        while self._queued_lines and self._storage_poller is None:
+            if self._closed:
+                return
+            line = self._queued_lines.pop(0)
+            self._in_buffer = [line]
+            self._in_buffer_len = len(line)
+            self.found_terminator()
+
+    def _get_deferral_executor(self):
+        """return the storage executor if calls of self.fs are deferred."""
+        executor = self.get_storage_executor()
+        if (
+            executor is None
+            or not isinstance(self.fs, StorageFS)
+            or getattr(self.authorizer, "personate_user", None) is not None
+        ):
+            return None
+        return executor
+
+    def process_command(self, cmd, *args, **kwargs):
+        executor = self._get_deferral_executor()
+        fs = self.fs
+        if executor is None:
+            return super().process_command(cmd, *args, **kwargs)
+        state = {name: getattr(self, name) for name in self.storage_replay_attributes}
+        fs.begin_deferral()
+        # QUIT and REIN drop self.fs, keep the instance for this command
+        self._run_deferrable((executor, fs, state, cmd, args, kwargs))
+
+    def _run_deferrable(self, command):
+        executor, fs, state, cmd, args, kwargs = command
+        try:
+            super().process_command(cmd, *args, **kwargs)
+        except DeferredCall as call:
+            for name, value in state.items():
+                setattr(self, name, value)
+            self._defer(call, command)
+            return
+        except BaseException:
+            fs.end_deferral(abort=True)
+            raise
+        fs.end_deferral()
+
+    def _defer(self, call, command):
+        timeout = self.storage_timeout
+        if timeout is None:
+            timeout = get_ftp_setting("FTPSERVER_STORAGE_TIMEOUT")
+        deadline = time.monotonic() + timeout if timeout else None
+        self.del_channel()
+        future = command[0].submit(call.call)
+        self._storage_poller = self.ioloop.call_every(
+            self.storage_poll_interval,
+            self._poll_storage_call,
+            future,
+            deadline,
+            call,
+            command,
+            _errback=self.handle_error,
+        )
+
+    def _poll_storage_call(self, future, deadline, call, command):
+        fs, cmd, args = command[1], command[3], command[4]
+        timed_out = deadline is not None and time.monotonic() > deadline
+        if not future.done() and not timed_out:
+            return
+        self._storage_poller.cancel()
+        self._storage_poller = None
+        if self._closed:
+            fs.end_deferral(abort=True)
+            return
+        self.add_channel()
+        if not future.done():
+            if not future.cancel():
+                future.add_done_callback(close_abandoned)
+            fs.end_deferral(abort=True)
+            logger.warning("Storage call timed out: %r", call.key)
+            self.respond("451 Storage request timed out.")
+            self.log_cmd(
+                cmd, args[0] if args else "", 451, "Storage request timed out."
+            )
+        else:
+            try:
+                result = future.result()
+            except Exception as err:
+                fs.resolve_deferred(call.key, error=err)
+            else:
+                fs.resolve_deferred(call.key, result)
+            self._run_deferrable(command)
+        self._process_queued_lines()
+
+    def push_dtp_data(self, data, isproducer=False, file=None, cmd=None):
+        # the transfer may start right away, calls made by its producer
+        # aren't deferred
+        if isinstance(self.fs, StorageFS):
+            self.fs.end_deferral()
+            executor = self._get_deferral_executor()
+            if isproducer and file is None and executor is not None:
+                # a listing, pull its pages and metadata in the pool
+                data = ReadAheadProducer(data, executor)
+        super().push_dtp_data(data, isproducer=isproducer, file=file, cmd=cmd)
+
+    def push_with_producer(self, producer):
+        if isinstance(self.fs, StorageFS):
+            self.fs.end_deferral()
+        super().push_with_producer(producer)
+
+    def close(self):
+        if self._storage_poller is not None:
+            self._storage_poller.cancel()
+            self._storage_poller = None
+            if self.fs is not None:
+                self.fs.end_deferral(abort=True)
+        super().close()
+
+
+class StorageUnavailableMixin:
+    """
+    Mixin class that answers storage backend failures with 4xx replies.
+
+    Commands failing with StorageUnavailable, because backend calls timed
+    out, kept failing or were rejected by the circuit breaker of the
+    StorageGuard, are answered with 451 so that clients retry them later.
+    While the circuit breaker is open, new connections are answered with
+    421 and closed.
+
+    The thread accepting connections runs the IOLoop, it is marked so
+    that the StorageGuard doesn't sleep between retries in it.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    def handle(self):
+        filesystem = self.abstracted_fs
+        if isinstance(filesystem, type) and issubclass(filesystem, StorageFS):
+            guard = filesystem.get_storage_guard()
+            if guard is not None:
+                mark_loop_thread()
+            if guard is not None and guard.breaker and guard.breaker.is_open():
+                self.respond_w_warning(
+                    "421 Storage backend unavailable, try again later."
+                )
+                self.close_when_done()
+                return
+        super().handle()
+
+    def process_command(self, cmd, *args, **kwargs):
+        try:
+            super().process_command(cmd, *args, **kwargs)
+        except StorageUnavailable as err:
+            self.respond("451 {}.".format(err))
+            self.log_cmd(cmd, args[0] if args else "", 451, str(err))
+
+
+class StreamingListMixin:
+    """
+    Mixin class that streams LIST, NLST and MLSD replies.
+
+    When the filesystem provides ``iter_listdir`` (StorageFS does), entry
+    names are pulled from it while the reply is sent on the data channel,
+    so memory use does not depend on the size of the directory. Listings
+    of up to ``FTPSERVER_LIST_SORT_LIMIT`` entries are sorted as RFC 959
+    recommends; larger ones are sent in backend order.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # max number of entries sorted before sending, read from settings when None
+    list_sort_limit = None
+
+    def _iter_listing(self, path, metadata=True):
+        """return the entry names of path, sorted if the listing is small.
+
+        Without metadata, the filesystem doesn't keep the listed values
+        for formatting.
+        """
+        limit = self.list_sort_limit
+        if limit is None:
+            limit = get_ftp_setting("FTPSERVER_LIST_SORT_LIMIT")
+
+        def start():
+            # errors of the first page are raised here, before any reply
+            iterator = self.fs.iter_listdir(path, metadata=metadata)
+            return list(itertools.islice(iterator, limit + 1)), iterator
+
+        if isinstance(self.fs, StorageFS):
+            head, iterator = self.run_as_current_user(
+                self.fs.run_deferrable, ("iter_listdir", path), start
+            )
+        else:
+            head, iterator = self.run_as_current_user(start)
+        if len(head) <= limit:
+            head.sort()
+            return head
+        return itertools.chain(head, iterator)
+
+    def ftp_LIST(self, path):
+        if not hasattr(self.fs, "iter_listdir"):
+            return super().ftp_LIST(path)
+        try:
+            if self.fs.isdir(path):
+                listing = self._iter_listing(path)
+                iterator = self.fs.format_list(path, listing)
+            else:
+                basedir, filename = os.path.split(path)
+                self.fs.lstat(path)  # raise exc in case of problems
+                iterator = self.fs.format_list(basedir, [filename])
+        except (OSError, FilesystemError) as err:
+            self.respond("550 {}.".format(strerror(err)))
+        else:
+            producer = BufferedIteratorProducer(iterator)
+            self.push_dtp_data(producer, isproducer=True, cmd="LIST")
+            return path
+
+    def ftp_NLST(self, path):
+        if not hasattr(self.fs, "iter_listdir"):
+            return super().ftp_NLST(path)
+        try:
+            if self.fs.isdir(path):
+                listing = self._iter_listing(path, metadata=False)
+            else:
+                self.fs.lstat(path)  # raise exc in case of problems
+                listing = [os.path.basename(path)]
+        except (OSError, FilesystemError) as err:
+            self.respond("550 {}.".format(strerror(err)))
+        else:
+            lines = (
+                (name + "\r\n").encode(self.encoding, self.unicode_errors)
+                for name in listing
+            )
+            producer = BufferedIteratorProducer(lines)
+            self.push_dtp_data(producer, isproducer=True, cmd="NLST")
+            return path
+
+    def ftp_MLSD(self, path):
+        if not hasattr(self.fs, "iter_listdir"):
+            return super().ftp_MLSD(path)
+        # RFC-3659 requires 501 response code if path is not a directory
+        if not self.fs.isdir(path):
+            self.respond("501 No such directory.")
+            return
+        try:
+            listing = self._iter_listing(path)
+        except (OSError, FilesystemError) as err:
+            self.respond("550 {}.".format(strerror(err)))
+        else:
+            perms = self.authorizer.get_perms(self.username)
+            iterator = self.fs.format_mlsx(path, listing, perms, self._current_facts)
+            producer = BufferedIteratorProducer(iterator)
+            self.push_dtp_data(producer, isproducer=True, cmd="MLSD")
+            return path
+
+
+class RestartOffsetMixin:
+    """
+    Mixin class that opens files at the REST offset.
+
+    pyftpdlib opens the file of a resumed RETR from the start and seeks to
+    the offset. StorageFS opens it at the offset instead, so a streamed
+    download from object storage starts with a ranged request at the
+    offset, which also tells the size of the file.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    def ftp_RETR(self, file):
+        rest_pos = self._restart_position
+        if not rest_pos or not isinstance(self.fs, StorageFS):
+            return super().ftp_RETR(file)
+        self._restart_position = 0
+        try:
+            fd = self.run_as_current_user(self.fs.open, file, "rb", rest_pos)
+        except (OSError, FilesystemError) as err:
+            self.respond("550 {}.".format(strerror(err)))
+            return
+        try:
+            try:
+                if isinstance(fd, RangedDownloadReader):
+                    fsize = fd.size
+                else:
+                    fsize = self.fs.getsize(file)
+            except (OSError, FilesystemError) as err:
+                why = strerror(err)
+            else:
+                why = None
+                if rest_pos > fsize:
+                    why = "REST position ({}) > file size ({})".format(rest_pos, fsize)
+            if why is not None:
+                fd.close()
+                self.respond("554 {}".format(why))
+                return
+            producer = FileProducer(fd, self._current_type)
+            self.push_dtp_data(producer, isproducer=True, file=fd, cmd="RETR")
+            return file
+        except Exception:
+            fd.close()
+            raise
+
+
 class SignalEmitterMixin:
     """
     Mixin class that emits Django signals for FTP events.
@@ -233,17 +847,319 @@ class SignalEmitterMixin:
         return result
 
 
-class DjangoFTPHandler(SignalEmitterMixin, FTPHandler):
-    """FTP handler with Django signal support."""
+def connection_was_reset():
+    """return True while an error of a broken connection is handled."""
+    err = sys.exc_info()[1]
+    if err is None:
+        return False
+    if isinstance(err, OSError):
+        return err.errno in CONNECTION_RESET_ERRNOS
+    # pyOpenSSL SysCallError, args are (errno, message)
+    return (
+        type(err).__name__ == "SysCallError"
+        and bool(err.args)
+        and err.args[0] in CONNECTION_RESET_ERRNOS
+    )
+
+
+class UploadCompletionMixin:
+    """
+    Mixin class for data channels that checks the upload before replying.
+
+    Closing the file of an upload may store it, e.g. complete the
+    multipart upload of a MultipartUploadWriter. When that fails, the
+    transfer is answered with 426 and reported as incomplete instead of
+    being answered with 226. Uploads that didn't finish (ABOR, lost
+    connections) are discarded instead of stored.
+
+    pyftpdlib takes any end of the data connection as the end of the
+    file. A connection reset by the network is not: the upload is
+    answered with 426 and discarded too, so that an interrupted upload
+    can be resumed instead of being stored truncated.
+
+    Files with a ``finish_async()`` method, like MultipartUploadWriter,
+    are stored by their thread pool. The channel checks every
+    ``upload_poll_interval`` seconds whether that is done and replies
+    then, so other sessions are served in the meantime.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # seconds between checks for a stored upload
+    upload_poll_interval = 0.005
+
+    _store_poller = None
+
+    def handle_close(self):
+        # recv() calls this from its except clause when the connection
+        # broke, the error is still being handled then
+        if self.receive and not self._closed and connection_was_reset():
+            self._resp = ("426 Connection reset; transfer aborted.", logger.debug)
+            self.close()
+            return
+        super().handle_close()
+
+    def handle_timeout(self):
+        # no data is transferred while the upload is stored
+        if self._store_poller is None:
+            super().handle_timeout()
+
+    def close(self):
+        if self._store_poller is not None:
+            # e.g. the control connection was closed, the upload is still
+            # stored but it's unknown whether that succeeds
+            self._store_poller.cancel()
+            self._store_poller = None
+            self.transfer_finished = False
+            self._resp = ("426 Transfer aborted.", logger.debug)
+            return super().close()
+        file_obj = self.file_obj
+        if (
+            not self._closed
+            and self.receive
+            and file_obj is not None
+            and not file_obj.closed
+        ):
+            if not self.transfer_finished:
+                discard_file(file_obj)
+                return super().close()
+            if hasattr(type(file_obj), "finish_async"):
+                # completes resumed uploads without new data too
+                stored = file_obj.finish_async()
+                self.del_channel()
+                self._store_poller = self.ioloop.call_every(
+                    self.upload_poll_interval,
+                    self._poll_store,
+                    stored,
+                    _errback=self.handle_error,
+                )
+                return
+            if hasattr(type(file_obj), "finish"):
+                self._store_upload(file_obj.finish)
+            else:
+                self._store_upload(file_obj.close)
+        super().close()
+
+    def _poll_store(self, stored):
+        if not stored.done():
+            return
+        self._store_poller.cancel()
+        self._store_poller = None
+        self._store_upload(stored.result)
+        self.close()
+
+    def _store_upload(self, store):
+        """call store(), answer 426 when it fails."""
+        why = None
+        try:
+            store()
+        except OSError as err:
+            logger.warning("Failed to store %s: %s", self.file_obj.name, err)
+            why = strerror(err)
+        except Exception:
+            self.log_exception(self)
+            why = "Internal error"
+        if why is not None:
+            self.transfer_finished = False
+            self._resp = ("426 {}; transfer aborted.".format(why), logger.warning)
+
+
+class UploadBackpressureMixin:
+    """
+    Mixin class for data channels that waits for uploads outside of the
+    IOLoop.
+
+    When the file being received has a ``ready()`` method, like
+    MultipartUploadWriter, and it returns False, the next write would wait
+    for a part still being uploaded. The channel then stops reading, which
+    slows down the client, and checks again every ``upload_poll_interval``
+    seconds, so other sessions are served in the meantime.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # seconds between checks for an uploaded part
+    upload_poll_interval = 0.005
+
+    _upload_poller = None
+
+    def handle_read_event(self):
+        ready = getattr(self.file_obj, "ready", None)
+        if ready is not None and self.receive and not ready():
+            self.del_channel()
+            self._upload_poller = self.ioloop.call_every(
+                self.upload_poll_interval,
+                self._poll_upload,
+                _errback=self.handle_error,
+            )
+            return
+        super().handle_read_event()
+
+    def _poll_upload(self):
+        if not self._closed and not self.file_obj.ready():
+            return
+        self._upload_poller.cancel()
+        self._upload_poller = None
+        if not self._closed:
+            self.add_channel(events=self.ioloop.READ)
+
+    def close(self):
+        if self._upload_poller is not None:
+            self._upload_poller.cancel()
+            self._upload_poller = None
+        super().close()
+
+
+class DownloadReadAheadMixin:
+    """
+    Mixin class for data channels that waits for downloads outside of the
+    IOLoop.
+
+    When the file being sent has a ``ready()`` method, like
+    RangedDownloadReader, and it returns False, the next read would wait
+    for a range still being downloaded. The channel then stops sending
+    and checks again every ``download_poll_interval`` seconds, so other
+    sessions are served in the meantime. Producers with a ``ready()``
+    method, like ReadAheadProducer, are waited for the same way.
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    # seconds between checks for a downloaded range
+    download_poll_interval = 0.005
+
+    _download_poller = None
+
+    def _get_ready(self):
+        """return the ready() method of the producer being sent, or None."""
+        if self.receive or not self.producer_fifo:
+            return None
+        producer = self.producer_fifo[0]
+        if not hasattr(producer, "more"):
+            return None
+        ready = getattr(producer, "ready", None)
+        if ready is None:
+            ready = getattr(self.file_obj, "ready", None)
+        return ready
+
+    def initiate_send(self):
+        if self._download_poller is not None:
+            return
+        ready = self._get_ready()
+        if ready is not None and not ready():
+            self.del_channel()
+            self._download_poller = self.ioloop.call_every(
+                self.download_poll_interval,
+                self._poll_download,
+                _errback=self.handle_error,
+            )
+            return
+        super().initiate_send()
+
+    def _poll_download(self):
+        ready = self._get_ready()
+        if not self._closed and ready is not None and not ready():
+            return
+        self._download_poller.cancel()
+        self._download_poller = None
+        if not self._closed:
+            self.add_channel(events=self.ioloop.WRITE)
+            self.initiate_send()
+
+    def close(self):
+        if self._download_poller is not None:
+            self._download_poller.cancel()
+            self._download_poller = None
+        super().close()
+
+
+class SendfileMixin:
+    """
+    Mixin class for data channels that sends only local files with
+    sendfile().
+
+    pyftpdlib sends any file that has a ``fileno()`` with sendfile(),
+    which copies a file on the local disk to the socket in the kernel.
+    Files of remote storages may have one too, e.g. the spooled temporary
+    file of S3File, which then has to be downloaded completely before the
+    first byte is sent. The ``sendfile`` attribute of the control channel
+    (FTPSERVER_SENDFILE, ``--sendfile``) selects the files:
+
+    * None (default): files on the local disk, like the files StorageFS
+      opens for FileSystemStorage; others are sent with producers.
+    * True: all files that have a file descriptor.
+    * False: none.
+
+    Transfers over TLS and in ASCII mode never use sendfile().
+
+    This mixin is for internal use only. Users should use
+    DjangoFTPHandler or DjangoTLS_FTPHandler directly.
+    """
+
+    def use_sendfile(self):
+        sendfile = getattr(self.cmd_channel, "sendfile", None)
+        if sendfile is not None and not sendfile:
+            return False
+        if not super().use_sendfile():
+            return False
+        return bool(sendfile) or is_local_file(self.file_obj)
+
+
+class DjangoDTPHandler(
+    SendfileMixin,
+    DownloadReadAheadMixin,
+    UploadBackpressureMixin,
+    UploadCompletionMixin,
+    DTPHandler,
+):
+    """Data channel handler of DjangoFTPHandler."""
 
     pass
 
 
+class DjangoFTPHandler(
+    LoginThrottleMixin,
+    DeferredAuthMixin,
+    DeferredStorageMixin,
+    StorageUnavailableMixin,
+    StreamingListMixin,
+    RestartOffsetMixin,
+    SignalEmitterMixin,
+    FTPHandler,
+):
+    """FTP handler with Django signal support."""
+
+    dtp_handler = DjangoDTPHandler
+
+
 if HAS_TLS:
 
-    class DjangoTLS_FTPHandler(SignalEmitterMixin, TLS_FTPHandler):
-        """TLS FTP handler with Django signal support."""
+    class DjangoTLS_DTPHandler(
+        SendfileMixin,
+        DownloadReadAheadMixin,
+        UploadBackpressureMixin,
+        UploadCompletionMixin,
+        TLS_DTPHandler,
+    ):
+        """Data channel handler of DjangoTLS_FTPHandler."""
 
         pass
+
+    class DjangoTLS_FTPHandler(
+        LoginThrottleMixin,
+        DeferredAuthMixin,
+        DeferredStorageMixin,
+        StorageUnavailableMixin,
+        StreamingListMixin,
+        RestartOffsetMixin,
+        SignalEmitterMixin,
+        TLS_FTPHandler,
+    ):
+        """TLS FTP handler with Django signal support."""
+
+        dtp_handler = DjangoTLS_DTPHandler
 else:
-    DjangoTLS_FTPHandler = None
+    DjangoTLS_DTPHandler = DjangoTLS_FTPHandler = None
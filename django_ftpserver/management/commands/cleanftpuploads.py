@@ -0,0 +1,62 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from django_ftpserver import models
+from django_ftpserver.filesystems import StorageFS
+from django_ftpserver.utils import get_ftp_setting
+
+
+class Command(BaseCommand):
+    help = "Abort interrupted FTP uploads that were not resumed in time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            action="store",
+            dest="max_age",
+            type=int,
+            default=None,
+            help="seconds since the last change of an upload to keep it "
+            "(default: FTPSERVER_RESUMABLE_UPLOAD_MAX_AGE).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="list expired uploads without aborting them.",
+        )
+
+    def handle(self, *args, **options):
+        max_age = options.get("max_age")
+        if max_age is None:
+            max_age = get_ftp_setting("FTPSERVER_RESUMABLE_UPLOAD_MAX_AGE")
+        expired = timezone.now() - datetime.timedelta(seconds=max_age)
+        uploads = models.FTPUpload.objects.filter(updated__lt=expired).order_by("pk")
+
+        aborted = failed = 0
+        for upload in uploads.iterator():
+            if options.get("dry_run"):
+                self.stdout.write(
+                    "{0.path} ({0.username}, {0.size} bytes, {0.updated})\n".format(
+                        upload
+                    )
+                )
+                continue
+            try:
+                StorageFS.abort_stored_upload(upload)
+            except Exception as err:
+                failed += 1
+                self.stderr.write(
+                    "Failed to abort upload of {0}: {1}\n".format(upload.path, err)
+                )
+                continue
+            aborted += 1
+
+        if options.get("dry_run"):
+            return
+        self.stdout.write("{count} FTP upload(s) aborted.\n".format(count=aborted))
+        if failed:
+            self.stdout.write("{count} FTP upload(s) failed.\n".format(count=failed))
@@ -17,7 +17,7 @@ class Command(BaseCommand):
         group_name = options.get("group")
         home_dir = options.get("home_dir")
 
-        if models.FTPUserAccount.objects.filter(user__username=username).exists():
+        if models.FTPUserAccount.objects.filter(username=username).exists():
             raise CommandError(
                 'FTP user account "{username}" is already exists.'.format(
                     username=username
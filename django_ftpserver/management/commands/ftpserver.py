@@ -62,7 +62,24 @@ class Command(BaseCommand):
             "--keyfile", action="store", dest="keyfile", help="TLS private key file."
         )
         parser.add_argument(
-            "--sendfile", action="store_true", dest="sendfile", help="Use sendfile."
+            "--sendfile",
+            action="store_true",
+            dest="sendfile",
+            help="Use sendfile for all files, not only for local files.",
+        )
+        parser.add_argument(
+            "--auth-workers",
+            action="store",
+            dest="auth-workers",
+            type=int,
+            help="number of threads for password verification.",
+        )
+        parser.add_argument(
+            "--storage-workers",
+            action="store",
+            dest="storage-workers",
+            type=int,
+            help="number of threads for storage backend calls.",
         )
 
     def _get_option(self, options, option_name, setting_name):
@@ -135,6 +152,12 @@ class Command(BaseCommand):
         certfile = self._get_option(options, "certfile", "FTPSERVER_CERTFILE")
         keyfile = self._get_option(options, "keyfile", "FTPSERVER_KEYFILE")
         sendfile = self._get_option(options, "sendfile", "FTPSERVER_SENDFILE")
+        auth_workers = self._get_option(
+            options, "auth-workers", "FTPSERVER_AUTH_WORKERS"
+        )
+        storage_workers = self._get_option(
+            options, "storage-workers", "FTPSERVER_STORAGE_WORKERS"
+        )
 
         handler_class, handler_options = self._get_handler_class_and_options(
             certfile, keyfile
@@ -152,6 +175,8 @@ class Command(BaseCommand):
             certfile=certfile,
             keyfile=keyfile,
             sendfile=sendfile,
+            auth_workers=auth_workers,
+            storage_workers=storage_workers,
             handler_class=handler_class,
             authorizer_class=authorizer_class,
             filesystem_class=filesystem_class,
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from django_ftpserver import models
+
+
+class Command(BaseCommand):
+    help = "Copy login names of users to FTP user accounts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            dest="batch_size",
+            type=int,
+            default=1000,
+            help="number of accounts updated per query.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options.get("batch_size")
+        accounts = models.FTPUserAccount.objects.select_related("user").order_by("pk")
+
+        updated = 0
+        batch = []
+        for account in accounts.iterator(chunk_size=batch_size):
+            username = account.username
+            account.sync_username()
+            if account.username == username:
+                continue
+            batch.append(account)
+            if len(batch) >= batch_size:
+                updated += len(batch)
+                models.FTPUserAccount.objects.bulk_update(batch, ["username"])
+                batch = []
+        if batch:
+            updated += len(batch)
+            models.FTPUserAccount.objects.bulk_update(batch, ["username"])
+
+        self.stdout.write(
+            "{count} FTP user account(s) updated.\n".format(count=updated)
+        )
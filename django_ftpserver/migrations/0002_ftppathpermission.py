@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_ftpserver", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FTPPathPermission",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "path",
+                    models.CharField(
+                        help_text="Directory relative to the home directory.",
+                        max_length=1024,
+                        verbose_name="Path",
+                    ),
+                ),
+                (
+                    "permission",
+                    models.CharField(
+                        blank=True,
+                        default="elr",
+                        max_length=10,
+                        verbose_name="Permission",
+                    ),
+                ),
+                (
+                    "account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="path_permissions",
+                        to="django_ftpserver.ftpuseraccount",
+                        verbose_name="FTP user account",
+                    ),
+                ),
+                (
+                    "group",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="path_permissions",
+                        to="django_ftpserver.ftpusergroup",
+                        verbose_name="FTP user group",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "FTP path permission",
+                "verbose_name_plural": "FTP path permissions",
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:06
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_username(apps, schema_editor):
+    FTPUserAccount = apps.get_model("django_ftpserver", "FTPUserAccount")
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    # historical models don't keep USERNAME_FIELD, take it from the
+    # installed user model but read the column through the historical one
+    username_field = getattr(User, "USERNAME_FIELD", None)
+    if username_field is None:
+        username_field = global_apps.get_model(settings.AUTH_USER_MODEL).USERNAME_FIELD
+    accounts = FTPUserAccount.objects.select_related("user")
+    batch = []
+    for account in accounts.iterator(chunk_size=1000):
+        account.username = getattr(account.user, username_field)
+        batch.append(account)
+        if len(batch) >= 1000:
+            FTPUserAccount.objects.bulk_update(batch, ["username"])
+            batch = []
+    FTPUserAccount.objects.bulk_update(batch, ["username"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("django_ftpserver", "0002_ftppathpermission"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ftpuseraccount",
+            name="username",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=254,
+                verbose_name="Username",
+            ),
+        ),
+        migrations.RunPython(backfill_username, migrations.RunPython.noop),
+    ]
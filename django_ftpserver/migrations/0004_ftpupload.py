@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_ftpserver", "0003_ftpuseraccount_username"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FTPUpload",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("storage", models.CharField(max_length=255, verbose_name="Storage")),
+                (
+                    "username",
+                    models.CharField(
+                        db_index=True, max_length=254, verbose_name="Username"
+                    ),
+                ),
+                ("path", models.CharField(max_length=1024, verbose_name="Path")),
+                (
+                    "upload_id",
+                    models.CharField(
+                        blank=True, max_length=1024, verbose_name="Upload ID"
+                    ),
+                ),
+                (
+                    "parts",
+                    models.JSONField(blank=True, default=list, verbose_name="Parts"),
+                ),
+                ("size", models.BigIntegerField(default=0, verbose_name="Size")),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created"),
+                ),
+                (
+                    "updated",
+                    models.DateTimeField(
+                        auto_now=True, db_index=True, verbose_name="Updated"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "FTP upload",
+                "verbose_name_plural": "FTP uploads",
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("django_ftpserver", "0004_ftpupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FTPAccountVersion",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0, verbose_name="Version")),
+            ],
+            options={
+                "verbose_name": "FTP account version",
+                "verbose_name_plural": "FTP account versions",
+            },
+        ),
+    ]
@@ -1,11 +1,16 @@
 import os
+import posixpath
 
 from django.db import models
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db.models.signals import post_delete, post_save
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .cache import invalidate_accounts
+from .permissions import PermissionTrie, permission_mask
+
 
 class FTPUserGroup(models.Model):
     name = models.CharField(
@@ -37,6 +42,10 @@ class FTPUserAccount(models.Model):
         blank=False,
         on_delete=models.CASCADE,
     )
+    # copy of user.get_username() so that logins look up one indexed column
+    username = models.CharField(
+        _("Username"), max_length=254, editable=False, blank=True, db_index=True
+    )
     last_login = models.DateTimeField(_("Last login"), editable=False, null=True)
     home_dir = models.CharField(
         _("Home directory"), max_length=1024, null=True, blank=True
@@ -49,6 +58,28 @@ class FTPUserAccount(models.Model):
             user = None
         return "{0}".format(user)
 
+    # user_id the username column was last copied for, see save()
+    _synced_user_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(FTPUserAccount, cls).from_db(db, field_names, values)
+        instance._synced_user_id = instance.__dict__.get("user_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        # renames of the user are copied by sync_account_username, so the
+        # user is only loaded for a new or changed user or a missing username
+        if not self.username or self.user_id != self._synced_user_id:
+            self.sync_username()
+        super(FTPUserAccount, self).save(*args, **kwargs)
+
+    def sync_username(self):
+        """copy the login name of the user to the username column."""
+        if self.user_id is not None:
+            self.username = self.user.get_username()
+            self._synced_user_id = self.user_id
+
     def get_username(self):
         try:
             user = self.user
@@ -71,11 +102,185 @@ class FTPUserAccount(models.Model):
         return directory.format(username=self.get_username())
 
     def has_perm(self, perm, path):
-        return perm in self.get_perms()
+        return self.get_permission_trie().has_perm(perm, path)
 
     def get_perms(self):
         return self.group.permission
 
+    def get_permission_trie(self):
+        """return PermissionTrie of group and path permissions.
+
+        The trie is compiled on first use and kept on this instance.
+        """
+        trie = getattr(self, "_permission_trie", None)
+        if trie is None:
+            trie = self.compile_permissions()
+        return trie
+
+    def compile_permissions(self, rules=None):
+        """compile group permission and FTPPathPermission rules into a trie.
+
+        Rule paths are relative to the home directory. Account rules take
+        precedence over group rules for the same path. The rules of this
+        account and its group are queried unless given as rules.
+        """
+        trie = PermissionTrie(permission_mask(self.get_perms()))
+        if rules is None:
+            query = models.Q()
+            if self.group_id is not None:
+                query |= models.Q(group_id=self.group_id)
+            if self.pk is not None:
+                query |= models.Q(account_id=self.pk)
+            rules = FTPPathPermission.objects.filter(query) if query else []
+        if rules:
+            home_dir = self.get_home_dir()
+            for rule in sorted(rules, key=lambda rule: rule.account_id is not None):
+                path = posixpath.join(home_dir, rule.path.lstrip("/"))
+                trie.add(path, permission_mask(rule.permission))
+        self._permission_trie = trie
+        return trie
+
     class Meta:
         verbose_name = _("FTP user account")
         verbose_name_plural = _("FTP user accounts")
+
+
+class FTPPathPermission(models.Model):
+    group = models.ForeignKey(
+        FTPUserGroup,
+        verbose_name=_("FTP user group"),
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="path_permissions",
+    )
+    account = models.ForeignKey(
+        FTPUserAccount,
+        verbose_name=_("FTP user account"),
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="path_permissions",
+    )
+    path = models.CharField(
+        _("Path"),
+        max_length=1024,
+        help_text=_("Directory relative to the home directory."),
+    )
+    permission = models.CharField(
+        _("Permission"), max_length=10, null=False, blank=True, default="elr"
+    )
+
+    def __str__(self):
+        return "{0} {1}".format(self.path, self.permission)
+
+    def clean(self):
+        if (self.group_id is None) == (self.account_id is None):
+            raise ValidationError(_("Set either FTP user group or FTP user account."))
+
+    class Meta:
+        verbose_name = _("FTP path permission")
+        verbose_name_plural = _("FTP path permissions")
+
+
+class FTPUpload(models.Model):
+    """State of an interrupted multipart upload to object storage.
+
+    Kept while the upload can be resumed by REST+STOR or APPE of the same
+    account, see StorageFS.open_upload().
+    """
+
+    storage = models.CharField(_("Storage"), max_length=255)
+    username = models.CharField(_("Username"), max_length=254, db_index=True)
+    path = models.CharField(_("Path"), max_length=1024)
+    upload_id = models.CharField(_("Upload ID"), max_length=1024, blank=True)
+    # [result of upload_part, size] of the stored parts, in order
+    parts = models.JSONField(_("Parts"), default=list, blank=True)
+    size = models.BigIntegerField(_("Size"), default=0)
+    created = models.DateTimeField(_("Created"), auto_now_add=True)
+    updated = models.DateTimeField(_("Updated"), auto_now=True, db_index=True)
+
+    def __str__(self):
+        return "{0} {1}".format(self.path, self.username)
+
+    class Meta:
+        verbose_name = _("FTP upload")
+        verbose_name_plural = _("FTP uploads")
+
+
+class FTPAccountVersion(models.Model):
+    """Counter bumped whenever FTP accounts or their users change.
+
+    SnapshotAccountAuthorizer polls it and reloads its snapshot only after
+    a change, made in this or another process.
+    """
+
+    version = models.BigIntegerField(_("Version"), default=0)
+
+    def __str__(self):
+        return "{0}".format(self.version)
+
+    @classmethod
+    def get_version(cls):
+        """return the current version, 0 before the first change."""
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=models.F("version") + 1):
+            cls.objects.get_or_create(pk=1, defaults={"version": 1})
+
+    class Meta:
+        verbose_name = _("FTP account version")
+        verbose_name_plural = _("FTP account versions")
+
+
+def bump_account_version(sender, update_fields=None, **kwargs):
+    """bump FTPAccountVersion when rows of the account snapshot change."""
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    FTPAccountVersion.bump()
+
+
+def sync_account_username(sender, instance, update_fields=None, **kwargs):
+    """update FTPUserAccount.username when the login name of a user changes."""
+    if update_fields is not None and instance.USERNAME_FIELD not in update_fields:
+        return
+    username = instance.get_username()
+    FTPUserAccount.objects.filter(user_id=instance.pk).exclude(
+        username=username
+    ).update(username=username)
+
+
+post_save.connect(
+    sync_account_username,
+    sender=settings.AUTH_USER_MODEL,
+    dispatch_uid="django_ftpserver.sync_account_username",
+)
+
+for _sender in (
+    FTPUserAccount,
+    FTPUserGroup,
+    FTPPathPermission,
+    settings.AUTH_USER_MODEL,
+):
+    post_save.connect(
+        invalidate_accounts,
+        sender=_sender,
+        dispatch_uid="django_ftpserver.invalidate_accounts",
+    )
+    post_delete.connect(
+        invalidate_accounts,
+        sender=_sender,
+        dispatch_uid="django_ftpserver.invalidate_accounts",
+    )
+    post_save.connect(
+        bump_account_version,
+        sender=_sender,
+        dispatch_uid="django_ftpserver.bump_account_version",
+    )
+    post_delete.connect(
+        bump_account_version,
+        sender=_sender,
+        dispatch_uid="django_ftpserver.bump_account_version",
+    )
@@ -0,0 +1,68 @@
+"""
+Path-scoped permissions.
+
+Permissions are the letters used by pyftpdlib ("elradfmwMT"). A
+PermissionTrie maps path prefixes to permission bitmasks so that a
+permission check walks one node per path component.
+"""
+
+PERMISSIONS = "elradfmwMT"
+PERMISSION_BITS = {perm: 1 << index for index, perm in enumerate(PERMISSIONS)}
+
+
+def permission_mask(permission):
+    """return bitmask for a permission string such as "elr"."""
+    mask = 0
+    for perm in permission or "":
+        mask |= PERMISSION_BITS.get(perm, 0)
+    return mask
+
+
+def split_path(path):
+    """return the components of path."""
+    return [name for name in path.replace("\\", "/").split("/") if name and name != "."]
+
+
+class _Node:
+    __slots__ = ("mask", "children")
+
+    def __init__(self, mask=None):
+        self.mask = mask
+        self.children = {}
+
+
+class PermissionTrie:
+    """Prefix tree of permission bitmasks.
+
+    The root holds the default permissions. lookup() returns the mask of
+    the deepest path added with add() that is a prefix of the given path.
+    """
+
+    def __init__(self, mask=0):
+        self._root = _Node(mask)
+
+    def add(self, path, mask):
+        """set the permission bitmask for path and everything below it."""
+        node = self._root
+        for name in split_path(path):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _Node()
+            node = child
+        node.mask = mask
+
+    def lookup(self, path):
+        """return the permission bitmask for path."""
+        node = self._root
+        mask = node.mask
+        for name in split_path(path):
+            node = node.children.get(name)
+            if node is None:
+                break
+            if node.mask is not None:
+                mask = node.mask
+        return mask
+
+    def has_perm(self, perm, path):
+        """return True if perm (a single letter) is granted for path."""
+        return bool(self.lookup(path or "") & PERMISSION_BITS.get(perm, 0))
@@ -0,0 +1,406 @@
+"""
+Storage backend resilience.
+
+StorageGuard wraps the backend calls made by StorageFS: calls get a
+deadline, idempotent calls that fail with a transient error are retried
+after a jittered exponential backoff, and a circuit breaker stops calling
+a backend that keeps failing, so that commands are answered with 451
+right away instead of waiting for it.
+"""
+
+import logging
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .utils import get_ftp_setting
+
+logger = logging.getLogger(__name__)
+
+# threads running the IOLoop of a server, which must not sleep between
+# retries; see mark_loop_thread()
+_loop_threads = weakref.WeakSet()
+
+# names of exception classes (or of their bases) raised for transient
+# errors; matched by name so that botocore, requests or urllib3 don't
+# have to be installed
+TRANSIENT_ERRORS = frozenset(
+    (
+        "ConnectionError",  # builtin, botocore and requests
+        "TimeoutError",
+        "Timeout",  # requests
+        "ReadTimeoutError",  # botocore and urllib3
+        "ConnectTimeoutError",
+        "ProtocolError",  # urllib3
+    )
+)
+
+# error codes of S3 responses that are worth retrying
+TRANSIENT_CODES = frozenset(
+    (
+        "InternalError",
+        "RequestTimeout",
+        "RequestLimitExceeded",
+        "ServiceUnavailable",
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+    )
+)
+
+
+class StorageUnavailable(Exception):
+    """The storage backend can't serve a request right now.
+
+    DjangoFTPHandler and DjangoTLS_FTPHandler answer commands failing with
+    this error with 451, so clients retry them later.
+    """
+
+
+class StorageTimeout(StorageUnavailable):
+    """A storage backend call didn't finish before its deadline."""
+
+
+def is_transient(err):
+    """return True if err is a temporary backend failure."""
+    if {cls.__name__ for cls in type(err).__mro__} & TRANSIENT_ERRORS:
+        return True
+    response = getattr(err, "response", None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if response.get("Error", {}).get("Code") in TRANSIENT_CODES:
+            return True
+    else:
+        # google.api_core GoogleAPICallError
+        status = getattr(err, "code", None)
+    return isinstance(status, int) and (status >= 500 or status == 429)
+
+
+def discard_file(file):
+    """close a file that is not used, without storing written data.
+
+    Files that can be dropped without storing them, like
+    MultipartUploadWriter, have a discard() method.
+    """
+    if hasattr(type(file), "discard"):
+        file.discard()
+    elif hasattr(file, "close"):
+        file.close()
+
+
+def close_abandoned(future):
+    """close a file opened by a backend call nobody waits for anymore."""
+    if future.exception() is None:
+        discard_file(future.result())
+
+
+class CircuitBreaker:
+    """Stop calling a backend that keeps failing.
+
+    The breaker opens after ``failure_threshold`` consecutive failed
+    calls; allow() then returns False until ``reset_timeout`` seconds have
+    passed. The next call is let through as a probe (half open): its
+    success closes the breaker, its failure opens it again. Another probe
+    is let through when a probe didn't report within ``reset_timeout``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._changed = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """return True if a call may be made now."""
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._changed < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._changed = now
+            return True
+
+    def is_open(self):
+        """return True while calls are rejected."""
+        return (
+            self.state != self.CLOSED
+            and time.monotonic() - self._changed < self.reset_timeout
+        )
+
+    def record_success(self):
+        if self.state == self.CLOSED and not self.failures:
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Storage backend recovered, circuit breaker closed.")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    "Storage backend failed %d times, circuit breaker opened.",
+                    self.failures,
+                )
+                self.state = self.OPEN
+                self._changed = time.monotonic()
+                self.opened += 1
+
+    def get_stats(self):
+        """return counters for monitoring."""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class StorageGuard:
+    """Deadlines, retries and a circuit breaker for calls to one storage.
+
+    call() runs a backend call for an operation, named after the StorageFS
+    method:
+
+    * with a deadline in ``deadlines`` (seconds per operation name, the
+      ``"default"`` entry for others), the call runs in a worker thread
+      and StorageTimeout is raised when it doesn't finish in time. The
+      call itself can't be interrupted and finishes in the background.
+    * idempotent calls that fail with a transient error are retried up to
+      ``retries`` times, after sleeping a random time of up to
+      ``backoff * 2 ** attempt`` seconds (at most ``max_backoff``), while
+      the deadline allows it. When retries are used up, StorageUnavailable
+      is raised. Calls made in the IOLoop of a running server are not
+      retried, so other sessions don't wait for the backoff; they fail
+      with StorageUnavailable (451) right away.
+    * calls that time out or fail with a transient error count as
+      failures of ``breaker``. While it is open, calls raise
+      StorageUnavailable without reaching the backend.
+
+    Calls made while another call of the guard runs in the same thread,
+    e.g. StorageFS.stat() calling getsize(), are made directly.
+    """
+
+    max_backoff = 2.0
+    # threads used to enforce deadlines, shared by all guards
+    deadline_workers = 32
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, deadlines=None, retries=2, backoff=0.1, breaker=None):
+        self.deadlines = deadlines or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.calls = 0
+        self.retried = 0
+        self.failures = 0
+        self.timeouts = 0
+        self._latency = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.deadline_workers,
+                    thread_name_prefix="ftp-storage-deadline",
+                )
+        return cls._executor
+
+    def call(self, operation, func, *args, idempotent=False):
+        """return func(*args), guarded as described above."""
+        if getattr(self._local, "active", False):
+            return func(*args)
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            raise StorageUnavailable("Storage backend unavailable")
+        self.calls += 1
+        timeout = self.deadlines.get(operation, self.deadlines.get("default"))
+        start = time.monotonic()
+        deadline = start + timeout if timeout else None
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = self._attempt(func, args, deadline)
+                except StorageTimeout:
+                    self.timeouts += 1
+                    self._record_failure(operation)
+                    raise
+                except Exception as err:
+                    if not is_transient(err):
+                        # the backend answered
+                        if breaker is not None:
+                            breaker.record_success()
+                        raise
+                    delay = random.uniform(
+                        0, min(self.max_backoff, self.backoff * 2**attempt)
+                    )
+                    if (
+                        not idempotent
+                        or attempt >= self.retries
+                        or in_loop_thread()
+                        or (
+                            deadline is not None
+                            and time.monotonic() + delay >= deadline
+                        )
+                    ):
+                        self._record_failure(operation)
+                        raise StorageUnavailable("Storage backend unavailable") from err
+                    logger.info("Retrying storage call %s: %r", operation, err)
+                    attempt += 1
+                    self.retried += 1
+                    time.sleep(delay)
+                    continue
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+        finally:
+            self._record_latency(operation, time.monotonic() - start)
+
+    def _attempt(self, func, args, deadline):
+        if deadline is None:
+            return self._run(func, args)
+        future = self.get_executor().submit(self._run, func, args)
+        try:
+            return future.result(max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            if not future.cancel():
+                future.add_done_callback(close_abandoned)
+            raise StorageTimeout("Storage request timed out") from None
+
+    def _run(self, func, args):
+        local = self._local
+        local.active = True
+        try:
+            return func(*args)
+        finally:
+            local.active = False
+
+    def iterate(self, operation, iterable):
+        """yield from iterable, counting transient errors as failures.
+
+        Entries already yielded can't be taken back, so errors are not
+        retried; StorageFS fetches the first entry with call().
+        """
+        try:
+            yield from iterable
+        except Exception as err:
+            if not is_transient(err):
+                raise
+            self._record_failure(operation)
+            raise StorageUnavailable("Storage backend unavailable") from err
+
+    def _record_failure(self, operation):
+        logger.warning("Storage call %s failed.", operation)
+        self.failures += 1
+        if self.breaker is not None:
+            self.breaker.record_failure()
+
+    def _record_latency(self, operation, elapsed):
+        with self._lock:
+            entry = self._latency.get(operation)
+            if entry is None:
+                entry = self._latency[operation] = [0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+
+    def get_stats(self):
+        """return counters and latencies (in seconds) for monitoring."""
+        with self._lock:
+            latency = {
+                operation: {"count": count, "mean": total / count, "max": longest}
+                for operation, (count, total, longest) in self._latency.items()
+            }
+        stats = {
+            "calls": self.calls,
+            "retries": self.retried,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "latency": latency,
+        }
+        if self.breaker is not None:
+            stats["breaker"] = self.breaker.get_stats()
+        return stats
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_storage_guard(name):
+    """return the StorageGuard of storage name, or None if not enabled.
+
+    Guards are shared by all sessions of the process and configured with
+    the FTPSERVER_STORAGE_* settings.
+    """
+    deadlines = dict(get_ftp_setting("FTPSERVER_STORAGE_DEADLINES"))
+    if get_ftp_setting("FTPSERVER_STORAGE_DEADLINE"):
+        deadlines.setdefault("default", get_ftp_setting("FTPSERVER_STORAGE_DEADLINE"))
+    config = (
+        deadlines,
+        get_ftp_setting("FTPSERVER_STORAGE_RETRIES"),
+        get_ftp_setting("FTPSERVER_STORAGE_RETRY_BACKOFF"),
+        get_ftp_setting("FTPSERVER_STORAGE_BREAKER_THRESHOLD"),
+        get_ftp_setting("FTPSERVER_STORAGE_BREAKER_RESET"),
+    )
+    if not (config[0] or config[1] or config[3]):
+        return None
+    entry = _guards.get(name)
+    if entry is None or entry[0] != config:
+        with _guards_lock:
+            entry = _guards.get(name)
+            if entry is None or entry[0] != config:
+                breaker = None
+                if config[3]:
+                    breaker = CircuitBreaker(config[3], reset_timeout=config[4])
+                guard = StorageGuard(
+                    deadlines, retries=config[1], backoff=config[2], breaker=breaker
+                )
+                entry = _guards[name] = (config, guard)
+    return entry[1]
+
+
+def mark_loop_thread():
+    """remember the current thread as running an IOLoop.
+
+    The handlers of DjangoFTPHandler mark the thread their connection is
+    accepted in, whichever way the server was started. Threads are
+    forgotten when they end.
+    """
+    _loop_threads.add(threading.current_thread())
+
+
+def unmark_loop_thread():
+    _loop_threads.discard(threading.current_thread())
+
+
+def in_loop_thread():
+    """return True if the current thread runs an IOLoop."""
+    return threading.current_thread() in _loop_threads
@@ -35,6 +35,8 @@ class FTPServerConfig:
     certfile: Optional[str] = None
     keyfile: Optional[str] = None
     sendfile: Optional[bool] = None
+    auth_workers: Optional[int] = None
+    storage_workers: Optional[int] = None
     # Class specifications (string path or class)
     server_class: Union[str, Type, None] = None
     handler_class: Union[str, Type, None] = None
@@ -92,6 +94,10 @@ class FTPServerRunner:
             handler_options["keyfile"] = config.keyfile
         if config.sendfile is not None:
             handler_options["sendfile"] = config.sendfile
+        if config.auth_workers is not None:
+            handler_options["auth_workers"] = config.auth_workers
+        if config.storage_workers is not None:
+            handler_options["storage_workers"] = config.storage_workers
 
         server_class = config.server_class
         if isinstance(server_class, str):
@@ -0,0 +1,101 @@
+"""
+Login throttling.
+
+This module provides a token bucket throttle keyed by remote IP address and
+username. It is used by DjangoFTPHandler and DjangoTLS_FTPHandler to reject
+login attempts before any password hashing or database work is done.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LoginThrottle:
+    """Token bucket login throttle keyed by remote IP and username.
+
+    Every login attempt takes one token from the bucket of the remote IP
+    and one from the bucket of the username. Buckets hold up to ``burst``
+    tokens and refill at ``rate`` tokens per second. An attempt is rejected
+    when either bucket is empty.
+
+    Failed attempts also make the 530 reply slower: the delay starts at
+    ``base_delay`` seconds and doubles with every consecutive failure up to
+    ``max_delay``.
+
+    At most ``max_entries`` buckets are kept, least recently used buckets
+    are evicted first.
+    """
+
+    def __init__(self, rate, burst=10, base_delay=3, max_delay=30, max_entries=10000):
+        self.rate = rate
+        self.burst = burst
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_entries = max_entries
+        self.allowed = 0
+        self.rejected = 0
+        self.failures = 0
+        self.evicted = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_entry(self, key, now):
+        """return [tokens, updated, failures] for key, refilled up to now."""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [float(self.burst), now, 0]
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._entries.move_to_end(key)
+            entry[0] = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+            entry[1] = now
+        return entry
+
+    def _get_entries(self, remote_ip, username):
+        now = time.monotonic()
+        return (
+            self._get_entry(("ip", remote_ip), now),
+            self._get_entry(("user", username), now),
+        )
+
+    def allow(self, remote_ip, username):
+        """return True and take a token if a login attempt is allowed."""
+        with self._lock:
+            entries = self._get_entries(remote_ip, username)
+            if any(entry[0] < 1 for entry in entries):
+                self.rejected += 1
+                return False
+            for entry in entries:
+                entry[0] -= 1
+            self.allowed += 1
+            return True
+
+    def failure_delay(self, remote_ip, username):
+        """record a failed attempt and return the delay for the reply."""
+        with self._lock:
+            self.failures += 1
+            count = 0
+            for entry in self._get_entries(remote_ip, username):
+                entry[2] += 1
+                count = max(count, entry[2])
+        return min(self.base_delay * 2 ** (count - 1), self.max_delay)
+
+    def success(self, remote_ip, username):
+        """reset consecutive failures after a successful login."""
+        with self._lock:
+            for entry in self._get_entries(remote_ip, username):
+                entry[2] = 0
+
+    def get_stats(self):
+        """return counters for monitoring."""
+        return {
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "evicted": self.evicted,
+            "entries": len(self._entries),
+        }
@@ -12,6 +12,38 @@ FTPSERVER_DEFAULTS = {
     "FTPSERVER_CERTFILE": None,
     "FTPSERVER_KEYFILE": None,
     "FTPSERVER_SENDFILE": None,
+    "FTPSERVER_AUTH_WORKERS": None,
+    "FTPSERVER_STORAGE_WORKERS": None,
+    "FTPSERVER_STORAGE_TIMEOUT": 30,
+    "FTPSERVER_STORAGE_DEADLINE": None,
+    "FTPSERVER_STORAGE_DEADLINES": {},
+    "FTPSERVER_STORAGE_RETRIES": 0,
+    "FTPSERVER_STORAGE_RETRY_BACKOFF": 0.1,
+    "FTPSERVER_STORAGE_BREAKER_THRESHOLD": 0,
+    "FTPSERVER_STORAGE_BREAKER_RESET": 30,
+    "FTPSERVER_UPLOAD_PART_SIZE": 8 * 1024 * 1024,
+    "FTPSERVER_UPLOAD_CONCURRENCY": 4,
+    "FTPSERVER_RESUMABLE_UPLOADS": False,
+    "FTPSERVER_RESUMABLE_UPLOAD_MAX_AGE": 7 * 24 * 60 * 60,
+    "FTPSERVER_DOWNLOAD_CHUNK_SIZE": 1024 * 1024,
+    "FTPSERVER_DOWNLOAD_READ_AHEAD": 2,
+    "FTPSERVER_AUTH_CACHE_TIMEOUT": None,
+    "FTPSERVER_AUTH_CACHE_SIZE": 1024,
+    "FTPSERVER_LAST_LOGIN_FLUSH_INTERVAL": 10,
+    "FTPSERVER_DB_CHECK_INTERVAL": 30,
+    "FTPSERVER_LOGIN_THROTTLE_RATE": None,
+    "FTPSERVER_LOGIN_THROTTLE_BURST": 10,
+    "FTPSERVER_LOGIN_THROTTLE_MAX_DELAY": 30,
+    "FTPSERVER_LOGIN_THROTTLE_SIZE": 10000,
+    "FTPSERVER_SNAPSHOT_REFRESH_INTERVAL": 60,
+    "FTPSERVER_METADATA_CACHE_TIMEOUT": None,
+    "FTPSERVER_LIST_SORT_LIMIT": 10000,
+    "FTPSERVER_LISTING_CACHE_TIMEOUT": None,
+    "FTPSERVER_LISTING_CACHE_SIZE": 100000,
+    "FTPSERVER_INOTIFY": False,
+    "FTPSERVER_INOTIFY_MAX_WATCHES": 8192,
+    "FTPSERVER_CACHE": None,
+    "FTPSERVER_CACHE_TIMEOUT": 60,
     "FTPSERVER_DAEMONIZE": False,
     "FTPSERVER_DAEMONIZE_OPTIONS": {},
     "FTPSERVER_PIDFILE": None,
@@ -95,6 +127,7 @@ def make_server(
       * masquerade_address
       * certfile
       * keyfile
+      * auth_workers
     """
     if isinstance(handler_class, str):
         handler_class = import_class(handler_class)
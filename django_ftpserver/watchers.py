@@ -0,0 +1,188 @@
+"""
+Filesystem change notification.
+
+InotifyWatcher uses the Linux inotify API to count changes per directory.
+StorageFS stores these counters with cached listings and metadata of
+FileSystemStorage paths, so cached values stay valid until the kernel
+reports a change, including changes made by other processes.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform.")
+        _libc = libc
+    return _libc
+
+
+class InotifyWatcher:
+    """Count changes of directories with inotify.
+
+    version() starts watching a directory and returns a token that changes
+    whenever an entry of the directory is created, deleted, renamed,
+    written or has its attributes changed. At most ``max_watches``
+    directories are watched; version() returns None for others.
+
+    The watcher can be registered with a pyftpdlib IOLoop, which then reads
+    the events as they arrive.
+    """
+
+    def __init__(self, max_watches=8192):
+        self.max_watches = max_watches
+        self.events = 0
+        self.overflows = 0
+        self.ioloop = None
+        self._libc = _get_libc()
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._paths = {}  # watched path -> watch descriptor
+        self._watches = {}  # watch descriptor -> path
+        self._versions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def version(self, path):
+        """return the change token of directory path, or None."""
+        path = os.path.normpath(path)
+        with self._lock:
+            self._read_events()
+            if path not in self._paths:
+                if len(self._paths) >= self.max_watches:
+                    return None
+                wd = self._libc.inotify_add_watch(
+                    self._fd, os.fsencode(path), WATCH_MASK
+                )
+                if wd < 0:
+                    return None
+                self._paths[path] = wd
+                self._watches[wd] = path
+            return self._generation, self._versions.get(path, 0)
+
+    def read_events(self):
+        """read pending events and update the change counters."""
+        with self._lock:
+            self._read_events()
+
+    def _read_events(self):
+        while self._fd >= 0:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                self._handle_event(wd, mask, os.fsdecode(name))
+
+    def _handle_event(self, wd, mask, name):
+        self.events += 1
+        if mask & IN_Q_OVERFLOW:
+            # events were lost, every token changes
+            self.overflows += 1
+            self._generation += 1
+            return
+        path = self._watches.get(wd)
+        if path is None:
+            return
+        self._bump(path)
+        if name and mask & IN_ISDIR:
+            # a subdirectory was created, deleted or renamed
+            self._bump(os.path.join(path, name))
+        if mask & IN_IGNORED:
+            # the watch was removed, e.g. because the directory is gone
+            del self._watches[wd]
+            del self._paths[path]
+
+    def _bump(self, path):
+        self._versions[path] = self._versions.get(path, 0) + 1
+
+    def register(self, ioloop):
+        """read events whenever the IOLoop reports the inotify fd readable."""
+        self.ioloop = ioloop
+        ioloop.register(self._fd, self, ioloop.READ)
+
+    def get_stats(self):
+        """return counters for monitoring."""
+        return {
+            "watches": len(self._paths),
+            "events": self.events,
+            "overflows": self.overflows,
+        }
+
+    # --- IOLoop handler interface
+
+    def fileno(self):
+        return self._fd
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_read_event(self):
+        self.read_events()
+
+    def handle_error(self):
+        logger.exception("Failed to read inotify events.")
+
+    def handle_close(self):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._fd < 0:
+                return
+            if self.ioloop is not None:
+                self.ioloop.unregister(self._fd)
+                self.ioloop = None
+            os.close(self._fd)
+            self._fd = -1
@@ -65,6 +65,20 @@ class FTPAccountAuthorizerGetAccountTest(FTPAccountAuthorizerTestBase):
         target = authorizer.get_account("user1")
         self.assertEqual(target.user.username, "user1")
 
+    def test_duplicate_username(self):
+        from django_ftpserver import models
+
+        user2 = self._getUser(username="user2")
+        user2.save()
+        self._getAccount(user=user2, group=self.group).save()
+        models.FTPUserAccount.objects.filter(user=user2).update(username="user1")
+
+        authorizer = self._getOne()
+        with self.assertLogs("django_ftpserver.authorizers", "ERROR"):
+            self.assertIsNone(authorizer.get_account("user1"))
+        with self.assertLogs("django_ftpserver.authorizers", "ERROR"):
+            self.assertIsNone(authorizer.get_credentials("user1"))
+
 
 class FTPAccountAuthorizerValidateAuthenticationTest(FTPAccountAuthorizerTestBase):
     """Test for FTPAccountAuthorizer.validate_authentication"""
@@ -111,3 +125,732 @@ class FTPAccountAuthorizerGetHomeDirTest(FTPAccountAuthorizerTestBase):
     def test_get_home_dir(self):
         authorizer = self._getOne()
         self.assertEqual(authorizer.get_home_dir("user1"), "/tmp/user1/")
+
+
+class FTPAccountAuthorizerSessionAccountTest(FTPAccountAuthorizerTestBase):
+    """Test for the account snapshot used by has_perm/get_perms"""
+
+    def setUp(self):
+        self.user = self._getUser(username="user1")
+        self.user.set_password("password1")
+        self.user.save()
+        self.group = self._getGroup(name="group1", permission="elr")
+        self.group.save()
+        self.account = self._getAccount(user=self.user, group=self.group)
+        self.account.save()
+
+    def _login(self, authorizer):
+        authorizer.validate_authentication("user1", "password1", None)
+        authorizer.get_home_dir("user1")
+        authorizer.get_msg_login("user1")
+
+    def test_has_perm_without_queries(self):
+        authorizer = self._getOne()
+        self._login(authorizer)
+        with self.assertNumQueries(0):
+            self.assertTrue(authorizer.has_perm("user1", "r", "/"))
+            self.assertFalse(authorizer.has_perm("user1", "w", "/"))
+            self.assertEqual(authorizer.get_perms("user1"), "elr")
+
+    def test_group_change_refreshes_snapshot(self):
+        authorizer = self._getOne()
+        self._login(authorizer)
+        self.group.permission = "elradfmw"
+        self.group.save()
+        self.assertTrue(authorizer.has_perm("user1", "w", "/"))
+        with self.assertNumQueries(0):
+            self.assertTrue(authorizer.has_perm("user1", "w", "/"))
+
+    def test_account_delete_drops_snapshot(self):
+        authorizer = self._getOne()
+        self._login(authorizer)
+        self.account.delete()
+        self.assertFalse(authorizer.has_perm("user1", "r", "/"))
+
+    def test_cache_size(self):
+        authorizer = self._getOne()
+        authorizer.account_cache_size = 1
+        authorizer._cache_account("user1", self.account)
+        authorizer._cache_account("user2", self.account)
+        self.assertEqual(list(authorizer._accounts), ["user2"])
+
+
+class FTPAccountAuthorizerLoginTest(FTPAccountAuthorizerTestBase):
+    """Test for the login path of FTPAccountAuthorizer"""
+
+    def setUp(self):
+        self.user = self._getUser(username="user1")
+        self.user.set_password("password1")
+        self.user.save()
+        self.group = self._getGroup(name="group1", home_dir="/tmp/{username}/")
+        self.group.save()
+        self.account = self._getAccount(user=self.user, group=self.group)
+        self.account.save()
+
+    def test_queries_until_last_login(self):
+        authorizer = self._getOne()
+        # account with user and group, then its path permissions
+        with self.assertNumQueries(2):
+            authorizer.validate_authentication("user1", "password1", None)
+            self.assertEqual(authorizer.get_home_dir("user1"), "/tmp/user1/")
+            self.assertTrue(authorizer.has_user("user1"))
+
+    def test_wrong_password(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        authorizer = self._getOne()
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "wrong", None)
+        self.assertNotIn("user1", authorizer._accounts)
+
+    def test_unknown_user(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        authorizer = self._getOne()
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("nobody", "password1", None)
+
+    def test_inactive_user(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        self.user.is_active = False
+        self.user.save()
+        authorizer = self._getOne()
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "password1", None)
+
+
+class CredentialCacheTest(TestCase):
+    """Test for CredentialCache"""
+
+    def _getOne(self, timeout=60, max_size=2):
+        from django_ftpserver.authorizers import CredentialCache
+
+        return CredentialCache(timeout, max_size=max_size)
+
+    def test_check(self):
+        cache = self._getOne()
+        cache.add("user1", "password1", "hash1")
+        self.assertTrue(cache.check("user1", "password1", "hash1"))
+        self.assertFalse(cache.check("user1", "wrong", "hash1"))
+        self.assertFalse(cache.check("user2", "password1", "hash1"))
+
+    def test_password_hash_changed(self):
+        cache = self._getOne()
+        cache.add("user1", "password1", "hash1")
+        self.assertFalse(cache.check("user1", "password1", "hash2"))
+        self.assertFalse(cache.check("user1", "password1", "hash1"))
+
+    def test_expired(self):
+        cache = self._getOne(timeout=0)
+        cache.add("user1", "password1", "hash1")
+        self.assertFalse(cache.check("user1", "password1", "hash1"))
+
+    def test_lru_eviction(self):
+        cache = self._getOne(max_size=2)
+        cache.add("user1", "password1", "hash1")
+        cache.add("user2", "password2", "hash2")
+        cache.check("user1", "password1", "hash1")
+        cache.add("user3", "password3", "hash3")
+        self.assertTrue(cache.check("user1", "password1", "hash1"))
+        self.assertFalse(cache.check("user2", "password2", "hash2"))
+
+    def test_password_not_stored(self):
+        cache = self._getOne()
+        cache.add("user1", "password1", "hash1")
+        self.assertNotIn(b"password1", repr(cache._entries).encode())
+
+
+class FTPAccountAuthorizerCredentialCacheTest(FTPAccountAuthorizerTestBase):
+    """Test for FTPAccountAuthorizer with FTPSERVER_AUTH_CACHE_TIMEOUT"""
+
+    def setUp(self):
+        self.user = self._getUser(username="user1")
+        self.user.set_password("password1")
+        self.user.save()
+        self.group = self._getGroup(name="group1")
+        self.group.save()
+        self.account = self._getAccount(user=self.user, group=self.group)
+        self.account.save()
+
+    def _login(self, authorizer, password="password1"):
+        authorizer.validate_authentication("user1", password, None)
+        authorizer.get_home_dir("user1")
+        authorizer.get_msg_login("user1")
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(self._getOne().credential_cache)
+
+    def test_repeated_login_skips_hashing(self):
+        from unittest import mock
+
+        with self.settings(FTPSERVER_AUTH_CACHE_TIMEOUT=60):
+            authorizer = self._getOne()
+        self._login(authorizer)
+        with mock.patch(
+            "django.contrib.auth.hashers.PBKDF2PasswordHasher.verify"
+        ) as verify:
+            # only the password hash is read
+            with self.assertNumQueries(1):
+                authorizer.validate_authentication("user1", "password1", None)
+        verify.assert_not_called()
+
+    def test_wrong_password_not_cached(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        with self.settings(FTPSERVER_AUTH_CACHE_TIMEOUT=60):
+            authorizer = self._getOne()
+        self._login(authorizer)
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "wrong", None)
+
+    def test_password_change_invalidates(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        with self.settings(FTPSERVER_AUTH_CACHE_TIMEOUT=60):
+            authorizer = self._getOne()
+        self._login(authorizer)
+        self.user.set_password("password2")
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "password1", None)
+        authorizer.validate_authentication("user1", "password2", None)
+
+    def test_password_changed_by_other_process(self):
+        """A password changed without signals in this process is seen."""
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        with self.settings(FTPSERVER_AUTH_CACHE_TIMEOUT=60):
+            authorizer = self._getOne()
+        self._login(authorizer)
+        User.objects.filter(pk=self.user.pk).update(password=make_password("password2"))
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "password1", None)
+        authorizer.validate_authentication("user1", "password2", None)
+
+    def test_deactivated_by_other_process(self):
+        from django.contrib.auth.models import User
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        with self.settings(FTPSERVER_AUTH_CACHE_TIMEOUT=60):
+            authorizer = self._getOne()
+        self._login(authorizer)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "password1", None)
+
+
+class LastLoginBufferTest(FTPAccountAuthorizerTestBase):
+    """Test for LastLoginBuffer"""
+
+    def setUp(self):
+        self.group = self._getGroup(name="group1")
+        self.group.save()
+        self.accounts = []
+        for name in ("user1", "user2"):
+            user = self._getUser(username=name)
+            user.save()
+            account = self._getAccount(user=user, group=self.group)
+            account.save()
+            self.accounts.append(account)
+
+    def _getBuffer(self):
+        from django_ftpserver import authorizers, models
+
+        return authorizers.LastLoginBuffer(models.FTPUserAccount)
+
+    def test_flush_single_query(self):
+        from django.utils import timezone
+
+        buffer = self._getBuffer()
+        now = timezone.now()
+        for account in self.accounts:
+            buffer.add(account.pk, now)
+        with self.assertNumQueries(1):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        for account in self.accounts:
+            account.refresh_from_db()
+            self.assertEqual(account.last_login, now)
+
+    def test_flush_empty(self):
+        buffer = self._getBuffer()
+        with self.assertNumQueries(0):
+            self.assertEqual(buffer.flush(), 0)
+
+    def test_get_msg_login_defers_write(self):
+        authorizer = self._getOne()
+        authorizer.get_session_account("user1")
+        with self.assertNumQueries(0):
+            authorizer.get_msg_login("user1")
+        self.accounts[0].refresh_from_db()
+        self.assertIsNone(self.accounts[0].last_login)
+        self.assertEqual(len(authorizer.last_login_buffer), 1)
+
+    def test_get_msg_login_without_interval(self):
+        with self.settings(FTPSERVER_LAST_LOGIN_FLUSH_INTERVAL=0):
+            authorizer = self._getOne()
+        authorizer.get_msg_login("user1")
+        self.accounts[0].refresh_from_db()
+        self.assertIsNotNone(self.accounts[0].last_login)
+
+    def test_flush_on_server_stopped(self):
+        from unittest import mock
+
+        from django_ftpserver import signals
+
+        authorizer = self._getOne()
+        authorizer.get_msg_login("user1")
+        server = mock.Mock()
+        server.handler.authorizer = authorizer
+        signals.ftp_server_stopped.send(
+            sender=self.__class__, server=server, host="127.0.0.1", port=21
+        )
+        self.accounts[0].refresh_from_db()
+        self.assertIsNotNone(self.accounts[0].last_login)
+
+    def test_flush_scheduled_on_server_started(self):
+        from unittest import mock
+
+        from django_ftpserver import signals
+
+        authorizer = self._getOne()
+        server = mock.Mock()
+        server.handler.authorizer = authorizer
+        signals.ftp_server_started.send(
+            sender=self.__class__, server=server, host="127.0.0.1", port=21
+        )
+        server.ioloop.call_every.assert_called_once_with(
+            10, authorizer.run_in_background, authorizer.last_login_buffer.flush
+        )
+
+    def test_flush_in_auth_workers(self):
+        from unittest import mock
+
+        from django_ftpserver import signals
+
+        authorizer = self._getOne()
+        server = mock.Mock()
+        server.handler.authorizer = authorizer
+        signals.ftp_server_started.send(
+            sender=self.__class__, server=server, host="127.0.0.1", port=21
+        )
+        interval, func, task = server.ioloop.call_every.call_args[0]
+        func(task)
+        server.handler.get_auth_executor().submit.assert_called_once_with(
+            authorizer._run_background_task, authorizer.last_login_buffer.flush
+        )
+
+    def test_failed_flush_keeps_pending(self):
+        from unittest import mock
+
+        from django.db import OperationalError
+        from django.utils import timezone
+
+        buffer = self._getBuffer()
+        first = timezone.now()
+        buffer.add(self.accounts[0].pk, first)
+        buffer.add(self.accounts[1].pk, first)
+        for error in (OperationalError("gone"), ValueError("bad value")):
+            with mock.patch.object(buffer, "_write", side_effect=error):
+                with self.assertLogs("django_ftpserver.authorizers", "ERROR"):
+                    self.assertEqual(buffer.flush(), 0)
+            self.assertEqual(len(buffer), 2)
+
+        newer = timezone.now()
+
+        def write(pending):
+            # a login while the failed write runs
+            buffer.add(self.accounts[0].pk, newer)
+            raise OperationalError("gone")
+
+        with mock.patch.object(buffer, "_write", side_effect=write):
+            with self.assertLogs("django_ftpserver.authorizers", "ERROR"):
+                buffer.flush()
+        self.assertEqual(buffer._pending[self.accounts[0].pk], newer)
+        self.assertEqual(buffer._pending[self.accounts[1].pk], first)
+        self.assertEqual(buffer.flush(), 2)
+
+
+class ConnectionManagerTest(TestCase):
+    """Test for ConnectionManager and ensure_db_connection"""
+
+    def _getOne(self):
+        from django_ftpserver.authorizers import ConnectionManager
+
+        return ConnectionManager()
+
+    def test_check_rate_limited(self):
+        from unittest import mock
+
+        manager = self._getOne()
+        with mock.patch(
+            "django_ftpserver.authorizers.close_old_connections"
+        ) as close_old_connections:
+            manager.check()
+            manager.check()
+        close_old_connections.assert_called_once_with()
+        self.assertEqual(manager.checks, 1)
+
+    def test_check_after_interval(self):
+        from unittest import mock
+
+        manager = self._getOne()
+        with (
+            self.settings(FTPSERVER_DB_CHECK_INTERVAL=0),
+            mock.patch(
+                "django_ftpserver.authorizers.close_old_connections"
+            ) as close_old_connections,
+        ):
+            manager.check()
+            manager.check()
+        self.assertEqual(close_old_connections.call_count, 2)
+        self.assertEqual(manager.checks, 2)
+
+    def test_retry_after_lost_connection(self):
+        from unittest import mock
+
+        from django.db import OperationalError
+
+        from django_ftpserver import authorizers
+
+        func = mock.Mock(side_effect=[OperationalError("gone away"), "result"])
+        wrapped = authorizers.ensure_db_connection(func)
+        manager = self._getOne()
+        with (
+            mock.patch.object(authorizers, "connection_manager", manager),
+            mock.patch.object(authorizers, "_connection_lost", return_value=True),
+            mock.patch.object(authorizers, "connections") as connections,
+        ):
+            connections.all.return_value = []
+            self.assertEqual(wrapped(), "result")
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(manager.reconnects, 1)
+
+    def test_other_errors_are_raised(self):
+        from unittest import mock
+
+        from django.db import OperationalError
+
+        from django_ftpserver import authorizers
+
+        func = mock.Mock(side_effect=OperationalError("locked"))
+        wrapped = authorizers.ensure_db_connection(func)
+        manager = self._getOne()
+        with (
+            mock.patch.object(authorizers, "connection_manager", manager),
+            mock.patch.object(authorizers, "_connection_lost", return_value=False),
+        ):
+            with self.assertRaises(OperationalError):
+                wrapped()
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(manager.reconnects, 0)
+
+
+class FTPAccountAuthorizerPathPermissionTest(FTPAccountAuthorizerTestBase):
+    """Test for path permissions in FTPAccountAuthorizer"""
+
+    def setUp(self):
+        self.user = self._getUser(username="user1")
+        self.user.set_password("password1")
+        self.user.save()
+        self.group = self._getGroup(name="group1", permission="elr")
+        self.group.save()
+        self.account = self._getAccount(
+            user=self.user, group=self.group, home_dir="/home/user1"
+        )
+        self.account.save()
+
+    def _addRule(self, **kwargs):
+        from django_ftpserver import models
+
+        return models.FTPPathPermission.objects.create(**kwargs)
+
+    def test_has_perm_by_path_without_queries(self):
+        self._addRule(group=self.group, path="/incoming", permission="elw")
+        authorizer = self._getOne()
+        authorizer.validate_authentication("user1", "password1", None)
+        with self.assertNumQueries(0):
+            self.assertTrue(authorizer.has_perm("user1", "w", "/home/user1/incoming"))
+            self.assertFalse(authorizer.has_perm("user1", "w", "/home/user1"))
+
+    def test_rule_change_refreshes_snapshot(self):
+        authorizer = self._getOne()
+        authorizer.validate_authentication("user1", "password1", None)
+        self.assertFalse(authorizer.has_perm("user1", "w", "/home/user1/incoming"))
+        rule = self._addRule(account=self.account, path="/incoming", permission="w")
+        self.assertTrue(authorizer.has_perm("user1", "w", "/home/user1/incoming"))
+        rule.delete()
+        self.assertFalse(authorizer.has_perm("user1", "w", "/home/user1/incoming"))
+
+
+class SnapshotAccountAuthorizerTest(FTPAccountAuthorizerTestBase):
+    """Test for SnapshotAccountAuthorizer"""
+
+    def setUp(self):
+        self.user = self._getUser(username="user1")
+        self.user.set_password("password1")
+        self.user.save()
+        self.group = self._getGroup(name="group1", permission="elr")
+        self.group.save()
+        self.account = self._getAccount(
+            user=self.user, group=self.group, home_dir="/home/user1"
+        )
+        self.account.save()
+
+    def _getOne(self):
+        from django_ftpserver import authorizers
+
+        return authorizers.SnapshotAccountAuthorizer()
+
+    def test_login_without_queries(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        from django_ftpserver import models
+
+        models.FTPPathPermission.objects.create(
+            group=self.group, path="/incoming", permission="elw"
+        )
+        authorizer = self._getOne()
+        with self.assertNumQueries(0):
+            self.assertTrue(authorizer.has_user("user1"))
+            self.assertFalse(authorizer.has_user("nobody"))
+            authorizer.validate_authentication("user1", "password1", None)
+            with self.assertRaises(AuthenticationFailed):
+                authorizer.validate_authentication("user1", "wrong", None)
+            with self.assertRaises(AuthenticationFailed):
+                authorizer.validate_authentication("nobody", "password1", None)
+            self.assertEqual(authorizer.get_home_dir("user1"), "/home/user1")
+            self.assertEqual(authorizer.get_perms("user1"), "elr")
+            self.assertTrue(authorizer.has_perm("user1", "w", "/home/user1/incoming"))
+            self.assertFalse(authorizer.has_perm("user1", "w", "/home/user1"))
+            authorizer.get_msg_login("user1")
+        self.assertEqual(len(authorizer.last_login_buffer), 1)
+
+    def test_inactive_user(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        self.user.is_active = False
+        self.user.save()
+        authorizer = self._getOne()
+        with self.assertRaises(AuthenticationFailed):
+            authorizer.validate_authentication("user1", "password1", None)
+
+    def test_inactive_user_runs_hasher(self):
+        from unittest import mock
+
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        from django_ftpserver import authorizers
+
+        self.user.is_active = False
+        self.user.save()
+        authorizer = self._getOne()
+        with mock.patch.object(
+            authorizers, "check_password", return_value=False
+        ) as check_password:
+            with self.assertRaises(AuthenticationFailed):
+                authorizer.validate_authentication("user1", "wrong", None)
+        check_password.assert_called_once_with("wrong", self.user.password)
+
+    def test_change_refreshes_snapshot(self):
+        authorizer = self._getOne()
+        self.assertEqual(authorizer.get_home_dir("user1"), "/home/user1")
+        self.account.home_dir = "/srv/user1"
+        self.account.save()
+        self.assertEqual(authorizer.get_home_dir("user1"), "/srv/user1")
+        self.account.delete()
+        self.assertFalse(authorizer.has_user("user1"))
+
+    def test_database_error_keeps_snapshot(self):
+        from unittest import mock
+
+        from django.db import OperationalError
+
+        authorizer = self._getOne()
+        with mock.patch.object(
+            authorizer, "load_table", side_effect=OperationalError("gone")
+        ):
+            with self.assertLogs("django_ftpserver.authorizers", "ERROR"):
+                self.assertFalse(authorizer.refresh())
+        authorizer.validate_authentication("user1", "password1", None)
+        self.assertEqual(authorizer.get_home_dir("user1"), "/home/user1")
+
+    def _start_server(self, authorizer, executor=None):
+        from unittest import mock
+
+        from django_ftpserver import signals
+
+        server = mock.Mock()
+        server.handler.authorizer = authorizer
+        server.handler.get_auth_executor.return_value = executor
+        signals.ftp_server_started.send(
+            sender=self.__class__, server=server, host="127.0.0.1", port=21
+        )
+        self.addCleanup(
+            signals.ftp_server_stopped.send,
+            sender=self.__class__,
+            server=server,
+            host="127.0.0.1",
+            port=21,
+        )
+        return server
+
+    def test_refresh_scheduled_on_server_started(self):
+        authorizer = self._getOne()
+        server = self._start_server(authorizer)
+        server.ioloop.call_every.assert_any_call(
+            60, authorizer.run_in_background, authorizer.refresh_if_changed
+        )
+
+    def test_poll_without_change_reads_only_version(self):
+        from unittest import mock
+
+        authorizer = self._getOne()
+        with mock.patch.object(authorizer, "load_table") as load_table:
+            with self.assertNumQueries(1):
+                self.assertTrue(authorizer.refresh_if_changed())
+        load_table.assert_not_called()
+
+    def test_poll_reloads_after_change_elsewhere(self):
+        from django_ftpserver import models
+
+        authorizer = self._getOne()
+        # a change made by another process, without signals in this one
+        models.FTPUserAccount.objects.filter(pk=self.account.pk).update(
+            home_dir="/srv/user1"
+        )
+        authorizer.refresh_if_changed()
+        self.assertEqual(authorizer.get_home_dir("user1"), "/home/user1")
+        models.FTPAccountVersion.bump()
+        self.assertTrue(authorizer.refresh_if_changed())
+        self.assertEqual(authorizer.get_home_dir("user1"), "/srv/user1")
+
+    def test_refresh_in_auth_workers(self):
+        from unittest import mock
+
+        executor = mock.Mock()
+        authorizer = self._getOne()
+        self._start_server(authorizer, executor)
+        authorizer._invalidate_accounts(sender=None, instance=self.account)
+        executor.submit.assert_called_once_with(
+            authorizer._run_background_task, authorizer.refresh
+        )
+
+    def test_pending_refresh_not_submitted_again(self):
+        from unittest import mock
+
+        executor = mock.Mock()
+        executor.submit.return_value.done.return_value = False
+        authorizer = self._getOne()
+        self._start_server(authorizer, executor)
+        authorizer.run_in_background(authorizer.refresh)
+        authorizer.run_in_background(authorizer.refresh)
+        self.assertEqual(executor.submit.call_count, 1)
+
+    def test_snapshot_replaced_when_reload_complete(self):
+        import threading
+        from unittest import mock
+
+        loading = threading.Event()
+        finish = threading.Event()
+
+        def load_table():
+            loading.set()
+            finish.wait(5)
+            return {}
+
+        authorizer = self._getOne()
+        self._start_server(authorizer)
+        with (
+            mock.patch.object(authorizer, "load_table", load_table),
+            mock.patch.object(authorizer, "load_version", return_value=1),
+        ):
+            authorizer.run_in_background(authorizer.refresh)
+            self.assertTrue(loading.wait(5))
+            self.assertTrue(authorizer.has_user("user1"))
+            finish.set()
+            authorizer._background_tasks[authorizer.refresh].result(5)
+        self.assertFalse(authorizer.has_user("user1"))
+
+
+class FTPAccountAuthorizerSharedCacheTest(FTPAccountAuthorizerTestBase):
+    """Test for accounts shared through FTPSERVER_CACHE"""
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        settings = self.settings(FTPSERVER_CACHE="default")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = self._getUser(username="user1")
+        self.user.set_password("password1")
+        self.user.save()
+        self.group = self._getGroup(name="group1", permission="elr")
+        self.group.save()
+        self.account = self._getAccount(user=self.user, group=self.group)
+        self.account.save()
+
+    def test_login_in_other_process_reads_only_password(self):
+        self._getOne().validate_authentication("user1", "password1", None)
+
+        authorizer = self._getOne()
+        with self.assertNumQueries(1):
+            authorizer.validate_authentication("user1", "password1", None)
+            self.assertTrue(authorizer.has_perm("user1", "r", "/"))
+            self.assertFalse(authorizer.has_perm("user1", "w", "/"))
+
+    def test_password_hash_not_shared(self):
+        import pickle
+
+        from django_ftpserver.cache import get_shared_cache
+
+        self._getOne().validate_authentication("user1", "password1", None)
+
+        account = get_shared_cache().get("accounts", "user1")
+        self.assertEqual(account.pk, self.account.pk)
+        self.assertFalse(account.user.has_usable_password())
+        self.assertNotIn(self.user.password.encode(), pickle.dumps(account))
+
+    def test_password_changed_by_other_process(self):
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        self._getOne().validate_authentication("user1", "password1", None)
+        User.objects.filter(pk=self.user.pk).update(password=make_password("password2"))
+
+        with self.assertRaises(AuthenticationFailed):
+            self._getOne().validate_authentication("user1", "password1", None)
+        self._getOne().validate_authentication("user1", "password2", None)
+
+    def test_wrong_password(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        self._getOne().validate_authentication("user1", "password1", None)
+        with self.assertRaises(AuthenticationFailed):
+            self._getOne().validate_authentication("user1", "wrong", None)
+
+    def test_group_change_invalidates(self):
+        self._getOne().validate_authentication("user1", "password1", None)
+        self.group.permission = "elradfmw"
+        self.group.save()
+
+        authorizer = self._getOne()
+        authorizer.validate_authentication("user1", "password1", None)
+        self.assertTrue(authorizer.has_perm("user1", "w", "/"))
+
+    def test_unknown_user(self):
+        from pyftpdlib.authorizers import AuthenticationFailed
+
+        with self.assertRaises(AuthenticationFailed):
+            self._getOne().validate_authentication("user2", "password1", None)
+        user2 = self._getUser(username="user2")
+        user2.set_password("password1")
+        user2.save()
+        self._getAccount(user=user2, group=self.group).save()
+        self._getOne().validate_authentication("user2", "password1", None)
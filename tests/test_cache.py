@@ -0,0 +1,170 @@
+"""Tests for django_ftpserver.cache module."""
+
+import threading
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from django_ftpserver.cache import LOADING, MISSING, SharedCache, get_shared_cache
+
+
+class SharedCacheTest(TestCase):
+    """Tests for SharedCache."""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        self.cache = SharedCache("default", timeout=60, lock_timeout=2)
+        self.cache.poll_interval = 0.01
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("accounts", "user1"))
+        self.cache.set("accounts", "user1", {"pk": 1})
+        self.assertEqual(self.cache.get("accounts", "user1"), {"pk": 1})
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+        self.assertEqual(self.cache.get_stats()["misses"], 1)
+
+    def test_none_is_cached(self):
+        self.cache.set("accounts", "unknown", None)
+        self.assertIsNone(self.cache.get("accounts", "unknown", MISSING))
+
+    def test_delete(self):
+        self.cache.set("accounts", "user1", 1)
+        self.cache.delete("accounts", "user1")
+        self.assertIsNone(self.cache.get("accounts", "user1"))
+
+    def test_invalidate_namespace(self):
+        self.cache.set("accounts", "user1", 1)
+        self.cache.set("storage:default", ("listing", "/"), [])
+
+        self.cache.invalidate("accounts")
+
+        self.assertIsNone(self.cache.get("accounts", "user1"))
+        self.assertEqual(self.cache.get("storage:default", ("listing", "/")), [])
+
+    def test_invalidate_without_version(self):
+        self.cache.invalidate("accounts")
+        self.cache.set("accounts", "user1", 1)
+        self.assertEqual(self.cache.get("accounts", "user1"), 1)
+
+    def test_shared_between_instances(self):
+        other = SharedCache("default")
+        self.cache.set("accounts", "user1", 1)
+        self.assertEqual(other.get("accounts", "user1"), 1)
+        other.invalidate("accounts")
+        self.assertIsNone(self.cache.get("accounts", "user1"))
+
+    def test_get_or_set(self):
+        load = mock.Mock(return_value=1)
+        self.assertEqual(self.cache.get_or_set("accounts", "user1", load), 1)
+        self.assertEqual(self.cache.get_or_set("accounts", "user1", load), 1)
+        load.assert_called_once_with()
+
+    def test_get_or_set_releases_lock_on_error(self):
+        load = mock.Mock(side_effect=[ValueError, 1])
+        with self.assertRaises(ValueError):
+            self.cache.get_or_set("accounts", "user1", load)
+        self.assertEqual(self.cache.get_or_set("accounts", "user1", load), 1)
+        self.assertEqual(self.cache.get_stats()["coalesced"], 0)
+
+    def test_concurrent_misses_coalesced(self):
+        """Only the first caller loads a missing key, others wait for it."""
+        started = threading.Event()
+        finish = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            finish.wait(2)
+            return "value"
+
+        results = []
+        loader = threading.Thread(
+            target=lambda: results.append(
+                self.cache.get_or_set("accounts", "user1", load)
+            )
+        )
+        loader.start()
+        started.wait(2)
+        waiter = threading.Thread(
+            target=lambda: results.append(
+                self.cache.get_or_set("accounts", "user1", load)
+            )
+        )
+        waiter.start()
+        finish.set()
+        loader.join()
+        waiter.join()
+
+        self.assertEqual(results, ["value", "value"])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.get_stats()["coalesced"], 1)
+
+    def test_fetch_takes_over_released_lock(self):
+        self.assertIs(self.cache.fetch("accounts", "user1"), MISSING)
+        self.cache.release("accounts", "user1")
+        self.assertIs(self.cache.fetch("accounts", "user1"), MISSING)
+        self.assertEqual(self.cache.get_stats()["coalesced"], 0)
+
+    def test_fetch_without_wait(self):
+        self.assertIs(self.cache.fetch("accounts", "user1"), MISSING)
+        with mock.patch("time.sleep") as sleep:
+            self.assertIs(self.cache.fetch("accounts", "user1", wait=False), LOADING)
+        sleep.assert_not_called()
+
+    def test_get_or_set_without_wait(self):
+        """A caller that doesn't wait loads the value without storing it."""
+        self.assertIs(self.cache.fetch("accounts", "user1"), MISSING)
+        load = mock.Mock(return_value=1)
+        self.assertEqual(
+            self.cache.get_or_set("accounts", "user1", load, wait=False), 1
+        )
+        self.assertIsNone(self.cache.get("accounts", "user1"))
+        self.cache.set("accounts", "user1", 2)
+        self.assertEqual(
+            self.cache.get_or_set("accounts", "user1", load, wait=False), 2
+        )
+        load.assert_called_once_with()
+
+
+class GetSharedCacheTest(TestCase):
+    """Tests for get_shared_cache."""
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_shared_cache())
+
+    def test_created_from_settings(self):
+        with self.settings(FTPSERVER_CACHE="default", FTPSERVER_CACHE_TIMEOUT=30):
+            shared = get_shared_cache()
+            self.assertEqual(shared.alias, "default")
+            self.assertEqual(shared.timeout, 30)
+            self.assertIs(get_shared_cache(), shared)
+
+
+class InvalidateAccountsTest(TestCase):
+    """Tests for invalidation of shared accounts by model signals."""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+
+    def test_user_change_invalidates(self):
+        from django.contrib.auth.models import User
+
+        with self.settings(FTPSERVER_CACHE="default"):
+            shared = get_shared_cache()
+            shared.set("accounts", "user1", 1)
+            User.objects.create_user("user1")
+            self.assertIsNone(shared.get("accounts", "user1"))
+
+    def test_last_login_update_ignored(self):
+        from django.contrib.auth.models import User
+
+        user = User.objects.create_user("user1")
+        with self.settings(FTPSERVER_CACHE="default"):
+            shared = get_shared_cache()
+            shared.set("accounts", "user1", 1)
+            user.save(update_fields=["last_login"])
+            self.assertEqual(shared.get("accounts", "user1"), 1)
@@ -4,19 +4,45 @@ This module tests the StorageFS class and its associated storage patches
 that provide compatibility with different Django storage backends.
 """
 
-from unittest import mock
-from datetime import datetime
-
-from django.test import TestCase
-
+import errno
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+from datetime import datetime, timezone
+
+from django.test import TestCase, override_settings
+
+from django_ftpserver import models
+from django_ftpserver.resilience import (
+    CircuitBreaker,
+    StorageGuard,
+    StorageUnavailable,
+)
+from django_ftpserver.watchers import InotifyWatcher
 from django_ftpserver.filesystems import (
+    DeferredCall,
+    GoogleCloudDownloadReader,
+    GoogleCloudUploadWriter,
+    MultipartUploadWriter,
+    RangedDownloadReader,
+    S3MultipartUploadWriter,
+    S3RangedDownloadReader,
     PseudoStat,
     StoragePatch,
     FileSystemStoragePatch,
     S3Boto3StoragePatch,
     DjangoGCloudStoragePatch,
     GoogleCloudStoragePatch,
+    ListingCache,
+    SingleFlight,
     StorageFS,
+    file_metadata,
+    is_local_file,
 )
 
 
@@ -72,11 +98,46 @@ class FileSystemStoragePatchTest(TestCase):
     """
 
     def test_patch_methods(self):
-        """FileSystemStoragePatch should patch mkdir, rmdir, and stat methods."""
+        """FileSystemStoragePatch should patch open, mkdir, rmdir, and stat methods."""
         self.assertEqual(
-            FileSystemStoragePatch.patch_methods, ("mkdir", "rmdir", "stat")
+            FileSystemStoragePatch.patch_methods,
+            (
+                "open",
+                "mkdir",
+                "rmdir",
+                "stat",
+                "lstat",
+                "listdir_with_stats",
+                "change_token",
+            ),
         )
 
+    def test_open_for_reading(self):
+        """open() should return an OS file for reading, at offset."""
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, "a.txt"), "wb") as f:
+                f.write(b"abcdef")
+            fs = mock.Mock(_cwd="/")
+            fs.storage.path.side_effect = lambda name: os.path.join(root, name[1:])
+
+            with FileSystemStoragePatch.open(fs, "a.txt", "rb", 2) as file:
+                self.assertIsInstance(file, io.BufferedReader)
+                self.assertTrue(is_local_file(file))
+                self.assertEqual(file.name, os.path.join(root, "a.txt"))
+                self.assertEqual(file.read(), b"cdef")
+
+            fs.storage.path.assert_called_once_with("/a.txt")
+            fs._origin_open.assert_not_called()
+
+    def test_open_for_writing(self):
+        """open() should leave files opened for writing to StorageFS.open()."""
+        fs = mock.Mock(_cwd="/")
+
+        result = FileSystemStoragePatch.open(fs, "a.txt", "wb")
+
+        fs._origin_open.assert_called_once_with("a.txt", "wb", 0)
+        self.assertIs(result, fs._origin_open.return_value)
+
     @mock.patch("os.mkdir")
     def test_mkdir(self, mock_mkdir):
         """mkdir() should create directory using storage.path() resolved path."""
@@ -121,6 +182,29 @@ class FileSystemStoragePatchTest(TestCase):
         mock_stat.assert_called_once_with("/full/path/test")
         self.assertEqual(result, "stat_result")
 
+    def test_listdir_with_stats(self):
+        """listdir_with_stats() should list with one scandir pass."""
+        with tempfile.TemporaryDirectory() as root:
+            os.mkdir(os.path.join(root, "sub"))
+            with open(os.path.join(root, "a.txt"), "wb") as f:
+                f.write(b"x" * 10)
+            fs = mock.Mock()
+            fs.storage.path.return_value = root
+
+            result = list(FileSystemStoragePatch.listdir_with_stats(fs, "/"))
+
+        fs.storage.path.assert_called_once_with("")
+        result.sort(key=lambda item: not item[1]["isdir"])
+        self.assertEqual([name for name, values in result], ["sub/", "a.txt"])
+        sub, a = (values for name, values in result)
+        self.assertTrue(sub["isdir"])
+        self.assertEqual(sub["getsize"], 0)
+        self.assertFalse(a["isdir"])
+        self.assertEqual(a["getsize"], 10)
+        self.assertEqual(a["stat"].st_size, 10)
+        self.assertIs(a["lstat"], a["stat"])
+        self.assertEqual(a["getmtime"], a["stat"].st_mtime)
+
 
 class S3Boto3StoragePatchTest(TestCase):
     """Tests for S3Boto3StoragePatch.
@@ -132,7 +216,16 @@ class S3Boto3StoragePatchTest(TestCase):
     def test_patch_methods(self):
         """S3Boto3StoragePatch should patch _exists, isdir, and getmtime methods."""
         self.assertEqual(
-            S3Boto3StoragePatch.patch_methods, ("_exists", "isdir", "getmtime")
+            S3Boto3StoragePatch.patch_methods,
+            (
+                "_exists",
+                "isdir",
+                "getmtime",
+                "load_metadata",
+                "listdir_with_stats",
+                "open_download",
+                "open_upload",
+            ),
         )
 
     def test_exists_directory(self):
@@ -182,6 +275,43 @@ class S3Boto3StoragePatchTest(TestCase):
         self.assertEqual(result, 1234567890)
         fs._origin_getmtime.assert_called_once_with("test.txt")
 
+    def test_load_metadata_directory(self):
+        """load_metadata() should not send a request for directories."""
+        fs = mock.Mock()
+
+        self.assertEqual(S3Boto3StoragePatch.load_metadata(fs, "test/"), {})
+        fs.storage.connection.meta.client.head_object.assert_not_called()
+
+    def test_listdir_with_stats(self):
+        """listdir_with_stats() should keep size and mtime of listed objects."""
+        modified = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        fs = mock.Mock()
+        fs.storage.bucket_name = "bucket"
+        fs.storage._normalize_name.side_effect = lambda name: name.lstrip("/")
+        paginator = fs.storage.connection.meta.client.get_paginator.return_value
+        paginator.paginate.return_value = [
+            {
+                "CommonPrefixes": [{"Prefix": "data/sub/"}],
+                "Contents": [
+                    {"Key": "data/", "Size": 0, "LastModified": modified},
+                    {"Key": "data/a.txt", "Size": 10, "LastModified": modified},
+                ],
+            },
+            {"Contents": [{"Key": "data/b.txt", "Size": 20, "LastModified": modified}]},
+        ]
+
+        result = list(S3Boto3StoragePatch.listdir_with_stats(fs, "/data"))
+
+        self.assertEqual(
+            [(name, values["getsize"]) for name, values in result],
+            [("sub/", 0), ("a.txt", 10), ("b.txt", 20)],
+        )
+        self.assertTrue(result[0][1]["isdir"])
+        self.assertEqual(result[1][1]["getmtime"], modified.timestamp())
+        paginator.paginate.assert_called_once_with(
+            Bucket="bucket", Delimiter="/", Prefix="data/"
+        )
+
 
 class DjangoGCloudStoragePatchTest(TestCase):
     """Tests for DjangoGCloudStoragePatch.
@@ -194,7 +324,7 @@ class DjangoGCloudStoragePatchTest(TestCase):
         """DjangoGCloudStoragePatch patches _exists, isdir, getmtime, and listdir."""
         self.assertEqual(
             DjangoGCloudStoragePatch.patch_methods,
-            ("_exists", "isdir", "getmtime", "listdir"),
+            ("_exists", "isdir", "getmtime", "listdir", "listdir_with_stats"),
         )
 
     def test_exists_directory(self):
@@ -244,7 +374,16 @@ class GoogleCloudStoragePatchTest(TestCase):
     def test_patch_methods(self):
         """GoogleCloudStoragePatch does NOT include listdir."""
         self.assertEqual(
-            GoogleCloudStoragePatch.patch_methods, ("_exists", "isdir", "getmtime")
+            GoogleCloudStoragePatch.patch_methods,
+            (
+                "_exists",
+                "isdir",
+                "getmtime",
+                "load_metadata",
+                "listdir_with_stats",
+                "open_download",
+                "open_upload",
+            ),
         )
 
     def test_exists_directory(self):
@@ -292,6 +431,60 @@ class GoogleCloudStoragePatchTest(TestCase):
 
         self.assertEqual(result, 1234567890)
 
+    def test_load_metadata_file(self):
+        """load_metadata() should resolve a file with one get_blob() call."""
+        fs = mock.Mock()
+        fs.storage._normalize_name.side_effect = lambda name: name
+        blob = fs.storage.bucket.get_blob.return_value
+        blob.size = 1024
+        blob.updated = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        result = GoogleCloudStoragePatch.load_metadata(fs, "test.txt")
+
+        self.assertEqual(
+            result,
+            {
+                "_exists": True,
+                "isdir": False,
+                "getsize": 1024,
+                "getmtime": blob.updated.timestamp(),
+            },
+        )
+        fs.storage.bucket.get_blob.assert_called_once_with("test.txt")
+
+    def test_load_metadata_missing(self):
+        """load_metadata() should record missing blobs as not existing."""
+        fs = mock.Mock()
+        fs.storage.bucket.get_blob.return_value = None
+
+        result = GoogleCloudStoragePatch.load_metadata(fs, "test.txt")
+
+        self.assertEqual(result, {"_exists": False})
+
+    def test_listdir_with_stats(self):
+        """listdir_with_stats() should keep size and mtime of listed blobs."""
+        modified = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        blobs = []
+        for name, size in (("data/", 0), ("data/a.txt", 10)):
+            blob = mock.Mock(size=size, updated=modified)
+            blob.name = name
+            blobs.append(blob)
+        page = mock.MagicMock()
+        page.__iter__.return_value = iter(blobs)
+        page.prefixes = ("data/sub/",)
+        iterator = mock.Mock(pages=[page])
+        fs = mock.Mock()
+        fs.storage._normalize_name.side_effect = lambda name: name.lstrip("/")
+        fs.storage.bucket.list_blobs.return_value = iterator
+
+        result = list(GoogleCloudStoragePatch.listdir_with_stats(fs, "/data"))
+
+        self.assertEqual([name for name, values in result], ["sub/", "a.txt"])
+        self.assertEqual(result[1][1]["getsize"], 10)
+        fs.storage.bucket.list_blobs.assert_called_once_with(
+            prefix="data/", delimiter="/"
+        )
+
 
 class StorageFSTest(TestCase):
     """Tests for StorageFS class.
@@ -567,3 +760,1964 @@ class StorageFSTest(TestCase):
         fs = self._create_fs(mock_storage)
 
         self.assertFalse(hasattr(fs, "_patch"))
+
+
+@override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+class StorageFSMetadataCacheTest(TestCase):
+    """Tests for the metadata cache of StorageFS."""
+
+    def _create_fs(self, storage_mock):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": storage_mock}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def _create_storage(self):
+        storage = mock.Mock()
+        storage.__class__.__name__ = "MockStorage"
+        storage.exists.side_effect = lambda p: p == "test.txt"
+        storage.size.return_value = 1024
+        storage.get_modified_time.return_value = datetime(2025, 1, 1, 12, 0, 0)
+        return storage
+
+    def test_stat_calls_storage_once_per_value(self):
+        """Accessors for one path should share cached storage results."""
+        storage = self._create_storage()
+        fs = self._create_fs(storage)
+
+        fs.stat("test.txt")
+        fs.stat("test.txt")
+        self.assertTrue(fs.isfile("test.txt"))
+        self.assertFalse(fs.isdir("test.txt"))
+        self.assertTrue(fs.lexists("test.txt"))
+        self.assertEqual(fs.getsize("test.txt"), 1024)
+        fs.getmtime("test.txt")
+
+        self.assertEqual(storage.exists.call_count, 2)  # "test.txt", "test.txt/"
+        storage.size.assert_called_once_with("test.txt")
+        storage.get_modified_time.assert_called_once_with("test.txt")
+
+    def test_expired(self):
+        """Cached values should be reloaded after the timeout."""
+        storage = self._create_storage()
+        fs = self._create_fs(storage)
+
+        fs.getsize("test.txt")
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 60):
+            fs.getsize("test.txt")
+
+        self.assertEqual(storage.size.call_count, 2)
+
+    def test_disabled(self):
+        """A timeout of 0 should disable the cache."""
+        storage = self._create_storage()
+        with self.settings(FTPSERVER_METADATA_CACHE_TIMEOUT=0):
+            fs = self._create_fs(storage)
+
+        fs.getsize("test.txt")
+        fs.getsize("test.txt")
+
+        self.assertEqual(storage.size.call_count, 2)
+
+    def test_remove_invalidates(self):
+        """remove() should drop cached metadata of the removed path."""
+        storage = self._create_storage()
+        fs = self._create_fs(storage)
+
+        self.assertTrue(fs.isfile("test.txt"))
+        fs.remove("test.txt")
+        storage.exists.side_effect = None
+        storage.exists.return_value = False
+
+        self.assertFalse(fs.isfile("test.txt"))
+
+    def test_open_for_writing_invalidates(self):
+        """open() for writing should drop cached metadata of the file."""
+        storage = self._create_storage()
+        storage.exists.side_effect = lambda p: p == "/test.txt"
+        fs = self._create_fs(storage)
+
+        fs.getsize("/test.txt")
+        fs.open("/test.txt", "rb")
+        fs.getsize("/test.txt")
+        self.assertEqual(storage.size.call_count, 1)
+
+        fs.open("/test.txt", "wb")
+        fs.getsize("/test.txt")
+        self.assertEqual(storage.size.call_count, 2)
+
+    def test_seeded_by_load_metadata(self):
+        """Values returned by load_metadata() should not hit the storage."""
+        storage = self._create_storage()
+        fs = self._create_fs(storage)
+        fs.load_metadata = mock.Mock(
+            return_value=file_metadata(size=10, mtime=1234567890.0)
+        )
+
+        st = fs.stat("test.txt")
+
+        self.assertEqual((st.st_size, st.st_mtime), (10, 1234567890))
+        storage.exists.assert_not_called()
+        storage.size.assert_not_called()
+        storage.get_modified_time.assert_not_called()
+        fs.load_metadata.assert_called_once_with("test.txt")
+
+    def test_listdir_seeds_stat(self):
+        """stat() of listed entries should use values from the listing."""
+        storage = self._create_storage()
+        fs = self._create_fs(storage)
+        fs.listdir_with_stats = mock.Mock(
+            return_value=[("a.txt", file_metadata(size=10, mtime=1234567890.0))]
+        )
+
+        self.assertEqual(fs.listdir("/data"), ["a.txt"])
+        st = fs.lstat("/data/a.txt")
+
+        self.assertEqual((st.st_size, st.st_mtime), (10, 1234567890))
+        storage.exists.assert_not_called()
+        storage.size.assert_not_called()
+        storage.get_modified_time.assert_not_called()
+
+    def test_filesystem_listing_without_stat_calls(self):
+        """Entries listed from FileSystemStorage should not be stat()ed again."""
+        from django.core.files.storage import FileSystemStorage
+
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, "a.txt"), "wb") as f:
+                f.write(b"x" * 10)
+            fs = self._create_fs(FileSystemStorage(location=root))
+
+            with mock.patch("os.stat", wraps=os.stat) as os_stat:
+                self.assertEqual(fs.listdir("/"), ["a.txt"])
+                self.assertEqual(fs.stat("/a.txt").st_size, 10)
+                self.assertEqual(fs.lstat("/a.txt").st_size, 10)
+
+        os_stat.assert_not_called()
+
+    def test_iter_listdir_is_lazy(self):
+        """iter_listdir() should pull entries only as they are consumed."""
+        storage = self._create_storage()
+        fs = self._create_fs(storage)
+        pulled = []
+
+        def listdir_with_stats(path):
+            for index in range(3):
+                pulled.append(index)
+                yield "file{}".format(index), file_metadata(index, 0)
+
+        fs.listdir_with_stats = listdir_with_stats
+        iterator = fs.iter_listdir("/data")
+
+        self.assertEqual(next(iterator), "file0")
+        self.assertEqual(pulled, [0])
+        self.assertEqual(list(iterator), ["file1", "file2"])
+        self.assertEqual(fs.getsize("/data/file2"), 2)
+
+
+class StorageFSListingMetadataTest(TestCase):
+    """Tests for listed metadata of StorageFS without the metadata cache."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage._normalize_name.side_effect = lambda name: name.lstrip("/")
+        self.modified = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        self.storage.get_modified_time.return_value = self.modified
+
+    def _create_fs(self, class_name):
+        self.storage.__class__.__name__ = class_name
+        cmd_channel = mock.Mock(
+            encoding="utf8", unicode_errors="replace", use_gmt_times=True
+        )
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", cmd_channel)
+
+    def _format(self, fs, path):
+        lines = list(fs.format_list(path, fs.iter_listdir(path)))
+        lines += list(
+            fs.format_mlsx(path, fs.iter_listdir(path), "elr", ["type", "size"])
+        )
+        return b"".join(lines).decode()
+
+    def _assert_no_metadata_requests(self):
+        self.storage.exists.assert_not_called()
+        self.storage.size.assert_not_called()
+        self.storage.get_modified_time.assert_not_called()
+        self.storage.connection.meta.client.head_object.assert_not_called()
+        self.storage.bucket.get_blob.assert_not_called()
+
+    def _list_s3(self):
+        paginator = self.storage.connection.meta.client.get_paginator.return_value
+        paginator.paginate.side_effect = lambda **kwargs: [
+            {
+                "CommonPrefixes": [{"Prefix": "data/sub/"}],
+                "Contents": [
+                    {"Key": "data/a.txt", "Size": 10, "LastModified": self.modified},
+                    {"Key": "data/b.txt", "Size": 20, "LastModified": self.modified},
+                ],
+            }
+        ]
+
+    def test_s3_listing_without_requests_per_entry(self):
+        self._list_s3()
+        fs = self._create_fs("S3Storage")
+
+        listing = self._format(fs, "/data")
+
+        self.assertIn("size=20;type=file; b.txt", listing)
+        self.assertIn(" 10 Jan 01  2025 a.txt", listing)
+        self.assertIn("size=0;type=dir; sub/", listing)
+        self._assert_no_metadata_requests()
+
+    def test_gcs_listing_without_requests_per_entry(self):
+        blob = mock.Mock(size=10, updated=self.modified)
+        blob.name = "data/a.txt"
+
+        def list_blobs(prefix, delimiter):
+            page = mock.MagicMock()
+            page.__iter__.return_value = iter([blob])
+            page.prefixes = ("data/sub/",)
+            return mock.Mock(pages=[page])
+
+        self.storage.bucket.list_blobs.side_effect = list_blobs
+        fs = self._create_fs("GoogleCloudStorage")
+
+        listing = self._format(fs, "/data")
+
+        self.assertIn("size=10;type=file; a.txt", listing)
+        self.assertIn("size=0;type=dir; sub/", listing)
+        self._assert_no_metadata_requests()
+
+    def test_filesystem_listing_without_stat_calls(self):
+        from django.core.files.storage import FileSystemStorage
+
+        with tempfile.TemporaryDirectory() as root:
+            os.mkdir(os.path.join(root, "sub"))
+            for name in ("a.txt", "b.txt", "c.txt"):
+                with open(os.path.join(root, name), "wb") as f:
+                    f.write(b"x" * 10)
+            self.storage = FileSystemStorage(location=root)
+            fs = self._create_fs("FileSystemStorage")
+
+            with (
+                mock.patch("os.stat", wraps=os.stat) as os_stat,
+                mock.patch("os.path.lexists", wraps=os.path.lexists) as lexists,
+            ):
+                listing = self._format(fs, "/")
+
+        self.assertIn("size=10;type=file; c.txt", listing)
+        self.assertIn("type=dir; sub/", listing)
+        os_stat.assert_not_called()
+        lexists.assert_not_called()
+
+    def test_values_dropped_after_formatting(self):
+        """Listed values should not answer later commands."""
+        self._list_s3()
+        self.storage.exists.return_value = True
+        fs = self._create_fs("S3Storage")
+
+        self._format(fs, "/data")
+        fs.getsize("/data/a.txt")
+
+        self.storage.size.assert_called_once_with("/data/a.txt")
+
+    def test_values_not_kept_without_formatting(self):
+        self._list_s3()
+        self.storage.exists.return_value = True
+        fs = self._create_fs("S3Storage")
+
+        list(fs.iter_listdir("/data", metadata=False))
+        list(fs.format_list("/data", ["a.txt"]))
+
+        self.storage.size.assert_called_once_with("/data/a.txt")
+
+
+class ListingCacheTest(TestCase):
+    """Tests for ListingCache."""
+
+    def test_hit_and_miss(self):
+        cache = ListingCache(60)
+
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", [1, 2])
+
+        self.assertEqual(cache.get("a"), [1, 2])
+        stats = cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_expired(self):
+        cache = ListingCache(60)
+        cache.set("a", 1)
+
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get("a"))
+
+    def test_lru_eviction_by_weight(self):
+        cache = ListingCache(60, max_size=10)
+        cache.set("a", "a", weight=4)
+        cache.set("b", "b", weight=4)
+        cache.get("a")
+        cache.set("c", "c", weight=4)
+
+        self.assertEqual(cache.get("a"), "a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_stats()["evicted"], 1)
+        self.assertEqual(cache.get_stats()["size"], 8)
+
+    def test_too_large(self):
+        cache = ListingCache(60, max_size=10)
+        cache.set("a", "a", weight=11)
+
+        self.assertIsNone(cache.get("a"))
+
+    def test_invalidate(self):
+        cache = ListingCache(60)
+        cache.set("a", 1)
+        cache.invalidate("a")
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["invalidated"], 1)
+
+
+@override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+class StorageFSListingCacheTest(TestCase):
+    """Tests for the shared listing cache of StorageFS."""
+
+    def setUp(self):
+        patcher = mock.patch.object(StorageFS, "listing_cache", ListingCache(60))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        self.storage.listdir.return_value = (["sub"], ["a.txt"])
+
+    def _create_fs(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def test_disabled_by_default(self):
+        with mock.patch.object(StorageFS, "listing_cache", None):
+            self.assertIsNone(self._create_fs().listing_cache)
+
+    def test_created_from_settings(self):
+        with (
+            mock.patch.object(StorageFS, "listing_cache", None),
+            self.settings(FTPSERVER_LISTING_CACHE_TIMEOUT=30),
+        ):
+            cache = StorageFS.get_listing_cache()
+            self.assertEqual(cache.timeout, 30)
+            self.assertIs(self._create_fs().listing_cache, cache)
+
+    def test_shared_between_sessions(self):
+        self.assertEqual(self._create_fs().listdir("/data"), ["sub/", "a.txt"])
+        self.assertEqual(self._create_fs().listdir("/data/"), ["sub/", "a.txt"])
+
+        self.storage.listdir.assert_called_once_with("/data")
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+
+    def test_write_invalidates_other_sessions(self):
+        fs = self._create_fs()
+        fs.listdir("/data")
+        fs.remove("/data/a.txt")
+
+        self._create_fs().listdir("/data")
+
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_signal_invalidates(self):
+        from django_ftpserver import signals
+
+        fs = self._create_fs()
+        fs.listdir("/data")
+        signals.ftp_file_received.send(
+            sender=self.__class__, handler=mock.Mock(fs=fs), path="/data/b.txt"
+        )
+
+        self._create_fs().listdir("/data")
+
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_metadata_shared_between_sessions(self):
+        self.storage.exists.return_value = True
+
+        self._create_fs().isfile("/data/a.txt")
+        self._create_fs().isfile("/data/a.txt")
+
+        self.storage.exists.assert_called_once_with("/data/a.txt")
+
+
+@skipUnless(sys.platform.startswith("linux"), "inotify requires Linux")
+@override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+class StorageFSWatcherTest(TestCase):
+    """Tests for inotify change tokens of FileSystemStorage paths."""
+
+    def setUp(self):
+        from django.core.files.storage import FileSystemStorage
+
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        with open(os.path.join(self.root, "a.txt"), "wb") as f:
+            f.write(b"x")
+        self.storage = FileSystemStorage(location=self.root)
+        watcher = InotifyWatcher()
+        self.addCleanup(watcher.close)
+        for name, value in (("watcher", watcher), ("listing_cache", ListingCache(60))):
+            patcher = mock.patch.object(StorageFS, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_fs(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def test_listing_valid_until_changed(self):
+        fs = self._create_fs()
+        self.assertEqual(fs.listdir("/"), ["a.txt"])
+
+        with mock.patch.object(fs, "listdir_with_stats") as listdir_with_stats:
+            self.assertEqual(self._create_fs().listdir("/"), ["a.txt"])
+            listdir_with_stats.assert_not_called()
+
+        with open(os.path.join(self.root, "b.txt"), "wb") as f:
+            f.write(b"x")
+
+        self.assertEqual(sorted(self._create_fs().listdir("/")), ["a.txt", "b.txt"])
+
+    def test_metadata_valid_after_timeout(self):
+        fs = self._create_fs()
+        self.assertEqual(fs.stat("a.txt").st_size, 1)
+
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 60):
+            with mock.patch("os.stat", wraps=os.stat) as os_stat:
+                self.assertEqual(fs.stat("a.txt").st_size, 1)
+            os_stat.assert_not_called()
+
+            with open(os.path.join(self.root, "a.txt"), "ab") as f:
+                f.write(b"x")
+            self.assertEqual(fs.stat("a.txt").st_size, 2)
+
+
+@override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+class StorageFSSharedCacheTest(TestCase):
+    """Tests for listings and metadata shared through FTPSERVER_CACHE."""
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        settings = self.settings(FTPSERVER_CACHE="default")
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        self.storage.listdir.return_value = (["sub"], ["a.txt"])
+
+    def _create_fs(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def test_listing_shared(self):
+        self.assertEqual(self._create_fs().listdir("/data"), ["sub/", "a.txt"])
+        self.assertEqual(self._create_fs().listdir("/data/"), ["sub/", "a.txt"])
+
+        self.storage.listdir.assert_called_once_with("/data")
+
+    def test_incomplete_listing_not_shared(self):
+        fs = self._create_fs()
+        entries = fs.iter_listdir("/data")
+        next(entries)
+        entries.close()
+
+        self._create_fs().listdir("/data")
+
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_large_listing_not_shared(self):
+        fs = self._create_fs()
+        fs.shared_listing_size = 1
+        fs.listdir("/data")
+
+        self._create_fs().listdir("/data")
+
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_listing_in_progress_not_waited_for(self):
+        fs = self._create_fs()
+        entries = fs.iter_listdir("/data")
+        next(entries)
+
+        with mock.patch("time.sleep") as sleep:
+            self.assertEqual(self._create_fs().listdir("/data"), ["sub/", "a.txt"])
+        sleep.assert_not_called()
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+        # the first session still stores its listing
+        self.assertEqual(list(entries), ["a.txt"])
+        self._create_fs().listdir("/data")
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_large_listing_releases_lock(self):
+        fs = self._create_fs()
+        fs.shared_listing_size = 1
+        entries = fs.iter_listdir("/data")
+        next(entries)
+        next(entries)
+
+        other = self._create_fs()
+        self.assertEqual(other.listdir("/data"), ["sub/", "a.txt"])
+        # the other session was the loader and stored the listing
+        self._create_fs().listdir("/data")
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_write_invalidates(self):
+        fs = self._create_fs()
+        fs.listdir("/data")
+        fs.remove("/data/a.txt")
+
+        self._create_fs().listdir("/data")
+
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+    def test_metadata_shared(self):
+        def load_metadata(path):
+            load_metadata.calls += 1
+            return {"_exists": True, "isdir": False}
+
+        load_metadata.calls = 0
+        for _ in range(2):
+            fs = self._create_fs()
+            fs.load_metadata = load_metadata
+            self.assertTrue(fs.isfile("/data/a.txt"))
+
+        self.assertEqual(load_metadata.calls, 1)
+        self.storage.exists.assert_not_called()
+
+    def test_change_token_not_shared(self):
+        fs = self._create_fs()
+        fs.change_token = mock.Mock(return_value=1)
+        fs.listdir("/data")
+
+        self._create_fs().listdir("/data")
+
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+
+class SingleFlightTest(TestCase):
+    """Tests for SingleFlight."""
+
+    def _run_concurrently(self, single_flight, func, count=3):
+        """call single_flight.do from count threads while the first call runs."""
+        results = []
+
+        def call():
+            try:
+                results.append(single_flight.do("key", func))
+            except ValueError as exc:
+                results.append(exc)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        threads[0].start()
+        self.started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        self.finish.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def setUp(self):
+        self.started = threading.Event()
+        self.finish = threading.Event()
+        self.calls = 0
+
+    def _slow(self, result):
+        def func():
+            self.calls += 1
+            self.started.set()
+            self.finish.wait(2)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        return func
+
+    def test_concurrent_calls_shared(self):
+        single_flight = SingleFlight()
+        results = self._run_concurrently(single_flight, self._slow("value"))
+
+        self.assertEqual(results, ["value"] * 3)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(single_flight.get_stats(), {"calls": 1, "shared": 2})
+
+    def test_exception_shared(self):
+        single_flight = SingleFlight()
+        error = ValueError("backend down")
+        results = self._run_concurrently(single_flight, self._slow(error))
+
+        self.assertEqual(results, [error] * 3)
+        self.assertEqual(self.calls, 1)
+
+    def test_sequential_calls_not_shared(self):
+        single_flight = SingleFlight()
+        func = mock.Mock(side_effect=[1, 2])
+        self.assertEqual(single_flight.do("key", func), 1)
+        self.assertEqual(single_flight.do("key", func), 2)
+
+    def test_same_thread_does_not_wait(self):
+        single_flight = SingleFlight()
+        flight, leader = single_flight.join("key")
+        self.assertTrue(leader)
+        self.assertEqual(single_flight.do("key", lambda: 1), 1)
+        single_flight.finish("key", flight, result=2)
+        self.assertEqual(single_flight.get_stats()["shared"], 0)
+
+    def test_wait_timeout(self):
+        single_flight = SingleFlight(timeout=0.01)
+        flight, leader = single_flight.join("key")
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(single_flight.do("key", lambda: 1))
+        )
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [1])
+        single_flight.finish("key", flight, result=2)
+
+
+class StorageFSSingleFlightTest(TestCase):
+    """Tests for sharing concurrent backend calls between sessions."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        self.started = threading.Event()
+        self.finish = threading.Event()
+        patcher = mock.patch.object(StorageFS, "single_flight", SingleFlight())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create_fs(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def _blocking(self, result):
+        def func(path):
+            self.started.set()
+            self.finish.wait(2)
+            return result
+
+        return func
+
+    def _run_sessions(self, call):
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda fs=self._create_fs(): results.append(call(fs))
+            )
+            for _ in range(3)
+        ]
+        threads[0].start()
+        self.started.wait(2)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        self.finish.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_listdir_shared(self):
+        self.storage.listdir.side_effect = self._blocking((["sub"], ["a.txt"]))
+
+        results = self._run_sessions(lambda fs: fs.listdir("/data"))
+
+        self.assertEqual(results, [["sub/", "a.txt"]] * 3)
+        self.storage.listdir.assert_called_once_with("/data")
+
+    @override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+    def test_exists_shared(self):
+        self.storage.exists.side_effect = self._blocking(True)
+
+        results = self._run_sessions(lambda fs: fs.isfile("/data/a.txt"))
+
+        self.assertEqual(results, [True] * 3)
+        self.storage.exists.assert_called_once_with("/data/a.txt")
+
+    def test_large_listing_not_shared(self):
+        self.storage.listdir.side_effect = self._blocking((["sub"], ["a.txt"]))
+
+        def listdir(fs):
+            fs.metadata_cache_size = 1
+            return fs.listdir("/data")
+
+        results = self._run_sessions(listdir)
+
+        self.assertEqual(results, [["sub/", "a.txt"]] * 3)
+        self.assertEqual(self.storage.listdir.call_count, 3)
+
+
+class StorageFSDeferralTest(TestCase):
+    """Tests for deferred backend calls of StorageFS."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            self.fs = StorageFS("/", mock.Mock())
+
+    def test_not_deferred_by_default(self):
+        self.fs.remove("/a.txt")
+        self.storage.delete.assert_called_once_with("/a.txt")
+
+    def test_deferred_and_resolved(self):
+        self.fs.begin_deferral()
+
+        with self.assertRaises(DeferredCall) as cm:
+            self.fs.remove("/a.txt")
+        self.storage.delete.assert_not_called()
+        self.assertEqual(cm.exception.key, ("remove", "/a.txt"))
+
+        self.fs.resolve_deferred(cm.exception.key, cm.exception.call())
+        self.fs.remove("/a.txt")
+        self.storage.delete.assert_called_once_with("/a.txt")
+
+    def test_error_resolved(self):
+        self.fs.begin_deferral()
+        error = OSError("backend error")
+        self.fs.resolve_deferred(("remove", "/a.txt"), error=error)
+
+        with self.assertRaises(OSError):
+            self.fs.remove("/a.txt")
+
+    def test_other_thread_not_deferred(self):
+        self.fs.begin_deferral()
+        thread = threading.Thread(target=self.fs.remove, args=("/a.txt",))
+        thread.start()
+        thread.join()
+        self.storage.delete.assert_called_once_with("/a.txt")
+
+    @override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+    def test_cached_metadata_not_deferred(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            self.fs = StorageFS("/", mock.Mock())
+        self.storage.exists.return_value = True
+        self.assertTrue(self.fs.isfile("/a.txt"))
+
+        self.fs.begin_deferral()
+
+        self.assertTrue(self.fs.isfile("/a.txt"))
+        with self.assertRaises(DeferredCall):
+            self.fs.isfile("/b.txt")
+
+    def test_abort_closes_opened_files(self):
+        fd = mock.Mock()
+        self.fs.begin_deferral()
+        self.fs.resolve_deferred(("open", "/a.txt", "rb"), fd)
+
+        self.fs.end_deferral(abort=True)
+
+        fd.close.assert_called_once_with()
+        self.assertIsNone(self.fs._deferral)
+
+
+class StorageFSGuardTest(TestCase):
+    """Tests for backend calls of StorageFS made through a StorageGuard."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        self.guard = StorageGuard(
+            retries=2, backoff=0, breaker=CircuitBreaker(failure_threshold=2)
+        )
+
+    def _create_fs(self, guard):
+        with (
+            mock.patch(
+                "django_ftpserver.filesystems.storages", {"default": self.storage}
+            ),
+            mock.patch(
+                "django_ftpserver.filesystems.get_storage_guard", return_value=guard
+            ),
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def test_idempotent_call_retried(self):
+        fs = self._create_fs(self.guard)
+        self.storage.exists.side_effect = [ConnectionResetError, True]
+
+        self.assertTrue(fs.lexists("/a.txt"))
+
+        self.assertEqual(self.storage.exists.call_count, 2)
+        self.assertEqual(self.guard.get_stats()["retries"], 1)
+
+    def test_open_for_reading_retried(self):
+        fs = self._create_fs(self.guard)
+        self.storage.open.side_effect = [ConnectionResetError, mock.sentinel.fd]
+
+        self.assertIs(fs.open("a.txt", "rb"), mock.sentinel.fd)
+
+    def test_open_for_writing_not_retried(self):
+        fs = self._create_fs(self.guard)
+        self.storage.open.side_effect = ConnectionResetError
+
+        with self.assertRaises(StorageUnavailable):
+            fs.open("a.txt", "wb")
+
+        self.storage.open.assert_called_once_with("/a.txt", "wb")
+
+    def test_permanent_error_raised(self):
+        fs = self._create_fs(self.guard)
+        self.storage.delete.side_effect = PermissionError
+
+        with self.assertRaises(PermissionError):
+            fs.remove("/a.txt")
+
+        self.storage.delete.assert_called_once_with("/a.txt")
+
+    def test_listing_first_page_retried(self):
+        fs = self._create_fs(self.guard)
+        self.storage.listdir.side_effect = [ConnectionResetError, (["d"], ["f"])]
+
+        self.assertEqual(fs.listdir("/"), ["d/", "f"])
+
+    def test_breaker_fails_fast(self):
+        guard = StorageGuard(retries=0, breaker=CircuitBreaker(failure_threshold=2))
+        fs = self._create_fs(guard)
+        self.storage.delete.side_effect = ConnectionResetError
+        for _ in range(2):
+            with self.assertRaises(StorageUnavailable):
+                fs.remove("/a.txt")
+
+        with self.assertRaises(StorageUnavailable):
+            fs.remove("/a.txt")
+
+        self.assertEqual(self.storage.delete.call_count, 2)
+
+    @override_settings(FTPSERVER_METADATA_CACHE_TIMEOUT=2)
+    def test_cached_values_not_guarded(self):
+        fs = self._create_fs(self.guard)
+        self.storage.exists.return_value = True
+        fs.lexists("/a.txt")
+        calls = self.guard.get_stats()["calls"]
+
+        fs.lexists("/a.txt")
+
+        self.assertEqual(self.guard.get_stats()["calls"], calls)
+
+    def test_disabled(self):
+        fs = self._create_fs(None)
+        self.assertIsNone(fs.storage_guard)
+        self.storage.exists.side_effect = ConnectionResetError
+
+        with self.assertRaises(ConnectionResetError):
+            fs.lexists("/a.txt")
+
+
+class RecordingUploadWriter(MultipartUploadWriter):
+    """MultipartUploadWriter recording its backend calls."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("part_size", 4)
+        super().__init__("/a.txt", *args, **kwargs)
+        self.calls = []
+        self.parts = {}
+
+    def start_upload(self):
+        self.calls.append("start")
+
+    def upload_part(self, number, data):
+        self.parts[number] = data
+        return number
+
+    def complete_upload(self, parts):
+        self.calls.append(("complete", parts))
+
+    def abort_upload(self):
+        self.calls.append("abort")
+
+    def put_object(self, data):
+        self.calls.append(("put", data))
+
+
+class FakeUploadState:
+    """Stand-in for an FTPUpload, recording saves and deletes."""
+
+    def __init__(self, pk=None, upload_id="", parts=()):
+        self.pk = pk
+        self.upload_id = upload_id
+        self.parts = [list(part) for part in parts]
+        self.size = sum(size for result, size in self.parts)
+        self.saved = []
+        self.deleted = False
+
+    def save(self):
+        if self.pk is None:
+            self.pk = 1
+        self.saved.append((self.upload_id, list(self.parts), self.size))
+
+    def delete(self):
+        self.deleted = True
+        self.pk = None
+
+
+class ResumableUploadWriter(RecordingUploadWriter):
+    """RecordingUploadWriter whose uploads can be resumed."""
+
+    resumable = True
+
+    def start_upload(self):
+        super().start_upload()
+        self.upload_id = "id"
+
+
+class MultipartUploadWriterTest(TestCase):
+    """Tests for MultipartUploadWriter."""
+
+    def _wait_for(self, predicate):
+        for _ in range(200):
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail("timed out")
+
+    def test_small_file_uploaded_at_once(self):
+        writer = RecordingUploadWriter()
+        writer.write(b"abc")
+        writer.close()
+
+        self.assertEqual(writer.calls, [("put", b"abc")])
+        self.assertTrue(writer.closed)
+
+    def test_empty_file(self):
+        writer = RecordingUploadWriter()
+        writer.close()
+        self.assertEqual(writer.calls, [("put", b"")])
+
+    def test_parts(self):
+        writer = RecordingUploadWriter()
+        self.assertEqual(writer.write(b"abcdef"), 6)
+        writer.write(b"ghij")
+        writer.close()
+
+        self.assertEqual(writer.parts, {1: b"abcd", 2: b"efgh", 3: b"ij"})
+        self.assertEqual(writer.calls, ["start", ("complete", [1, 2, 3])])
+
+    def test_parts_in_flight_limited(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        in_flight = []
+
+        class SlowWriter(RecordingUploadWriter):
+            def upload_part(self, number, data):
+                in_flight.append(number)
+                release.wait(5)
+                return number
+
+        writer = SlowWriter(part_size=1, concurrency=2)
+        writer.write(b"ab")
+        blocked = threading.Thread(target=writer.write, args=(b"c",))
+        blocked.start()
+        self._wait_for(lambda: len(in_flight) == 2)
+        time.sleep(0.05)
+
+        self.assertTrue(blocked.is_alive())
+        self.assertEqual(len(in_flight), 2)
+        release.set()
+        blocked.join(5)
+        writer.close()
+        self.assertEqual(writer.calls, ["start", ("complete", [1, 2, 3])])
+
+    def test_ready(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        class SlowWriter(RecordingUploadWriter):
+            def upload_part(self, number, data):
+                release.wait(5)
+                return number
+
+        writer = SlowWriter(part_size=1, concurrency=2)
+        writer.write(b"a")
+        self.assertTrue(writer.ready())
+        writer.write(b"b")
+        self.assertFalse(writer.ready())
+
+        release.set()
+        self._wait_for(writer.ready)
+        writer.close()
+
+    def test_close_async(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        class SlowWriter(RecordingUploadWriter):
+            def complete_upload(self, parts):
+                release.wait(5)
+                super().complete_upload(parts)
+
+        writer = SlowWriter()
+        writer.write(b"abcdef")
+        stored = writer.close_async()
+
+        self.assertTrue(writer.closed)
+        self.assertFalse(stored.done())
+        release.set()
+        self.assertIsNone(stored.result(5))
+        self.assertEqual(writer.calls, ["start", ("complete", [1, 2])])
+
+    def test_last_part_uploaded_in_order(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        in_flight = []
+        overlaps = []
+
+        class SlowWriter(RecordingUploadWriter):
+            def upload_part(self, number, data):
+                in_flight.append(number)
+                overlaps.append(len(in_flight))
+                release.wait(5)
+                in_flight.remove(number)
+                return super().upload_part(number, data)
+
+        writer = SlowWriter(concurrency=1)
+        writer.write(b"abcdef")
+        stored = writer.close_async()
+
+        self.assertFalse(stored.done())
+        release.set()
+        stored.result(5)
+        self.assertEqual(overlaps, [1, 1])
+        self.assertEqual(writer.calls, ["start", ("complete", [1, 2])])
+
+    def test_close_async_error(self):
+        class FailingWriter(RecordingUploadWriter):
+            def complete_upload(self, parts):
+                raise ValueError("complete failed")
+
+        writer = FailingWriter()
+        writer.write(b"abcdef")
+        stored = writer.close_async()
+
+        self.assertIsInstance(stored.exception(5), OSError)
+        self.assertEqual(stored.exception().errno, errno.EIO)
+        self._wait_for(lambda: "abort" in writer.calls)
+
+    def test_start_error(self):
+        class FailingWriter(RecordingUploadWriter):
+            def start_upload(self):
+                raise ValueError("start failed")
+
+        writer = FailingWriter()
+        writer.write(b"abcdef")
+
+        with self.assertRaises(OSError):
+            writer.close()
+        self.assertEqual(writer.parts, {})
+        time.sleep(0.05)
+        self.assertEqual(writer.calls, [])
+
+    def test_part_error(self):
+        class FailingWriter(RecordingUploadWriter):
+            def upload_part(self, number, data):
+                raise ValueError("upload failed")
+
+        writer = FailingWriter()
+        writer.write(b"abcd")
+
+        with self.assertRaises(OSError):
+            writer.close()
+        self._wait_for(lambda: "abort" in writer.calls)
+        self.assertNotIn("complete", [call[0] for call in writer.calls])
+
+    def test_part_error_raised_from_write(self):
+        class FailingWriter(RecordingUploadWriter):
+            def upload_part(self, number, data):
+                raise ValueError("upload failed")
+
+        writer = FailingWriter()
+        writer.write(b"abcd")
+        self._wait_for(lambda: writer._error is not None)
+
+        with self.assertRaises(OSError):
+            writer.write(b"efgh")
+        self.assertTrue(writer.closed)
+        self._wait_for(lambda: "abort" in writer.calls)
+
+    def test_discard(self):
+        writer = RecordingUploadWriter()
+        writer.write(b"abcdefgh")
+        writer.discard()
+
+        self._wait_for(lambda: "abort" in writer.calls)
+        self.assertEqual(writer.calls, ["start", "abort"])
+        writer.close()
+        self.assertEqual(writer.calls, ["start", "abort"])
+
+    def test_discard_before_upload(self):
+        writer = RecordingUploadWriter()
+        writer.write(b"ab")
+        writer.discard()
+        self.assertEqual(writer.calls, [])
+
+    def test_part_upload_retried(self):
+        failures = [ConnectionResetError()]
+
+        class FlakyWriter(RecordingUploadWriter):
+            def upload_part(self, number, data):
+                if failures:
+                    raise failures.pop()
+                return super().upload_part(number, data)
+
+        writer = FlakyWriter(guard=StorageGuard(retries=1, backoff=0))
+        writer.write(b"abcdef")
+        writer.close()
+
+        self.assertEqual(writer.parts, {1: b"abcd", 2: b"ef"})
+        self.assertEqual(writer.guard.get_stats()["retries"], 1)
+
+    def test_state_saved_and_deleted(self):
+        state = FakeUploadState()
+        writer = ResumableUploadWriter(state=state)
+        writer.write(b"abcdef")
+
+        self._wait_for(lambda: state.saved)
+        self.assertEqual(state.saved, [("id", [], 0)])
+        writer.close()
+        self.assertEqual(writer.calls, ["start", ("complete", [1, 2])])
+        self.assertTrue(state.deleted)
+
+    def test_state_ignored_if_not_resumable(self):
+        writer = RecordingUploadWriter(state=FakeUploadState())
+        self.assertIsNone(writer.state)
+
+    def test_discard_keeps_parts(self):
+        state = FakeUploadState()
+        writer = ResumableUploadWriter(state=state)
+        writer.write(b"abcdefghij")
+        writer.discard()
+
+        self._wait_for(lambda: len(state.saved) == 2)
+        self.assertEqual(state.saved[1], ("id", [[1, 4], [2, 4]], 8))
+        self.assertEqual(writer.calls, ["start"])
+        self.assertFalse(state.deleted)
+
+    def test_discard_keeps_parts_without_gap(self):
+        class FailingWriter(ResumableUploadWriter):
+            def upload_part(self, number, data):
+                if number == 2:
+                    raise ConnectionResetError()
+                return super().upload_part(number, data)
+
+        state = FakeUploadState()
+        writer = FailingWriter(state=state)
+        writer.write(b"abcdefghijkl")
+        writer._error = None
+        writer.discard()
+
+        self._wait_for(lambda: len(state.saved) == 2)
+        self.assertEqual(state.saved[1], ("id", [[1, 4]], 4))
+
+    def test_resume(self):
+        state = FakeUploadState(pk=1, upload_id="id", parts=[[1, 4], [2, 4]])
+        writer = ResumableUploadWriter(state=state)
+
+        self.assertTrue(writer.seekable())
+        self.assertEqual(writer.seek(8), 8)
+        writer.write(b"ij")
+        writer.close()
+
+        self.assertEqual(writer.parts, {3: b"ij"})
+        self.assertEqual(writer.calls, [("complete", [1, 2, 3])])
+        self.assertTrue(state.deleted)
+
+    def test_resume_replaces_later_parts(self):
+        state = FakeUploadState(pk=1, upload_id="id", parts=[[1, 4], [2, 4]])
+        writer = ResumableUploadWriter(state=state)
+
+        writer.seek(4)
+        self.assertEqual(writer.tell(), 4)
+        writer.write(b"EFGHij")
+        writer.close()
+
+        self.assertEqual(writer.parts, {2: b"EFGH", 3: b"ij"})
+        self.assertEqual(writer.calls, [("complete", [1, 2, 3])])
+
+    def test_resume_inside_part(self):
+        state = FakeUploadState(pk=1, upload_id="id", parts=[[1, 4], [2, 4]])
+        writer = ResumableUploadWriter(state=state)
+
+        with self.assertRaises(OSError) as cm:
+            writer.seek(6)
+
+        self.assertEqual(cm.exception.errno, errno.EINVAL)
+        self.assertEqual(
+            cm.exception.strerror, "Can't resume at 6, the upload can be resumed at 8"
+        )
+
+    def test_new_upload_not_seekable(self):
+        writer = ResumableUploadWriter(state=FakeUploadState())
+        self.assertFalse(writer.seekable())
+        with self.assertRaises(OSError):
+            writer.seek(0)
+
+    def test_resumed_upload_kept_without_data(self):
+        state = FakeUploadState(pk=1, upload_id="id", parts=[[1, 4]])
+        writer = ResumableUploadWriter(state=state)
+        writer.close()
+
+        self._wait_for(lambda: state.saved)
+        self.assertEqual(writer.calls, [])
+        self.assertEqual(state.saved, [("id", [[1, 4]], 4)])
+
+    def test_resumed_upload_finished_without_data(self):
+        state = FakeUploadState(pk=1, upload_id="id", parts=[[1, 4]])
+        writer = ResumableUploadWriter(state=state)
+        writer.finish()
+
+        self.assertEqual(writer.calls, [("complete", [1])])
+        self.assertTrue(state.deleted)
+
+    def test_abort(self):
+        state = FakeUploadState(pk=1, upload_id="id", parts=[[1, 4]])
+        writer = ResumableUploadWriter(state=state)
+        writer.abort()
+
+        self.assertEqual(writer.calls, ["abort"])
+        self.assertTrue(writer.closed)
+        self.assertTrue(state.deleted)
+
+    def test_abort_failed_keeps_state(self):
+        class FailingWriter(ResumableUploadWriter):
+            def abort_upload(self):
+                raise ConnectionResetError()
+
+        state = FakeUploadState(pk=1, upload_id="id")
+        with self.assertRaises(ConnectionResetError):
+            FailingWriter(state=state).abort()
+        self.assertFalse(state.deleted)
+
+
+class S3MultipartUploadWriterTest(TestCase):
+    """Tests for S3MultipartUploadWriter."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.bucket_name = "bucket"
+        self.storage._normalize_name.side_effect = lambda name: name
+        self.storage._get_write_parameters.return_value = {"ContentType": "text/plain"}
+        self.client = self.storage.connection.meta.client
+        self.client.create_multipart_upload.return_value = {"UploadId": "id"}
+        self.client.upload_part.side_effect = lambda **kwargs: {
+            "ETag": "etag{}".format(kwargs["PartNumber"])
+        }
+
+    def test_multipart_upload(self):
+        writer = S3MultipartUploadWriter(self.storage, "/data/a.txt", part_size=4)
+        writer.write(b"abcdef")
+        writer.close()
+
+        self.client.create_multipart_upload.assert_called_once_with(
+            Bucket="bucket", Key="data/a.txt", ContentType="text/plain"
+        )
+        self.assertEqual(
+            [c.kwargs["Body"] for c in self.client.upload_part.call_args_list],
+            [b"abcd", b"ef"],
+        )
+        self.client.complete_multipart_upload.assert_called_once_with(
+            Bucket="bucket",
+            Key="data/a.txt",
+            UploadId="id",
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": 1, "ETag": "etag1"},
+                    {"PartNumber": 2, "ETag": "etag2"},
+                ]
+            },
+        )
+
+    def test_small_file(self):
+        writer = S3MultipartUploadWriter(self.storage, "/a.txt", part_size=4)
+        writer.write(b"ab")
+        writer.close()
+
+        self.client.put_object.assert_called_once_with(
+            Bucket="bucket", Key="a.txt", Body=b"ab", ContentType="text/plain"
+        )
+        self.client.create_multipart_upload.assert_not_called()
+
+    def test_abort(self):
+        writer = S3MultipartUploadWriter(self.storage, "/a.txt", part_size=4)
+        writer.write(b"abcd")
+        writer.discard()
+        for _ in range(200):
+            if self.client.abort_multipart_upload.called:
+                break
+            time.sleep(0.01)
+
+        self.client.abort_multipart_upload.assert_called_once_with(
+            Bucket="bucket", Key="a.txt", UploadId="id"
+        )
+
+    def test_abort_already_aborted(self):
+        self.client.abort_multipart_upload.side_effect = ClientError("NoSuchUpload")
+        state = FakeUploadState(pk=1, upload_id="old")
+        writer = S3MultipartUploadWriter(self.storage, "/a.txt", state=state)
+
+        writer.abort()
+
+        self.client.abort_multipart_upload.assert_called_once_with(
+            Bucket="bucket", Key="a.txt", UploadId="old"
+        )
+        self.assertTrue(state.deleted)
+
+    def test_resume(self):
+        state = FakeUploadState(
+            pk=1, upload_id="old", parts=[[{"PartNumber": 1, "ETag": "e1"}, 4]]
+        )
+        writer = S3MultipartUploadWriter(
+            self.storage, "/a.txt", part_size=4, state=state
+        )
+        writer.seek(4)
+        writer.write(b"ef")
+        writer.close()
+
+        self.client.create_multipart_upload.assert_not_called()
+        self.client.upload_part.assert_called_once_with(
+            Bucket="bucket", Key="a.txt", UploadId="old", PartNumber=2, Body=b"ef"
+        )
+        self.client.complete_multipart_upload.assert_called_once_with(
+            Bucket="bucket",
+            Key="a.txt",
+            UploadId="old",
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": 1, "ETag": "e1"},
+                    {"PartNumber": 2, "ETag": "etag2"},
+                ]
+            },
+        )
+
+
+class GoogleCloudUploadWriterTest(TestCase):
+    """Tests for GoogleCloudUploadWriter."""
+
+    def test_resumable_upload(self):
+        storage = mock.Mock()
+        storage._normalize_name.side_effect = lambda name: name
+        blob = storage.bucket.blob.return_value
+
+        writer = GoogleCloudUploadWriter(storage, "/a.txt", part_size=4)
+        writer.write(b"abcdef")
+        writer.close()
+
+        self.assertEqual(writer.concurrency, 1)
+        storage.bucket.blob.assert_called_once_with("a.txt")
+        blob.open.assert_called_once_with("wb", chunk_size=4, content_type="text/plain")
+        stream = blob.open.return_value
+        self.assertEqual(
+            stream.write.call_args_list, [mock.call(b"abcd"), mock.call(b"ef")]
+        )
+        stream.close.assert_called_once_with()
+
+    def test_small_file(self):
+        storage = mock.Mock()
+        storage._normalize_name.side_effect = lambda name: name
+        blob = storage.bucket.blob.return_value
+
+        writer = GoogleCloudUploadWriter(storage, "/a.txt", part_size=4)
+        writer.write(b"ab")
+        writer.close()
+
+        blob.upload_from_string.assert_called_once_with(
+            b"ab", content_type="text/plain"
+        )
+        blob.open.assert_not_called()
+
+
+class StorageFSUploadTest(TestCase):
+    """Tests for streaming uploads of StorageFS."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "S3Storage"
+        self.storage._normalize_name.side_effect = lambda name: name
+
+    def _create_fs(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def test_open_for_writing(self):
+        fs = self._create_fs()
+        with self.settings(
+            FTPSERVER_UPLOAD_PART_SIZE=5 * 1024 * 1024, FTPSERVER_UPLOAD_CONCURRENCY=2
+        ):
+            writer = fs.open("a.txt", "wb")
+
+        self.assertIsInstance(writer, S3MultipartUploadWriter)
+        self.assertEqual(writer.name, "/a.txt")
+        self.assertEqual(writer.part_size, 5 * 1024 * 1024)
+        self.assertEqual(writer.concurrency, 2)
+        self.assertIs(writer.guard, fs.storage_guard)
+        self.storage.open.assert_not_called()
+
+    def test_other_modes(self):
+        fs = self._create_fs()
+        for mode in ("ab", "r+b"):
+            self.assertIs(fs.open("a.txt", mode), self.storage.open.return_value)
+
+    def test_disabled(self):
+        fs = self._create_fs()
+        with self.settings(FTPSERVER_UPLOAD_PART_SIZE=0):
+            self.assertIs(fs.open("a.txt", "wb"), self.storage.open.return_value)
+
+    def test_not_supported(self):
+        self.storage.__class__.__name__ = "MockStorage"
+        fs = self._create_fs()
+        self.assertIs(fs.open("a.txt", "wb"), self.storage.open.return_value)
+
+    def test_abandoned_writer_discarded(self):
+        fs = self._create_fs()
+        fs.begin_deferral()
+        writer = RecordingUploadWriter()
+        writer.write(b"ab")
+        fs.resolve_deferred(("open", "a.txt", "wb"), writer)
+
+        fs.end_deferral(abort=True)
+
+        self.assertTrue(writer.closed)
+        self.assertEqual(writer.calls, [])
+
+
+class IsLocalFileTest(TestCase):
+    """Tests for is_local_file."""
+
+    def test_os_file(self):
+        with tempfile.TemporaryFile() as file:
+            self.assertTrue(is_local_file(file))
+
+    def test_django_file(self):
+        from django.core.files import File
+
+        with tempfile.TemporaryFile() as file:
+            self.assertTrue(is_local_file(File(file)))
+
+    def test_in_memory_files(self):
+        self.assertFalse(is_local_file(io.BytesIO(b"abc")))
+        with tempfile.SpooledTemporaryFile() as file:
+            self.assertFalse(is_local_file(file))
+        self.assertFalse(is_local_file(RecordingDownloadReader()))
+
+
+class StorageFSResumableUploadTest(TestCase):
+    """Tests for resumable uploads of StorageFS."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "S3Storage"
+        self.storage._normalize_name.side_effect = lambda name: name
+        self.storage.exists.return_value = False
+        self.storage.size.side_effect = FileNotFoundError
+        self.client = self.storage.connection.meta.client
+        self.client.upload_part.side_effect = lambda **kwargs: {
+            "ETag": "etag{}".format(kwargs["PartNumber"])
+        }
+        settings = self.settings(
+            FTPSERVER_RESUMABLE_UPLOADS=True,
+            FTPSERVER_UPLOAD_PART_SIZE=4,
+            FTPSERVER_METADATA_CACHE_TIMEOUT=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _create_fs(self, username="user"):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock(username=username))
+
+    def _create_upload(self, username="user", **kwargs):
+        kwargs.setdefault("upload_id", "id")
+        kwargs.setdefault("parts", [[{"PartNumber": 1, "ETag": "etag1"}, 4]])
+        kwargs.setdefault("size", 4)
+        return models.FTPUpload.objects.create(
+            storage="default", username=username, path="/a.txt", **kwargs
+        )
+
+    def test_new_upload_has_state(self):
+        fs = self._create_fs()
+        writer = fs.open("a.txt", "wb")
+
+        self.assertIsInstance(writer, S3MultipartUploadWriter)
+        self.assertIsNone(writer.state.pk)
+        self.assertEqual(writer.state.storage, "default")
+        self.assertEqual(writer.state.username, "user")
+        self.assertEqual(writer.state.path, "/a.txt")
+
+    def test_new_upload_aborts_interrupted_uploads(self):
+        upload = self._create_upload(username="other")
+        fs = self._create_fs()
+
+        fs.open("a.txt", "wb")
+
+        self.client.abort_multipart_upload.assert_called_once_with(
+            Bucket=self.storage.bucket_name, Key="a.txt", UploadId="id"
+        )
+        self.assertFalse(models.FTPUpload.objects.filter(pk=upload.pk).exists())
+
+    def test_interrupted_upload_reported_as_file(self):
+        upload = self._create_upload()
+        fs = self._create_fs()
+
+        self.assertTrue(fs.isfile("/a.txt"))
+        self.assertEqual(fs.getsize("/a.txt"), 4)
+        self.assertEqual(fs.getmtime("/a.txt"), upload.updated.timestamp())
+        self.assertFalse(fs.isfile("/b.txt"))
+
+    def test_resume(self):
+        self._create_upload()
+        fs = self._create_fs()
+
+        writer = fs.open("/a.txt", "r+b")
+
+        self.assertIsInstance(writer, S3MultipartUploadWriter)
+        self.assertEqual(writer.upload_id, "id")
+        self.assertEqual(writer.seek(4), 4)
+        self.storage.open.assert_not_called()
+
+    def test_resume_at_offset(self):
+        self._create_upload()
+        fs = self._create_fs()
+
+        writer = fs.open("/a.txt", "r+b", 4)
+
+        self.assertEqual(writer.tell(), 4)
+
+    def test_append(self):
+        self._create_upload()
+        fs = self._create_fs()
+
+        writer = fs.open("/a.txt", "ab")
+
+        self.assertEqual(writer.tell(), 4)
+        self.storage.open.assert_not_called()
+
+    def test_other_account_not_resumed(self):
+        self._create_upload(username="other")
+        fs = self._create_fs()
+
+        self.assertFalse(fs.isfile("/a.txt"))
+        self.assertIs(fs.open("/a.txt", "r+b"), self.storage.open.return_value)
+
+    def test_disabled(self):
+        self._create_upload()
+        with self.settings(FTPSERVER_RESUMABLE_UPLOADS=False):
+            fs = self._create_fs()
+
+        self.assertFalse(fs.resumable_uploads)
+        self.assertFalse(fs.isfile("/a.txt"))
+        self.assertIsNone(fs.open("a.txt", "wb").state)
+        self.assertIs(fs.open("/a.txt", "r+b"), self.storage.open.return_value)
+
+    def test_not_resumable(self):
+        self.storage.__class__.__name__ = "GoogleCloudStorage"
+        fs = self._create_fs()
+        self.assertFalse(fs.resumable_uploads)
+
+    def test_abort_stored_upload(self):
+        upload = self._create_upload()
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            StorageFS.abort_stored_upload(upload)
+
+        self.client.abort_multipart_upload.assert_called_once_with(
+            Bucket=self.storage.bucket_name, Key="a.txt", UploadId="id"
+        )
+        self.assertFalse(models.FTPUpload.objects.filter(pk=upload.pk).exists())
+
+    def test_abort_stored_upload_failed(self):
+        upload = self._create_upload()
+        self.client.abort_multipart_upload.side_effect = ClientError("AccessDenied")
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            with self.assertRaises(ClientError):
+                StorageFS.abort_stored_upload(upload)
+
+        self.assertTrue(models.FTPUpload.objects.filter(pk=upload.pk).exists())
+
+
+class RecordingDownloadReader(RangedDownloadReader):
+    """RangedDownloadReader serving data from memory, recording ranges."""
+
+    first_chunk_size = 2
+
+    def __init__(self, data=b"abcdefghij", **kwargs):
+        kwargs.setdefault("chunk_size", 4)
+        super().__init__("/a.txt", **kwargs)
+        self.data = data
+        self.ranges = []
+
+    def read_range(self, start, end):
+        self.ranges.append((start, end))
+        return self.data[start : end + 1], len(self.data)
+
+
+class RangedDownloadReaderTest(TestCase):
+    """Tests for RangedDownloadReader."""
+
+    def _wait_for(self, predicate):
+        for _ in range(200):
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail("timed out")
+
+    def test_read(self):
+        reader = RecordingDownloadReader()
+        reader.start()
+
+        chunks = []
+        while True:
+            chunk = reader.read(3)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+        self.assertEqual(b"".join(chunks), b"abcdefghij")
+        self.assertEqual(sorted(reader.ranges), [(0, 1), (2, 5), (6, 9)])
+        self.assertEqual(reader.size, 10)
+
+    def test_read_all(self):
+        reader = RecordingDownloadReader()
+        reader.start()
+        self.assertEqual(reader.read(), b"abcdefghij")
+        self.assertEqual(reader.tell(), 10)
+
+    def test_empty_file(self):
+        reader = RecordingDownloadReader(b"")
+        reader.start()
+        self.assertEqual(reader.read(65536), b"")
+        self.assertEqual(reader.ranges, [(0, 1)])
+
+    def test_read_ahead_limited(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        requested = []
+
+        class SlowReader(RecordingDownloadReader):
+            def read_range(self, start, end):
+                requested.append(start)
+                if start:
+                    release.wait(5)
+                return super().read_range(start, end)
+
+        reader = SlowReader(b"x" * 100, chunk_size=2, read_ahead=2)
+        reader.start()
+        self._wait_for(lambda: len(requested) == 3)
+        time.sleep(0.05)
+
+        self.assertEqual(sorted(requested), [0, 2, 4])
+        self.assertEqual(reader.read(2), b"xx")
+        self.assertFalse(reader.ready())
+        release.set()
+        self._wait_for(reader.ready)
+        self.assertEqual(reader.read(), b"x" * 98)
+
+    def test_seek_within_range(self):
+        reader = RecordingDownloadReader()
+        reader.start()
+        reader.read(1)
+
+        self.assertEqual(reader.seek(0), 0)
+
+        self.assertEqual(reader.read(), b"abcdefghij")
+        self.assertEqual(sorted(reader.ranges), [(0, 1), (2, 5), (6, 9)])
+
+    def test_seek_fetches_from_offset(self):
+        reader = RecordingDownloadReader()
+        reader.start()
+
+        reader.seek(7)
+
+        self.assertEqual(reader.tell(), 7)
+        self.assertEqual(reader.read(), b"hij")
+        self.assertEqual(reader.ranges[0], (0, 1))
+        self.assertIn((7, 9), reader.ranges)
+
+    def test_start_at_offset(self):
+        reader = RecordingDownloadReader()
+        reader.start(5)
+
+        self.assertEqual(reader.tell(), 5)
+        self.assertEqual(reader.read(), b"fghij")
+        self.assertEqual(sorted(reader.ranges), [(5, 6), (7, 9)])
+
+    def test_start_after_end(self):
+        reader = RecordingDownloadReader()
+        reader.start(12)
+        self.assertEqual(reader.size, 10)
+        self.assertEqual(reader.read(), b"")
+
+    def test_seek_whence(self):
+        reader = RecordingDownloadReader()
+        reader.start()
+        self.assertEqual(reader.seek(-2, os.SEEK_END), 8)
+        self.assertEqual(reader.seek(1, os.SEEK_CUR), 9)
+        self.assertEqual(reader.read(), b"j")
+        with self.assertRaises(ValueError):
+            reader.seek(-1)
+
+    def test_range_error(self):
+        class FailingReader(RecordingDownloadReader):
+            def read_range(self, start, end):
+                if start:
+                    raise ValueError("download failed")
+                return super().read_range(start, end)
+
+        reader = FailingReader()
+        reader.start()
+        reader.read(2)
+
+        with self.assertRaises(OSError):
+            reader.read(2)
+        self.assertTrue(reader.closed)
+
+    def test_range_retried(self):
+        failures = [ConnectionResetError()]
+
+        class FlakyReader(RecordingDownloadReader):
+            def read_range(self, start, end):
+                if start and failures:
+                    raise failures.pop()
+                return super().read_range(start, end)
+
+        reader = FlakyReader(guard=StorageGuard(retries=1, backoff=0))
+        reader.start()
+
+        self.assertEqual(reader.read(), b"abcdefghij")
+        self.assertEqual(reader.guard.get_stats()["retries"], 1)
+
+    def test_close(self):
+        reader = RecordingDownloadReader()
+        reader.start()
+        reader.close()
+
+        self.assertTrue(reader.closed)
+        self.assertTrue(reader.ready())
+        with self.assertRaises(ValueError):
+            reader.read(1)
+
+
+class ClientError(Exception):
+    """Stand-in for botocore.exceptions.ClientError."""
+
+    def __init__(self, code, headers=None):
+        super().__init__(code)
+        self.response = {
+            "Error": {"Code": code},
+            "ResponseMetadata": {"HTTPHeaders": headers or {}},
+        }
+
+
+class S3RangedDownloadReaderTest(TestCase):
+    """Tests for S3RangedDownloadReader."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.bucket_name = "bucket"
+        self.storage._normalize_name.side_effect = lambda name: name
+        self.client = self.storage.connection.meta.client
+        data = b"abcdefghij"
+
+        def get_object(Range, **kwargs):
+            start, end = (int(i) for i in Range[len("bytes=") :].split("-"))
+            end = min(end, len(data) - 1)
+            return {
+                "Body": io.BytesIO(data[start : end + 1]),
+                "ContentRange": "bytes {}-{}/{}".format(start, end, len(data)),
+                "ETag": '"etag"',
+            }
+
+        self.client.get_object.side_effect = get_object
+
+    def _getOne(self):
+        reader = S3RangedDownloadReader(self.storage, "/data/a.txt", chunk_size=4)
+        reader.first_chunk_size = 2
+        return reader
+
+    def test_ranged_get(self):
+        reader = self._getOne()
+        reader.start()
+
+        self.assertEqual(reader.read(), b"abcdefghij")
+        self.assertEqual(reader.size, 10)
+        calls = self.client.get_object.call_args_list
+        self.assertEqual(
+            calls[0], mock.call(Bucket="bucket", Key="data/a.txt", Range="bytes=0-1")
+        )
+        self.assertEqual(
+            sorted(c.kwargs["Range"] for c in calls[1:]),
+            ["bytes=2-5", "bytes=6-9"],
+        )
+        self.assertTrue(all(c.kwargs["IfMatch"] == '"etag"' for c in calls[1:]))
+
+    def test_missing(self):
+        self.client.get_object.side_effect = ClientError("NoSuchKey")
+        with self.assertRaises(FileNotFoundError):
+            self._getOne().start()
+
+    def test_empty(self):
+        self.client.get_object.side_effect = ClientError(
+            "InvalidRange", {"content-range": "bytes */0"}
+        )
+        reader = self._getOne()
+        reader.start()
+        self.assertEqual(reader.size, 0)
+        self.assertEqual(reader.read(), b"")
+        self.client.head_object.assert_not_called()
+
+    def test_start_at_offset(self):
+        reader = self._getOne()
+        reader.start(7)
+
+        self.assertEqual(reader.read(), b"hij")
+        self.assertEqual(
+            self.client.get_object.call_args_list[0],
+            mock.call(Bucket="bucket", Key="data/a.txt", Range="bytes=7-8"),
+        )
+        self.assertEqual(reader.size, 10)
+
+    def test_start_at_end(self):
+        self.client.get_object.side_effect = ClientError("InvalidRange")
+        self.client.head_object.return_value = {"ContentLength": 10}
+        reader = self._getOne()
+        reader.start(10)
+
+        self.assertEqual(reader.size, 10)
+        self.assertEqual(reader.read(), b"")
+        self.client.head_object.assert_called_once_with(
+            Bucket="bucket", Key="data/a.txt"
+        )
+
+    def test_other_error(self):
+        self.client.get_object.side_effect = ClientError("AccessDenied")
+        with self.assertRaises(ClientError):
+            self._getOne().start()
+
+
+class GoogleCloudDownloadReaderTest(TestCase):
+    """Tests for GoogleCloudDownloadReader."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage._normalize_name.side_effect = lambda name: name
+        self.blob = self.storage.bucket.get_blob.return_value
+        self.blob.size = 10
+        self.blob.generation = 7
+        data = b"abcdefghij"
+        self.blob.download_as_bytes.side_effect = lambda start, end, **kwargs: data[
+            start : end + 1
+        ]
+
+    def test_ranged_download(self):
+        reader = GoogleCloudDownloadReader(self.storage, "/a.txt", chunk_size=4)
+        reader.first_chunk_size = 2
+        reader.start()
+
+        self.assertEqual(reader.read(), b"abcdefghij")
+        self.storage.bucket.get_blob.assert_called_once_with("a.txt")
+        self.blob.download_as_bytes.assert_any_call(
+            start=6, end=9, if_generation_match=7
+        )
+
+    def test_missing(self):
+        self.storage.bucket.get_blob.return_value = None
+        reader = GoogleCloudDownloadReader(self.storage, "/a.txt")
+        with self.assertRaises(FileNotFoundError):
+            reader.start()
+
+    def test_empty(self):
+        self.blob.size = 0
+        reader = GoogleCloudDownloadReader(self.storage, "/a.txt")
+        reader.start()
+        self.assertEqual(reader.read(), b"")
+        self.blob.download_as_bytes.assert_not_called()
+
+
+class StorageFSDownloadTest(TestCase):
+    """Tests for streaming downloads of StorageFS."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "S3Storage"
+        self.storage._normalize_name.side_effect = lambda name: name
+        self.client = self.storage.connection.meta.client
+        self.client.get_object.side_effect = lambda **kwargs: {
+            "Body": io.BytesIO(b"abc"),
+            "ContentRange": "bytes 0-2/3",
+        }
+
+    def _create_fs(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            return StorageFS("/", mock.Mock())
+
+    def test_open_for_reading(self):
+        fs = self._create_fs()
+        with self.settings(
+            FTPSERVER_DOWNLOAD_CHUNK_SIZE=1024 * 1024, FTPSERVER_DOWNLOAD_READ_AHEAD=3
+        ):
+            reader = fs.open("a.txt", "rb")
+
+        self.assertIsInstance(reader, S3RangedDownloadReader)
+        self.assertEqual(reader.name, "/a.txt")
+        self.assertEqual(reader.chunk_size, 1024 * 1024)
+        self.assertEqual(reader.read_ahead, 3)
+        self.assertIs(reader.guard, fs.storage_guard)
+        self.assertEqual(reader.read(), b"abc")
+        self.storage.open.assert_not_called()
+
+    def test_open_at_offset(self):
+        fs = self._create_fs()
+        reader = fs.open("a.txt", "rb", 2)
+
+        self.assertEqual(reader.read(), b"abc")
+        self.assertEqual(
+            self.client.get_object.call_args.kwargs["Range"], "bytes=2-262145"
+        )
+
+    def test_disabled(self):
+        fs = self._create_fs()
+        with self.settings(FTPSERVER_DOWNLOAD_CHUNK_SIZE=0):
+            self.assertIs(fs.open("a.txt", "rb"), self.storage.open.return_value)
+
+    def test_disabled_open_at_offset(self):
+        fs = self._create_fs()
+        with self.settings(FTPSERVER_DOWNLOAD_CHUNK_SIZE=0):
+            file = fs.open("a.txt", "rb", 5)
+        file.seek.assert_called_once_with(5)
+
+    def test_not_supported(self):
+        self.storage.__class__.__name__ = "MockStorage"
+        fs = self._create_fs()
+        self.assertIs(fs.open("a.txt", "rb"), self.storage.open.return_value)
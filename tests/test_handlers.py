@@ -1,14 +1,39 @@
-from unittest import skipIf
+import errno
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from unittest import mock, skipIf
 
 from django.test import TestCase
+from pyftpdlib.authorizers import AuthenticationFailed
 
 from django_ftpserver import signals
+from django_ftpserver.filesystems import RangedDownloadReader, StorageFS
 from django_ftpserver.handlers import (
+    DeferredAuthMixin,
+    DeferredStorageMixin,
     DjangoFTPHandler,
     DjangoTLS_FTPHandler,
+    DownloadReadAheadMixin,
+    LoginThrottleMixin,
+    ReadAheadProducer,
+    RestartOffsetMixin,
+    SendfileMixin,
     SignalEmitterMixin,
+    StorageUnavailableMixin,
+    StreamingListMixin,
+    UploadBackpressureMixin,
+    UploadCompletionMixin,
     HAS_TLS,
 )
+from django_ftpserver.resilience import (
+    CircuitBreaker,
+    StorageGuard,
+    StorageTimeout,
+    in_loop_thread,
+    unmark_loop_thread,
+)
+from django_ftpserver.throttling import LoginThrottle
 
 
 class MockFS:
@@ -281,6 +306,1238 @@ class SignalEmitterMixinTest(TestCase):
             signals.ftp_directory_deleted.disconnect(receiver)
 
 
+class MockAuthHandler:
+    """Mock handler for testing DeferredAuthMixin."""
+
+    authenticated = False
+    username = "testuser"
+    _closed = False
+
+    def __init__(self):
+        self.ioloop = mock.Mock()
+        self.authorizer = mock.Mock()
+        self.calls = []
+
+    def ftp_PASS(self, line):
+        self.calls.append(("ftp_PASS", line))
+
+    def del_channel(self):
+        self.calls.append(("del_channel",))
+
+    def add_channel(self):
+        self.calls.append(("add_channel",))
+
+    def handle_error(self):
+        pass
+
+    def handle_auth_failed(self, msg, password):
+        self.calls.append(("handle_auth_failed", msg, password))
+
+    def handle_auth_success(self, home, password, msg_login):
+        self.calls.append(("handle_auth_success", home, password, msg_login))
+
+    def close(self):
+        self.calls.append(("close",))
+
+
+class TestAuthHandler(DeferredAuthMixin, MockAuthHandler):
+    """Test handler combining DeferredAuthMixin with mock."""
+
+    pass
+
+
+class DeferredAuthMixinTest(TestCase):
+    """Tests for DeferredAuthMixin."""
+
+    def _getOne(self, executor):
+        handler = TestAuthHandler()
+        handler.get_auth_executor = lambda: executor
+        return handler
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(TestAuthHandler.get_auth_executor())
+        handler = TestAuthHandler()
+        handler.ftp_PASS("secret")
+        self.assertEqual(handler.calls, [("ftp_PASS", "secret")])
+
+    def test_defers_reply_until_done(self):
+        executor = mock.Mock()
+        future = Future()
+        executor.submit.return_value = future
+        handler = self._getOne(executor)
+
+        handler.ftp_PASS("secret")
+
+        executor.submit.assert_called_once_with(
+            handler._authenticate, "testuser", "secret"
+        )
+        self.assertEqual(handler.calls, [("del_channel",)])
+        poller = handler.get_auth_poller()
+        poller.poll()
+        self.assertEqual(handler.calls, [("del_channel",)])
+
+        future.set_result(("/home/testuser", "welcome."))
+        poller.poll()
+        self.assertEqual(
+            handler.calls[1:],
+            [
+                ("add_channel",),
+                ("handle_auth_success", "/home/testuser", "secret", "welcome."),
+            ],
+        )
+        self.assertEqual(len(poller), 0)
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+
+    def test_authentication_failed(self):
+        executor = mock.Mock()
+        future = Future()
+        executor.submit.return_value = future
+        handler = self._getOne(executor)
+
+        handler.ftp_PASS("wrong")
+        future.set_exception(AuthenticationFailed("Authentication failed."))
+        handler.get_auth_poller().poll()
+
+        self.assertEqual(
+            handler.calls[-1],
+            ("handle_auth_failed", "Authentication failed.", "wrong"),
+        )
+
+    def test_closed_while_pending(self):
+        executor = mock.Mock()
+        future = Future()
+        executor.submit.return_value = future
+        handler = self._getOne(executor)
+
+        handler.ftp_PASS("secret")
+        handler._closed = True
+        future.set_result(("/home/testuser", "welcome."))
+        handler.get_auth_poller().poll()
+
+        self.assertEqual(handler.calls, [("del_channel",)])
+
+    def test_close_while_pending(self):
+        executor = mock.Mock()
+        executor.submit.return_value = Future()
+        handler = self._getOne(executor)
+
+        handler.ftp_PASS("secret")
+        handler.close()
+
+        self.assertEqual(len(handler.get_auth_poller()), 0)
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+
+    def test_one_poller_per_ioloop(self):
+        """Sessions of an IOLoop share one timer for pending logins."""
+        executor = mock.Mock()
+        futures = [Future(), Future()]
+        executor.submit.side_effect = futures
+        handlers = [self._getOne(executor), self._getOne(executor)]
+        ioloop = handlers[1].ioloop = handlers[0].ioloop
+
+        for handler in handlers:
+            handler.ftp_PASS("secret")
+
+        ioloop.call_every.assert_called_once()
+        poller = handlers[0].get_auth_poller()
+        self.assertIs(handlers[1].get_auth_poller(), poller)
+        futures[1].set_result(("/home/testuser", "welcome."))
+        poller.poll()
+        self.assertEqual(handlers[0].calls, [("del_channel",)])
+        self.assertEqual(handlers[1].calls[-1][0], "handle_auth_success")
+        ioloop.call_every.return_value.cancel.assert_not_called()
+
+    def test_authenticate_calls_authorizer(self):
+        handler = TestAuthHandler()
+        handler.authorizer.get_home_dir.return_value = "/home/testuser"
+        handler.authorizer.get_msg_login.return_value = "welcome."
+
+        result = handler._authenticate("testuser", "secret")
+
+        self.assertEqual(result, ("/home/testuser", "welcome."))
+        handler.authorizer.validate_authentication.assert_called_once_with(
+            "testuser", "secret", handler
+        )
+
+
+class MockStorageHandler:
+    """Mock handler for testing DeferredStorageMixin."""
+
+    _closed = False
+    _rnfr = None
+    _restart_position = 0
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.ioloop = mock.Mock()
+        self.authorizer = mock.Mock(personate_user=None)
+        self.calls = []
+        self._in_buffer = []
+        self._in_buffer_len = 0
+
+    def found_terminator(self):
+        line = b"".join(self._in_buffer).decode()
+        self._in_buffer = []
+        cmd, _, arg = line.partition(" ")
+        self.process_command(cmd, arg)
+
+    def process_command(self, cmd, *args, **kwargs):
+        getattr(self, "ftp_" + cmd)(*args, **kwargs)
+
+    def ftp_DELE(self, path):
+        try:
+            self.fs.remove(path)
+        except OSError as err:
+            self.respond("550 {}.".format(err))
+        else:
+            self.respond("250 File removed.")
+
+    def ftp_RETR(self, path):
+        rest_pos = self._restart_position
+        self._restart_position = 0
+        fd = self.fs.open(path, "rb")
+        size = self.fs.getsize(path)
+        self.respond("150 {} {} {}".format(fd.name, rest_pos, size))
+
+    def respond(self, resp):
+        self.calls.append(("respond", resp))
+
+    def log_cmd(self, cmd, arg, respcode, respstr):
+        pass
+
+    def del_channel(self):
+        self.calls.append(("del_channel",))
+
+    def add_channel(self):
+        self.calls.append(("add_channel",))
+
+    def handle_error(self):
+        raise
+
+    def close(self):
+        self.calls.append(("close",))
+
+
+class TestStorageHandler(DeferredStorageMixin, MockStorageHandler):
+    """Test handler combining DeferredStorageMixin with mock."""
+
+    storage_timeout = 0
+
+
+class DeferredStorageMixinTest(TestCase):
+    """Tests for DeferredStorageMixin."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        self.executor = mock.Mock()
+        self.executor.submit.side_effect = lambda func: Future()
+
+    def _getOne(self, executor=None):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            fs = StorageFS("/", mock.Mock())
+        handler = TestStorageHandler(fs)
+        handler.get_storage_executor = lambda: executor or self.executor
+        return handler
+
+    def _poll(self, handler, future, deadline=None):
+        call, command = handler.ioloop.call_every.call_args[0][4:6]
+        handler._poll_storage_call(future, deadline, call, command)
+
+    def _complete(self, handler):
+        """run the pending storage call in a worker thread and poll for it."""
+        (func,) = self.executor.submit.call_args[0]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(func)
+        self._poll(handler, future)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(TestStorageHandler.get_storage_executor())
+        handler = self._getOne()
+        handler.get_storage_executor = TestStorageHandler.get_storage_executor
+        handler.process_command("DELE", "/a.txt")
+        self.storage.delete.assert_called_once_with("/a.txt")
+        self.assertEqual(handler.calls, [("respond", "250 File removed.")])
+
+    def test_defers_reply_until_done(self):
+        handler = self._getOne()
+
+        handler.process_command("DELE", "/a.txt")
+
+        self.storage.delete.assert_not_called()
+        self.assertEqual(handler.calls, [("del_channel",)])
+        self._complete(handler)
+        self.storage.delete.assert_called_once_with("/a.txt")
+        self.assertEqual(
+            handler.calls[1:], [("add_channel",), ("respond", "250 File removed.")]
+        )
+        self.assertIsNone(handler._storage_poller)
+        self.assertIsNone(handler.fs._deferral)
+
+    def test_pending_call_keeps_polling(self):
+        handler = self._getOne()
+        handler.process_command("DELE", "/a.txt")
+
+        self._poll(handler, Future())
+
+        self.assertEqual(handler.calls, [("del_channel",)])
+        handler.ioloop.call_every.return_value.cancel.assert_not_called()
+
+    def test_error_replayed_into_command(self):
+        self.storage.delete.side_effect = OSError("backend error")
+        handler = self._getOne()
+
+        handler.process_command("DELE", "/a.txt")
+        self._complete(handler)
+
+        self.assertEqual(handler.calls[-1], ("respond", "550 backend error."))
+
+    def test_replay_attributes_restored(self):
+        self.storage.open.return_value = mock.Mock(name="fd")
+        self.storage.open.return_value.name = "/a.txt"
+        self.storage.size.return_value = 42
+        self.storage.exists.return_value = False
+        handler = self._getOne()
+        handler._restart_position = 10
+
+        handler.process_command("RETR", "/a.txt")
+        self._complete(handler)  # open
+        self.assertEqual(handler._restart_position, 10)
+        self._complete(handler)  # getsize
+
+        self.assertEqual(handler.calls[-1], ("respond", "150 /a.txt 10 42"))
+        self.assertEqual(handler._restart_position, 0)
+        self.storage.open.assert_called_once_with("/a.txt", "rb")
+
+    def test_timeout(self):
+        fd = mock.Mock()
+        self.storage.open.return_value = fd
+        handler = self._getOne()
+
+        handler.process_command("RETR", "/a.txt")
+        self._complete(handler)  # open
+        self._poll(handler, Future(), deadline=0)
+
+        self.assertEqual(
+            handler.calls[-1], ("respond", "451 Storage request timed out.")
+        )
+        fd.close.assert_called_once_with()
+        self.assertIsNone(handler.fs._deferral)
+
+    def test_queued_commands_processed_in_order(self):
+        handler = self._getOne()
+        handler.process_command("DELE", "/a.txt")
+
+        handler._in_buffer = [b"DELE /b.txt"]
+        handler.found_terminator()
+        self.assertEqual(handler._queued_lines, [b"DELE /b.txt"])
+
+        self._complete(handler)
+        self.assertEqual(self.executor.submit.call_count, 2)
+        self._complete(handler)
+
+        self.assertEqual(
+            [call[0] for call in self.storage.delete.call_args_list],
+            [("/a.txt",), ("/b.txt",)],
+        )
+        self.assertEqual(handler._queued_lines, [])
+
+    def test_transfer_not_deferred(self):
+        """Calls made by producers of a started transfer run right away."""
+        handler = self._getOne()
+        handler.fs.begin_deferral()
+
+        with mock.patch.object(MockStorageHandler, "push_dtp_data", create=True):
+            handler.push_dtp_data(mock.Mock(), isproducer=True, cmd="LIST")
+
+        self.assertIsNone(handler.fs._deferral)
+
+    def test_listing_produced_in_pool(self):
+        handler = self._getOne()
+        producer = mock.Mock()
+
+        with mock.patch.object(
+            MockStorageHandler, "push_dtp_data", create=True
+        ) as push_dtp_data:
+            handler.push_dtp_data(producer, isproducer=True, cmd="LIST")
+
+        pushed = push_dtp_data.call_args[0][0]
+        self.assertIsInstance(pushed, ReadAheadProducer)
+        self.assertIs(pushed.producer, producer)
+        self.executor.submit.assert_called_once_with(producer.more)
+
+    def test_file_transfer_not_wrapped(self):
+        handler = self._getOne()
+        producer = mock.Mock()
+
+        with mock.patch.object(
+            MockStorageHandler, "push_dtp_data", create=True
+        ) as push_dtp_data:
+            handler.push_dtp_data(
+                producer, isproducer=True, file=mock.Mock(), cmd="RETR"
+            )
+
+        self.assertIs(push_dtp_data.call_args[0][0], producer)
+        self.executor.submit.assert_not_called()
+
+    def test_listing_without_pool(self):
+        handler = self._getOne()
+        handler.get_storage_executor = TestStorageHandler.get_storage_executor
+        producer = mock.Mock()
+
+        with mock.patch.object(
+            MockStorageHandler, "push_dtp_data", create=True
+        ) as push_dtp_data:
+            handler.push_dtp_data(producer, isproducer=True, cmd="LIST")
+
+        self.assertIs(push_dtp_data.call_args[0][0], producer)
+
+    def test_closed_while_pending(self):
+        handler = self._getOne()
+        handler.process_command("DELE", "/a.txt")
+
+        handler.close()
+
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+        self.assertIsNone(handler.fs._deferral)
+
+
+class MockGuardedStorageHandler(MockStorageHandler):
+    """Mock handler for testing StorageUnavailableMixin."""
+
+    abstracted_fs = StorageFS
+
+    def handle(self):
+        self.calls.append(("handle",))
+
+    def respond_w_warning(self, resp):
+        self.respond(resp)
+
+    def log_cmd(self, cmd, arg, respcode, respstr):
+        self.calls.append(("log_cmd", cmd, arg, respcode))
+
+    def close_when_done(self):
+        self.calls.append(("close_when_done",))
+
+
+class TestGuardedStorageHandler(
+    DeferredStorageMixin, StorageUnavailableMixin, MockGuardedStorageHandler
+):
+    """Test handler combining DeferredStorageMixin and StorageUnavailableMixin."""
+
+
+class StorageUnavailableMixinTest(TestCase):
+    """Tests for StorageUnavailableMixin."""
+
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.storage.__class__.__name__ = "MockStorage"
+        self.guard = StorageGuard(
+            retries=0, breaker=CircuitBreaker(failure_threshold=1)
+        )
+        patcher = mock.patch.object(
+            StorageFS, "get_storage_guard", return_value=self.guard
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(unmark_loop_thread)
+
+    def _getOne(self):
+        with mock.patch(
+            "django_ftpserver.filesystems.storages", {"default": self.storage}
+        ):
+            fs = StorageFS("/", mock.Mock())
+        handler = TestGuardedStorageHandler(fs)
+        handler.get_storage_executor = lambda: None
+        return handler
+
+    def test_unavailable_answered_with_451(self):
+        handler = self._getOne()
+        self.storage.delete.side_effect = ConnectionResetError
+
+        handler.process_command("DELE", "/a.txt")
+
+        self.assertEqual(
+            handler.calls,
+            [
+                ("respond", "451 Storage backend unavailable."),
+                ("log_cmd", "DELE", "/a.txt", 451),
+            ],
+        )
+
+    def test_timeout_answered_with_451(self):
+        handler = self._getOne()
+        handler.fs.remove = mock.Mock(
+            side_effect=StorageTimeout("Storage request timed out")
+        )
+
+        handler.process_command("DELE", "/a.txt")
+
+        self.assertEqual(
+            handler.calls[0], ("respond", "451 Storage request timed out.")
+        )
+
+    def test_deferred_call_unavailable(self):
+        handler = self._getOne()
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda func: Future()
+        handler.get_storage_executor = lambda: executor
+        self.storage.delete.side_effect = ConnectionResetError
+        handler.process_command("DELE", "/a.txt")
+
+        (func,) = executor.submit.call_args[0]
+        with ThreadPoolExecutor(max_workers=1) as worker:
+            future = worker.submit(func)
+        call, command = handler.ioloop.call_every.call_args[0][4:6]
+        handler._poll_storage_call(future, None, call, command)
+
+        self.assertIn(("respond", "451 Storage backend unavailable."), handler.calls)
+        self.assertIsNone(handler.fs._deferral)
+
+    def test_handle(self):
+        handler = self._getOne()
+        handler.handle()
+        self.assertEqual(handler.calls, [("handle",)])
+
+    def test_accepting_thread_marked(self):
+        """The IOLoop thread is known however the server was started."""
+        handler = self._getOne()
+        marked = []
+
+        def accept():
+            handler.handle()
+            marked.append(in_loop_thread())
+
+        thread = threading.Thread(target=accept)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(marked, [True])
+        self.assertFalse(in_loop_thread())
+
+    def test_connection_refused_while_breaker_open(self):
+        handler = self._getOne()
+        self.guard.breaker.record_failure()
+
+        handler.handle()
+
+        self.assertEqual(
+            handler.calls,
+            [
+                ("respond", "421 Storage backend unavailable, try again later."),
+                ("close_when_done",),
+            ],
+        )
+
+    def test_other_filesystem_not_checked(self):
+        handler = self._getOne()
+        handler.abstracted_fs = mock.Mock()
+        self.guard.breaker.record_failure()
+
+        handler.handle()
+
+        self.assertEqual(handler.calls, [("handle",)])
+
+
+class MockDTPHandler:
+    """Mock data channel for testing UploadCompletionMixin."""
+
+    _closed = False
+    receive = True
+    transfer_finished = True
+    _resp = ("226 Transfer complete.", None)
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.response = None
+        self.ioloop = mock.Mock()
+        self.registered = True
+        self.timed_out = False
+
+    def log_exception(self, instance):
+        pass
+
+    def del_channel(self):
+        self.registered = False
+
+    def handle_error(self):
+        pass
+
+    def handle_timeout(self):
+        self.timed_out = True
+
+    def handle_close(self):
+        self.transfer_finished = True
+        self.close()
+
+    def close(self):
+        self._closed = True
+        self.response = self._resp[0]
+
+
+class TestDTPHandler(UploadCompletionMixin, MockDTPHandler):
+    """Test data channel combining UploadCompletionMixin with mock."""
+
+
+class UploadCompletionMixinTest(TestCase):
+    """Tests for UploadCompletionMixin."""
+
+    def _getOne(self, error=None):
+        file_obj = mock.Mock(closed=False)
+        file_obj.name = "/a.txt"
+
+        def close():
+            file_obj.closed = True
+            if error is not None:
+                raise error
+
+        file_obj.close.side_effect = close
+        return TestDTPHandler(file_obj)
+
+    def test_stored(self):
+        handler = self._getOne()
+        handler.close()
+
+        handler.file_obj.close.assert_called_once_with()
+        self.assertEqual(handler.response, "226 Transfer complete.")
+        self.assertTrue(handler.transfer_finished)
+
+    def test_store_failed(self):
+        handler = self._getOne(OSError(errno.EIO, "Upload failed"))
+        handler.close()
+
+        handler.file_obj.close.assert_called_once_with()
+        self.assertEqual(handler.response, "426 Input/output error; transfer aborted.")
+        self.assertFalse(handler.transfer_finished)
+
+    def test_internal_error(self):
+        handler = self._getOne(ValueError())
+        handler.close()
+        self.assertEqual(handler.response, "426 Internal error; transfer aborted.")
+
+    def test_aborted_upload_discarded(self):
+        class Writer:
+            name = "/a.txt"
+            closed = False
+            close = mock.Mock()
+            discard = mock.Mock()
+
+        handler = TestDTPHandler(Writer())
+        handler.transfer_finished = False
+        handler._resp = ("426 Transfer aborted.", None)
+        handler.close()
+
+        Writer.discard.assert_called_once_with()
+        Writer.close.assert_not_called()
+        self.assertEqual(handler.response, "426 Transfer aborted.")
+
+    def test_reset_connection_discards_upload(self):
+        class Writer:
+            name = "/a.txt"
+            closed = False
+            close = mock.Mock()
+            discard = mock.Mock()
+
+        handler = TestDTPHandler(Writer())
+        handler.transfer_finished = False
+        try:
+            raise ConnectionResetError(errno.ECONNRESET, "Connection reset by peer")
+        except OSError:
+            handler.handle_close()
+
+        Writer.discard.assert_called_once_with()
+        Writer.close.assert_not_called()
+        self.assertFalse(handler.transfer_finished)
+        self.assertEqual(handler.response, "426 Connection reset; transfer aborted.")
+
+    def test_closed_connection_stores_upload(self):
+        handler = self._getOne()
+        handler.transfer_finished = False
+        handler.handle_close()
+
+        handler.file_obj.close.assert_called_once_with()
+        self.assertEqual(handler.response, "226 Transfer complete.")
+
+    def test_resumed_upload_finished(self):
+        class Writer:
+            name = "/a.txt"
+            closed = False
+            close = mock.Mock()
+            finish = mock.Mock()
+
+        handler = TestDTPHandler(Writer())
+        handler.close()
+
+        Writer.finish.assert_called_once_with()
+        Writer.close.assert_not_called()
+
+    def _getAsync(self):
+        class Writer:
+            name = "/a.txt"
+            closed = False
+
+            def finish_async(self):
+                self.closed = True
+                return stored
+
+        stored = Future()
+        return TestDTPHandler(Writer()), stored
+
+    def test_stored_async(self):
+        handler, stored = self._getAsync()
+        handler.close()
+
+        self.assertIsNone(handler.response)
+        self.assertFalse(handler.registered)
+        handler.ioloop.call_every.assert_called_once()
+        handler._poll_store(stored)
+        self.assertIsNone(handler.response)
+
+        stored.set_result(None)
+        handler._poll_store(stored)
+
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+        self.assertEqual(handler.response, "226 Transfer complete.")
+        self.assertTrue(handler.transfer_finished)
+
+    def test_store_async_failed(self):
+        handler, stored = self._getAsync()
+        handler.close()
+        stored.set_exception(OSError(errno.EIO, "Upload failed"))
+        handler._poll_store(stored)
+
+        self.assertEqual(handler.response, "426 Input/output error; transfer aborted.")
+        self.assertFalse(handler.transfer_finished)
+
+    def test_closed_while_storing(self):
+        handler, stored = self._getAsync()
+        handler.close()
+        handler.close()
+
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+        self.assertEqual(handler.response, "426 Transfer aborted.")
+        self.assertFalse(handler.transfer_finished)
+
+    def test_no_timeout_while_storing(self):
+        handler, stored = self._getAsync()
+        handler.handle_timeout()
+        self.assertTrue(handler.timed_out)
+
+        handler.timed_out = False
+        handler.close()
+        handler.handle_timeout()
+        self.assertFalse(handler.timed_out)
+
+    def test_sending_not_checked(self):
+        handler = self._getOne()
+        handler.receive = False
+        handler.close()
+        handler.file_obj.close.assert_not_called()
+        self.assertEqual(handler.response, "226 Transfer complete.")
+
+    def test_handlers_use_mixin(self):
+        self.assertTrue(issubclass(DjangoFTPHandler.dtp_handler, UploadCompletionMixin))
+
+
+class ReadAheadProducerTest(TestCase):
+    """Tests for ReadAheadProducer."""
+
+    def test_chunks_prepared_in_executor(self):
+        producer = mock.Mock()
+        producer.more.side_effect = [b"a", b"b", b""]
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            read_ahead = ReadAheadProducer(producer, executor)
+            chunks = []
+            while True:
+                read_ahead._next.result(5)
+                self.assertTrue(read_ahead.ready())
+                chunk = read_ahead.more()
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+        self.assertEqual(chunks, [b"a", b"b"])
+        self.assertEqual(producer.more.call_count, 3)
+
+    def test_not_ready(self):
+        executor = mock.Mock()
+        executor.submit.return_value = Future()
+        self.assertFalse(ReadAheadProducer(mock.Mock(), executor).ready())
+
+    def test_error_raised_from_more(self):
+        producer = mock.Mock()
+        producer.more.side_effect = OSError(errno.EIO, "Listing failed")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            read_ahead = ReadAheadProducer(producer, executor)
+            with self.assertRaises(OSError):
+                read_ahead.more()
+
+
+class MockSendfileDTPHandler:
+    """Mock data channel whose pyftpdlib checks allow sendfile()."""
+
+    def __init__(self, file_obj, sendfile=None):
+        self.file_obj = file_obj
+        self.cmd_channel = mock.Mock(sendfile=sendfile)
+
+    def use_sendfile(self):
+        return True
+
+
+class TestSendfileDTPHandler(SendfileMixin, MockSendfileDTPHandler):
+    """Test data channel combining SendfileMixin with mock."""
+
+
+class SendfileMixinTest(TestCase):
+    """Tests for SendfileMixin."""
+
+    def test_local_file(self):
+        with tempfile.TemporaryFile() as file:
+            self.assertTrue(TestSendfileDTPHandler(file).use_sendfile())
+
+    def test_remote_file(self):
+        with tempfile.SpooledTemporaryFile() as file:
+            self.assertFalse(TestSendfileDTPHandler(file).use_sendfile())
+
+    def test_enabled(self):
+        with tempfile.SpooledTemporaryFile() as file:
+            self.assertTrue(TestSendfileDTPHandler(file, True).use_sendfile())
+
+    def test_disabled(self):
+        with tempfile.TemporaryFile() as file:
+            self.assertFalse(TestSendfileDTPHandler(file, False).use_sendfile())
+
+    def test_pyftpdlib_checks(self):
+        with tempfile.TemporaryFile() as file:
+            handler = TestSendfileDTPHandler(file, True)
+            with mock.patch.object(
+                MockSendfileDTPHandler, "use_sendfile", return_value=False
+            ):
+                self.assertFalse(handler.use_sendfile())
+
+    def test_handlers_use_mixin(self):
+        self.assertTrue(issubclass(DjangoFTPHandler.dtp_handler, SendfileMixin))
+
+
+class MockSendingDTPHandler:
+    """Mock sending data channel for testing DownloadReadAheadMixin."""
+
+    _closed = False
+    receive = False
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.producer_fifo = [mock.Mock(spec=["more"])]
+        self.ioloop = mock.Mock()
+        self.sent = 0
+        self.registered = True
+
+    def del_channel(self):
+        self.registered = False
+
+    def add_channel(self, events=None):
+        self.registered = True
+
+    def initiate_send(self):
+        self.sent += 1
+
+    def handle_error(self):
+        pass
+
+    def close(self):
+        self._closed = True
+
+
+class TestDownloadDTPHandler(DownloadReadAheadMixin, MockSendingDTPHandler):
+    """Test data channel combining DownloadReadAheadMixin with mock."""
+
+
+class DownloadReadAheadMixinTest(TestCase):
+    """Tests for DownloadReadAheadMixin."""
+
+    def _getOne(self, ready):
+        file_obj = mock.Mock()
+        file_obj.ready.return_value = ready
+        return TestDownloadDTPHandler(file_obj)
+
+    def test_ready(self):
+        handler = self._getOne(True)
+        handler.initiate_send()
+
+        self.assertEqual(handler.sent, 1)
+        handler.ioloop.call_every.assert_not_called()
+
+    def test_waits_for_range(self):
+        handler = self._getOne(False)
+        handler.initiate_send()
+        handler.initiate_send()
+
+        self.assertEqual(handler.sent, 0)
+        self.assertFalse(handler.registered)
+        handler.ioloop.call_every.assert_called_once()
+
+        handler._poll_download()
+        self.assertEqual(handler.sent, 0)
+
+        handler.file_obj.ready.return_value = True
+        handler._poll_download()
+
+        self.assertEqual(handler.sent, 1)
+        self.assertTrue(handler.registered)
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+
+    def test_close_while_waiting(self):
+        handler = self._getOne(False)
+        handler.initiate_send()
+        handler.close()
+
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+        self.assertTrue(handler._closed)
+
+    def test_plain_files_not_checked(self):
+        handler = TestDownloadDTPHandler(mock.Mock(spec=["read"]))
+        handler.initiate_send()
+        self.assertEqual(handler.sent, 1)
+
+    def test_waits_for_producer(self):
+        handler = TestDownloadDTPHandler(None)
+        producer = mock.Mock(spec=["more", "ready"])
+        producer.ready.return_value = False
+        handler.producer_fifo = [producer]
+        handler.initiate_send()
+
+        self.assertEqual(handler.sent, 0)
+        self.assertFalse(handler.registered)
+
+        producer.ready.return_value = True
+        handler._poll_download()
+
+        self.assertEqual(handler.sent, 1)
+        self.assertTrue(handler.registered)
+
+    def test_handlers_use_mixin(self):
+        self.assertTrue(
+            issubclass(DjangoFTPHandler.dtp_handler, DownloadReadAheadMixin)
+        )
+
+
+class MockReceivingDTPHandler:
+    """Mock receiving data channel for testing UploadBackpressureMixin."""
+
+    _closed = False
+    receive = True
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+        self.ioloop = mock.Mock()
+        self.read = 0
+        self.registered = True
+
+    def del_channel(self):
+        self.registered = False
+
+    def add_channel(self, events=None):
+        self.registered = True
+
+    def handle_read_event(self):
+        self.read += 1
+
+    def handle_error(self):
+        pass
+
+    def close(self):
+        self._closed = True
+
+
+class TestUploadDTPHandler(UploadBackpressureMixin, MockReceivingDTPHandler):
+    """Test data channel combining UploadBackpressureMixin with mock."""
+
+
+class UploadBackpressureMixinTest(TestCase):
+    """Tests for UploadBackpressureMixin."""
+
+    def _getOne(self, ready):
+        file_obj = mock.Mock()
+        file_obj.ready.return_value = ready
+        return TestUploadDTPHandler(file_obj)
+
+    def test_ready(self):
+        handler = self._getOne(True)
+        handler.handle_read_event()
+
+        self.assertEqual(handler.read, 1)
+        handler.ioloop.call_every.assert_not_called()
+
+    def test_waits_for_part(self):
+        handler = self._getOne(False)
+        handler.handle_read_event()
+
+        self.assertEqual(handler.read, 0)
+        self.assertFalse(handler.registered)
+        handler.ioloop.call_every.assert_called_once()
+
+        handler._poll_upload()
+        self.assertFalse(handler.registered)
+
+        handler.file_obj.ready.return_value = True
+        handler._poll_upload()
+
+        self.assertTrue(handler.registered)
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+        handler.handle_read_event()
+        self.assertEqual(handler.read, 1)
+
+    def test_close_while_waiting(self):
+        handler = self._getOne(False)
+        handler.handle_read_event()
+        handler.close()
+
+        handler.ioloop.call_every.return_value.cancel.assert_called_once_with()
+        self.assertTrue(handler._closed)
+
+    def test_plain_files_not_checked(self):
+        handler = TestUploadDTPHandler(mock.Mock(spec=["write"]))
+        handler.handle_read_event()
+        self.assertEqual(handler.read, 1)
+
+    def test_handlers_use_mixin(self):
+        self.assertTrue(
+            issubclass(DjangoFTPHandler.dtp_handler, UploadBackpressureMixin)
+        )
+
+
+class MockRetrieveHandler:
+    """Mock handler for testing RestartOffsetMixin."""
+
+    _current_type = "i"
+
+    def __init__(self, fs, rest_pos):
+        self.fs = fs
+        self._restart_position = rest_pos
+        self.respond = mock.Mock()
+        self.push_dtp_data = mock.Mock()
+
+    def run_as_current_user(self, function, *args):
+        return function(*args)
+
+    def ftp_RETR(self, file):
+        return "super"
+
+
+class TestRetrieveHandler(RestartOffsetMixin, MockRetrieveHandler):
+    """Test handler combining RestartOffsetMixin with mock."""
+
+
+class RestartOffsetMixinTest(TestCase):
+    """Tests for RestartOffsetMixin."""
+
+    def _getOne(self, file, rest_pos=5):
+        fs = mock.Mock(spec=StorageFS)
+        fs.open.return_value = file
+        fs.getsize.return_value = 10
+        return TestRetrieveHandler(fs, rest_pos)
+
+    def _reader(self, size=10):
+        reader = mock.Mock(spec=RangedDownloadReader)
+        reader.size = size
+        return reader
+
+    def test_opened_at_offset(self):
+        reader = self._reader()
+        handler = self._getOne(reader)
+
+        self.assertEqual(handler.ftp_RETR("/a.txt"), "/a.txt")
+
+        handler.fs.open.assert_called_once_with("/a.txt", "rb", 5)
+        handler.fs.getsize.assert_not_called()
+        self.assertEqual(handler._restart_position, 0)
+        producer = handler.push_dtp_data.call_args[0][0]
+        self.assertIs(producer.file, reader)
+        reader.seek.assert_not_called()
+
+    def test_other_files_checked_with_getsize(self):
+        file = mock.Mock()
+        handler = self._getOne(file)
+        handler.ftp_RETR("/a.txt")
+        handler.fs.getsize.assert_called_once_with("/a.txt")
+        handler.push_dtp_data.assert_called_once()
+
+    def test_offset_after_end(self):
+        reader = self._reader(size=3)
+        handler = self._getOne(reader)
+
+        self.assertIsNone(handler.ftp_RETR("/a.txt"))
+
+        handler.respond.assert_called_once_with("554 REST position (5) > file size (3)")
+        reader.close.assert_called_once_with()
+        handler.push_dtp_data.assert_not_called()
+
+    def test_open_error(self):
+        handler = self._getOne(None)
+        handler.fs.open.side_effect = FileNotFoundError(errno.ENOENT, "missing")
+        handler.ftp_RETR("/a.txt")
+        handler.respond.assert_called_once_with("550 No such file or directory.")
+
+    def test_without_offset(self):
+        handler = self._getOne(self._reader(), rest_pos=0)
+        self.assertEqual(handler.ftp_RETR("/a.txt"), "super")
+        handler.fs.open.assert_not_called()
+
+
+class TestThrottledHandler(LoginThrottleMixin, MockAuthHandler):
+    """Test handler combining LoginThrottleMixin with mock."""
+
+    remote_ip = "192.168.1.1"
+    auth_failed_timeout = 3
+
+
+class LoginThrottleMixinTest(TestCase):
+    """Tests for LoginThrottleMixin."""
+
+    def _getOne(self, throttle):
+        handler = TestThrottledHandler()
+        handler.get_login_throttle = lambda: throttle
+        return handler
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(TestThrottledHandler.get_login_throttle())
+        handler = TestThrottledHandler()
+        handler.ftp_PASS("secret")
+        self.assertEqual(handler.calls, [("ftp_PASS", "secret")])
+
+    def test_created_from_settings(self):
+        class Handler(TestThrottledHandler):
+            pass
+
+        with self.settings(FTPSERVER_LOGIN_THROTTLE_RATE=0.5):
+            throttle = Handler.get_login_throttle()
+        self.assertEqual(throttle.rate, 0.5)
+        self.assertIs(Handler.get_login_throttle(), throttle)
+
+    def test_rejected_before_authorizer(self):
+        handler = self._getOne(LoginThrottle(rate=0.001, burst=1))
+        handler.ftp_PASS("secret")
+        handler.ftp_PASS("secret")
+        self.assertEqual(
+            handler.calls,
+            [
+                ("ftp_PASS", "secret"),
+                ("handle_auth_failed", "Too many login attempts.", "secret"),
+            ],
+        )
+
+    def test_progressive_failure_delay(self):
+        handler = self._getOne(LoginThrottle(rate=1, base_delay=1))
+        handler.handle_auth_failed("Authentication failed.", "wrong")
+        self.assertEqual(handler.auth_failed_timeout, 1)
+        handler.handle_auth_failed("Authentication failed.", "wrong")
+        self.assertEqual(handler.auth_failed_timeout, 2)
+
+    def test_success_resets_failures(self):
+        throttle = LoginThrottle(rate=1, base_delay=1)
+        handler = self._getOne(throttle)
+        handler.handle_auth_failed("Authentication failed.", "wrong")
+        handler.handle_auth_success("/home/testuser", "secret", "welcome.")
+        self.assertEqual(throttle.failure_delay("192.168.1.1", "testuser"), 1)
+
+
+class MockListHandler:
+    """Mock handler for testing StreamingListMixin."""
+
+    encoding = "utf8"
+    unicode_errors = "replace"
+    username = "testuser"
+    _current_facts = ["type", "size"]
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.authorizer = mock.Mock()
+        self.respond = mock.Mock()
+        self.push_dtp_data = mock.Mock()
+
+    def run_as_current_user(self, function, *args):
+        return function(*args)
+
+    def ftp_LIST(self, path):
+        return "super"
+
+
+class TestListHandler(StreamingListMixin, MockListHandler):
+    """Test handler combining StreamingListMixin with mock."""
+
+    list_sort_limit = 3
+
+
+class StreamingListMixinTest(TestCase):
+    """Tests for StreamingListMixin."""
+
+    def _getOne(self, names):
+        self.pulled = []
+
+        def iter_listdir(path, metadata=True):
+            for name in names:
+                self.pulled.append(name)
+                yield name
+
+        fs = mock.Mock()
+        fs.isdir.return_value = True
+        fs.iter_listdir.side_effect = iter_listdir
+        fs.format_list.side_effect = lambda path, listing: (
+            (name + "\r\n").encode() for name in listing
+        )
+        return TestListHandler(fs)
+
+    def _sent(self, handler):
+        producer = handler.push_dtp_data.call_args[0][0]
+        data = b""
+        while True:
+            chunk = producer.more()
+            if not chunk:
+                return data
+            data += chunk
+
+    def test_small_listing_sorted(self):
+        handler = self._getOne(["c", "a", "b"])
+
+        self.assertEqual(handler.ftp_LIST("/dir"), "/dir")
+
+        self.assertEqual(self._sent(handler), b"a\r\nb\r\nc\r\n")
+
+    def test_large_listing_streamed(self):
+        handler = self._getOne(["e", "d", "c", "b", "a"])
+
+        handler.ftp_LIST("/dir")
+
+        self.assertEqual(self.pulled, ["e", "d", "c", "b"])
+        self.assertEqual(self._sent(handler), b"e\r\nd\r\nc\r\nb\r\na\r\n")
+
+    def test_nlst(self):
+        handler = self._getOne(["b", "a"])
+
+        handler.ftp_NLST("/dir")
+
+        self.assertEqual(self._sent(handler), b"a\r\nb\r\n")
+        handler.fs.iter_listdir.assert_called_once_with("/dir", metadata=False)
+
+    def test_listing_error(self):
+        handler = self._getOne([])
+        handler.fs.iter_listdir.side_effect = FileNotFoundError(2, "No such file")
+
+        self.assertIsNone(handler.ftp_LIST("/dir"))
+
+        handler.respond.assert_called_once()
+        self.assertTrue(handler.respond.call_args[0][0].startswith("550 "))
+        handler.push_dtp_data.assert_not_called()
+
+    def test_filesystem_without_iter_listdir(self):
+        handler = self._getOne([])
+        del handler.fs.iter_listdir
+
+        self.assertEqual(handler.ftp_LIST("/dir"), "super")
+
+
 class DjangoFTPHandlerTest(TestCase):
     """Tests for DjangoFTPHandler class."""
 
@@ -1,11 +1,14 @@
+import datetime
 import random
 from io import StringIO
+from unittest import mock
 
 import pytest
 
 from django.contrib.auth import get_user_model
 from django.core import management
 from django.core.management.base import CommandError
+from django.utils import timezone
 
 from django_ftpserver import models
 
@@ -143,3 +146,87 @@ class TestFTPUserAccountCommands:
 
         assert "was created" in out.getvalue()
         assert models.FTPUserAccount.objects.filter(user=user).exists()
+        assert models.FTPUserAccount.objects.get(user=user).username == "newftpuser"
+
+    @pytest.mark.django_db
+    def test_syncftpusername(self):
+        User = get_user_model()
+        user = User.objects.create_user(username="syncuser", password="pass")
+        group = models.FTPUserGroup.objects.create(name="syncgroup")
+        account = models.FTPUserAccount.objects.create(user=user, group=group)
+        models.FTPUserAccount.objects.filter(pk=account.pk).update(username="")
+
+        out = StringIO()
+        management.call_command("syncftpusername", stdout=out)
+
+        assert "1 FTP user account(s) updated" in out.getvalue()
+        account.refresh_from_db()
+        assert account.username == "syncuser"
+
+
+class TestCleanFTPUploadsCommand:
+    def _create_upload(self, path, age):
+        upload = models.FTPUpload.objects.create(
+            storage="default", username="user", path=path, upload_id="id"
+        )
+        models.FTPUpload.objects.filter(pk=upload.pk).update(
+            updated=timezone.now() - datetime.timedelta(seconds=age)
+        )
+        return upload
+
+    @pytest.mark.django_db
+    def test_cleanftpuploads(self):
+        self._create_upload("/old.bin", 3600)
+        self._create_upload("/new.bin", 10)
+
+        out = StringIO()
+        with mock.patch(
+            "django_ftpserver.filesystems.StorageFS.abort_stored_upload",
+            side_effect=lambda upload: upload.delete(),
+        ) as abort:
+            management.call_command("cleanftpuploads", "--max-age=60", stdout=out)
+
+        assert "1 FTP upload(s) aborted" in out.getvalue()
+        assert [c.args[0].path for c in abort.call_args_list] == ["/old.bin"]
+        assert list(models.FTPUpload.objects.values_list("path", flat=True)) == [
+            "/new.bin"
+        ]
+
+    @pytest.mark.django_db
+    def test_cleanftpuploads_default_max_age(self, settings):
+        settings.FTPSERVER_RESUMABLE_UPLOAD_MAX_AGE = 60
+        self._create_upload("/old.bin", 3600)
+
+        management.call_command("cleanftpuploads", stdout=StringIO())
+
+        assert not models.FTPUpload.objects.exists()
+
+    @pytest.mark.django_db
+    def test_cleanftpuploads_failed(self):
+        self._create_upload("/old.bin", 3600)
+
+        out = StringIO()
+        err = StringIO()
+        with mock.patch(
+            "django_ftpserver.filesystems.StorageFS.abort_stored_upload",
+            side_effect=ConnectionResetError("reset"),
+        ):
+            management.call_command(
+                "cleanftpuploads", "--max-age=60", stdout=out, stderr=err
+            )
+
+        assert "1 FTP upload(s) failed" in out.getvalue()
+        assert "Failed to abort upload of /old.bin: reset" in err.getvalue()
+        assert models.FTPUpload.objects.exists()
+
+    @pytest.mark.django_db
+    def test_cleanftpuploads_dry_run(self):
+        self._create_upload("/old.bin", 3600)
+
+        out = StringIO()
+        management.call_command(
+            "cleanftpuploads", "--max-age=60", "--dry-run", stdout=out
+        )
+
+        assert "/old.bin (user, 0 bytes" in out.getvalue()
+        assert models.FTPUpload.objects.exists()
@@ -74,3 +74,151 @@ class UserAccountWithGroupTest(TestCase):
         account.group = group
         self.assertTrue(account.has_perm("e", "spam"))
         self.assertFalse(account.has_perm("invalid", "spam"))
+
+
+class UserAccountPathPermissionTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        from django_ftpserver import models
+
+        self.group = models.FTPUserGroup.objects.create(
+            name="group1", permission="elr", home_dir="/home/{username}/"
+        )
+        self.user = User.objects.create(username="spam")
+        self.account = models.FTPUserAccount.objects.create(
+            user=self.user, group=self.group
+        )
+
+    def _addRule(self, **kwargs):
+        from django_ftpserver import models
+
+        return models.FTPPathPermission.objects.create(**kwargs)
+
+    def test_group_rule(self):
+        self._addRule(group=self.group, path="/incoming", permission="elw")
+        self.assertTrue(self.account.has_perm("w", "/home/spam/incoming/a.txt"))
+        self.assertFalse(self.account.has_perm("w", "/home/spam/a.txt"))
+
+    def test_account_rule_overrides_group_rule(self):
+        self._addRule(group=self.group, path="/incoming", permission="elw")
+        self._addRule(account=self.account, path="incoming", permission="elr")
+        self.assertFalse(self.account.has_perm("w", "/home/spam/incoming/a.txt"))
+
+    def test_other_group_rule_ignored(self):
+        from django_ftpserver import models
+
+        other = models.FTPUserGroup.objects.create(name="group2")
+        self._addRule(group=other, path="/", permission="")
+        self.assertTrue(self.account.has_perm("r", "/home/spam/a.txt"))
+
+    def test_compiled_once(self):
+        self.account.get_permission_trie()
+        with self.assertNumQueries(0):
+            self.account.has_perm("r", "/home/spam/a.txt")
+
+    def test_clean_requires_group_or_account(self):
+        from django.core.exceptions import ValidationError
+
+        from django_ftpserver import models
+
+        with self.assertRaises(ValidationError):
+            models.FTPPathPermission(path="/", permission="elr").clean()
+        with self.assertRaises(ValidationError):
+            models.FTPPathPermission(
+                group=self.group, account=self.account, path="/"
+            ).clean()
+
+
+class UserAccountUsernameTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        from django_ftpserver import models
+
+        self.group = models.FTPUserGroup.objects.create(name="group1")
+        self.user = User.objects.create(username="spam")
+        self.account = models.FTPUserAccount.objects.create(
+            user=self.user, group=self.group
+        )
+
+    def test_copied_on_save(self):
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.username, "spam")
+
+    def test_user_renamed(self):
+        self.user.username = "ham"
+        self.user.save()
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.username, "ham")
+
+    def test_saved_without_loading_user(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from django_ftpserver import models
+
+        account = models.FTPUserAccount.objects.get(pk=self.account.pk)
+        account.home_dir = "/srv/spam"
+        with CaptureQueriesContext(connection) as queries:
+            account.save()
+        self.assertFalse([query for query in queries if "auth_user" in query["sql"]])
+        self.assertEqual(account.username, "spam")
+
+    def test_user_changed(self):
+        from django.contrib.auth.models import User
+
+        from django_ftpserver import models
+
+        account = models.FTPUserAccount.objects.get(pk=self.account.pk)
+        account.user_id = User.objects.create(username="eggs").pk
+        account.save()
+        account.refresh_from_db()
+        self.assertEqual(account.username, "eggs")
+
+    def test_empty_username_copied(self):
+        from django_ftpserver import models
+
+        models.FTPUserAccount.objects.filter(pk=self.account.pk).update(username="")
+        account = models.FTPUserAccount.objects.get(pk=self.account.pk)
+        account.save()
+        account.refresh_from_db()
+        self.assertEqual(account.username, "spam")
+
+    def test_user_saved_without_username(self):
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=["last_login"])
+
+
+class AccountVersionTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        from django_ftpserver import models
+
+        self.group = models.FTPUserGroup.objects.create(name="group1")
+        self.user = User.objects.create(username="spam")
+
+    def _getVersion(self):
+        from django_ftpserver import models
+
+        return models.FTPAccountVersion.get_version()
+
+    def test_bumped_on_change(self):
+        from django_ftpserver import models
+
+        version = self._getVersion()
+        account = models.FTPUserAccount.objects.create(user=self.user, group=self.group)
+        self.assertGreater(self._getVersion(), version)
+        version = self._getVersion()
+        self.user.set_password("password1")
+        self.user.save()
+        self.assertGreater(self._getVersion(), version)
+        version = self._getVersion()
+        account.delete()
+        self.assertGreater(self._getVersion(), version)
+
+    def test_not_bumped_on_last_login(self):
+        version = self._getVersion()
+        self.user.save(update_fields=["last_login"])
+        self.assertEqual(self._getVersion(), version)
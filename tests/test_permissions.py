@@ -0,0 +1,63 @@
+"""Tests for django_ftpserver.permissions module."""
+
+from django.test import TestCase
+
+from django_ftpserver.permissions import (
+    PERMISSION_BITS,
+    PermissionTrie,
+    permission_mask,
+    split_path,
+)
+
+
+class PermissionMaskTest(TestCase):
+    def test_permission_mask(self):
+        self.assertEqual(
+            permission_mask("el"), PERMISSION_BITS["e"] | PERMISSION_BITS["l"]
+        )
+
+    def test_empty(self):
+        self.assertEqual(permission_mask(""), 0)
+        self.assertEqual(permission_mask(None), 0)
+
+    def test_unknown_letters_ignored(self):
+        self.assertEqual(permission_mask("ex"), PERMISSION_BITS["e"])
+
+
+class SplitPathTest(TestCase):
+    def test_split_path(self):
+        self.assertEqual(split_path("/home/user1/dir/"), ["home", "user1", "dir"])
+        self.assertEqual(split_path("./dir//file"), ["dir", "file"])
+        self.assertEqual(split_path("C:\\home\\user1"), ["C:", "home", "user1"])
+
+
+class PermissionTrieTest(TestCase):
+    def _getOne(self):
+        trie = PermissionTrie(permission_mask("elr"))
+        trie.add("/home/user1/incoming", permission_mask("elw"))
+        trie.add("/home/user1/incoming/private", permission_mask(""))
+        return trie
+
+    def test_default(self):
+        trie = self._getOne()
+        self.assertTrue(trie.has_perm("r", "/home/user1/file.txt"))
+        self.assertFalse(trie.has_perm("w", "/home/user1/file.txt"))
+        self.assertTrue(trie.has_perm("r", None))
+
+    def test_prefix(self):
+        trie = self._getOne()
+        self.assertTrue(trie.has_perm("w", "/home/user1/incoming"))
+        self.assertTrue(trie.has_perm("w", "/home/user1/incoming/sub/file.txt"))
+        self.assertFalse(trie.has_perm("r", "/home/user1/incoming/file.txt"))
+
+    def test_deepest_rule_wins(self):
+        trie = self._getOne()
+        self.assertFalse(trie.has_perm("l", "/home/user1/incoming/private/a"))
+
+    def test_component_boundary(self):
+        trie = self._getOne()
+        self.assertFalse(trie.has_perm("w", "/home/user1/incoming2/file.txt"))
+
+    def test_unknown_perm(self):
+        trie = self._getOne()
+        self.assertFalse(trie.has_perm("invalid", "/home/user1"))
@@ -0,0 +1,324 @@
+"""Tests for django_ftpserver.resilience module."""
+
+import threading
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from django_ftpserver import resilience
+from django_ftpserver.resilience import (
+    CircuitBreaker,
+    StorageGuard,
+    StorageTimeout,
+    StorageUnavailable,
+    get_storage_guard,
+    in_loop_thread,
+    is_transient,
+    mark_loop_thread,
+    unmark_loop_thread,
+)
+
+
+class ClientError(Exception):
+    """Stand-in for botocore.exceptions.ClientError."""
+
+    def __init__(self, status, code="Error"):
+        super().__init__(code)
+        self.response = {
+            "Error": {"Code": code},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        }
+
+
+class ServiceUnavailable(Exception):
+    """Stand-in for google.api_core.exceptions.ServiceUnavailable."""
+
+    code = 503
+
+
+class IsTransientTest(TestCase):
+    """Tests for is_transient."""
+
+    def test_connection_errors(self):
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertTrue(is_transient(TimeoutError()))
+
+    def test_permanent_errors(self):
+        self.assertFalse(is_transient(FileNotFoundError()))
+        self.assertFalse(is_transient(PermissionError()))
+        self.assertFalse(is_transient(ValueError()))
+
+    def test_client_error_status(self):
+        self.assertTrue(is_transient(ClientError(503)))
+        self.assertTrue(is_transient(ClientError(429)))
+        self.assertFalse(is_transient(ClientError(404)))
+        self.assertFalse(is_transient(ClientError(403)))
+
+    def test_client_error_code(self):
+        self.assertTrue(is_transient(ClientError(400, "RequestTimeout")))
+
+    def test_api_error_code(self):
+        self.assertTrue(is_transient(ServiceUnavailable()))
+
+
+class CircuitBreakerTest(TestCase):
+    """Tests for CircuitBreaker."""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.is_open())
+        stats = breaker.get_stats()
+        self.assertEqual(stats["state"], "open")
+        self.assertEqual(stats["opened"], 1)
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_opens_again(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.01)
+        for _ in range(3):
+            breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.get_stats()["opened"], 2)
+
+
+class StorageGuardTest(TestCase):
+    """Tests for StorageGuard."""
+
+    def _getOne(self, **kwargs):
+        kwargs.setdefault("backoff", 0)
+        return StorageGuard(**kwargs)
+
+    def test_call(self):
+        guard = self._getOne()
+        self.assertEqual(guard.call("getsize", len, "abc"), 3)
+        stats = guard.get_stats()
+        self.assertEqual(stats["calls"], 1)
+        self.assertEqual(stats["latency"]["getsize"]["count"], 1)
+
+    def test_retries_transient_errors(self):
+        guard = self._getOne(retries=2)
+        func = mock.Mock(side_effect=[ConnectionResetError, TimeoutError, 1])
+
+        self.assertEqual(guard.call("_exists", func, "a", idempotent=True), 1)
+
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(guard.get_stats()["retries"], 2)
+
+    def test_retries_exhausted(self):
+        guard = self._getOne(retries=1)
+        func = mock.Mock(side_effect=ClientError(503))
+
+        with self.assertRaises(StorageUnavailable) as cm:
+            guard.call("_exists", func, "a", idempotent=True)
+
+        self.assertIsInstance(cm.exception.__cause__, ClientError)
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(guard.get_stats()["failures"], 1)
+
+    def test_not_retried_in_ioloop(self):
+        """A server's IOLoop thread fails right away instead of sleeping."""
+        guard = self._getOne(retries=2, backoff=10)
+        func = mock.Mock(side_effect=ConnectionResetError)
+        mark_loop_thread()
+        try:
+            self.assertTrue(in_loop_thread())
+            with mock.patch("time.sleep") as sleep:
+                with self.assertRaises(StorageUnavailable):
+                    guard.call("_exists", func, "a", idempotent=True)
+        finally:
+            unmark_loop_thread()
+
+        sleep.assert_not_called()
+        func.assert_called_once_with("a")
+
+        # other threads still retry
+        func.reset_mock(side_effect=True)
+        func.side_effect = [ConnectionResetError, 1]
+        self.assertEqual(guard.call("_exists", func, "a", idempotent=True), 1)
+
+    def test_ended_loop_thread_forgotten(self):
+        thread = threading.Thread(target=mark_loop_thread)
+        thread.start()
+        thread.join()
+        del thread
+
+        self.assertFalse(in_loop_thread())
+        self.assertEqual(len(resilience._loop_threads), 0)
+
+    def test_not_idempotent_not_retried(self):
+        guard = self._getOne(retries=2)
+        func = mock.Mock(side_effect=ConnectionResetError)
+
+        with self.assertRaises(StorageUnavailable):
+            guard.call("rename", func, "a", "b")
+
+        func.assert_called_once_with("a", "b")
+
+    def test_permanent_error_not_retried(self):
+        guard = self._getOne(retries=2, breaker=CircuitBreaker(failure_threshold=1))
+        func = mock.Mock(side_effect=FileNotFoundError)
+
+        with self.assertRaises(FileNotFoundError):
+            guard.call("getsize", func, "a", idempotent=True)
+
+        func.assert_called_once_with("a")
+        self.assertEqual(guard.breaker.state, "closed")
+
+    def test_backoff_is_jittered_and_capped(self):
+        guard = self._getOne(retries=3, backoff=1)
+        guard.max_backoff = 3
+        func = mock.Mock(side_effect=[TimeoutError] * 3 + [1])
+        with (
+            mock.patch("django_ftpserver.resilience.time.sleep") as sleep,
+            mock.patch(
+                "django_ftpserver.resilience.random.uniform",
+                side_effect=lambda low, high: high,
+            ) as uniform,
+        ):
+            guard.call("getsize", func, "a", idempotent=True)
+
+        self.assertEqual(
+            [c.args for c in uniform.call_args_list], [(0, 1), (0, 2), (0, 3)]
+        )
+        self.assertEqual([c.args for c in sleep.call_args_list], [(1,), (2,), (3,)])
+
+    def test_deadline(self):
+        guard = self._getOne(deadlines={"default": 0.05})
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        with self.assertRaises(StorageTimeout):
+            guard.call("open", release.wait, 5)
+
+        self.assertEqual(guard.get_stats()["timeouts"], 1)
+
+    def test_deadline_per_operation(self):
+        guard = self._getOne(deadlines={"default": 5, "open": 0.05})
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        self.assertEqual(guard.call("getsize", len, "ab"), 2)
+        with self.assertRaises(StorageTimeout):
+            guard.call("open", release.wait, 5)
+
+    def test_abandoned_file_closed(self):
+        guard = self._getOne(deadlines={"default": 0.05})
+        release = threading.Event()
+        file = mock.Mock()
+
+        def slow_open():
+            release.wait(5)
+            return file
+
+        with self.assertRaises(StorageTimeout):
+            guard.call("open", slow_open)
+        release.set()
+        for _ in range(100):
+            if file.close.called:
+                break
+            time.sleep(0.01)
+
+        file.close.assert_called_once_with()
+
+    def test_breaker_rejects_calls(self):
+        guard = self._getOne(retries=0, breaker=CircuitBreaker(failure_threshold=2))
+        func = mock.Mock(side_effect=ConnectionResetError)
+        for _ in range(2):
+            with self.assertRaises(StorageUnavailable):
+                guard.call("_exists", func, "a", idempotent=True)
+
+        with self.assertRaises(StorageUnavailable):
+            guard.call("_exists", func, "a", idempotent=True)
+
+        self.assertEqual(func.call_count, 2)
+        stats = guard.get_stats()["breaker"]
+        self.assertEqual(stats["state"], "open")
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_nested_calls_not_guarded(self):
+        guard = self._getOne(retries=1)
+        inner = mock.Mock(side_effect=[ConnectionResetError, 1])
+
+        def outer():
+            return guard.call("getsize", inner, idempotent=True)
+
+        self.assertEqual(guard.call("stat", outer, idempotent=True), 1)
+
+        self.assertEqual(inner.call_count, 2)
+        stats = guard.get_stats()
+        self.assertEqual(stats["calls"], 1)
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(list(stats["latency"]), ["stat"])
+
+    def test_iterate(self):
+        guard = self._getOne(breaker=CircuitBreaker(failure_threshold=1))
+
+        def entries():
+            yield 1
+            raise ConnectionResetError
+
+        iterator = guard.iterate("listdir_with_stats", entries())
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaises(StorageUnavailable):
+            next(iterator)
+        self.assertEqual(guard.breaker.state, "open")
+
+
+class GetStorageGuardTest(TestCase):
+    """Tests for get_storage_guard."""
+
+    def test_created_from_settings(self):
+        with self.settings(
+            FTPSERVER_STORAGE_DEADLINE=10,
+            FTPSERVER_STORAGE_DEADLINES={"open": 60},
+            FTPSERVER_STORAGE_RETRIES=3,
+            FTPSERVER_STORAGE_BREAKER_THRESHOLD=7,
+        ):
+            guard = get_storage_guard("test-settings")
+            self.assertEqual(guard.deadlines, {"default": 10, "open": 60})
+            self.assertEqual(guard.retries, 3)
+            self.assertEqual(guard.breaker.failure_threshold, 7)
+            self.assertIs(get_storage_guard("test-settings"), guard)
+        self.assertIsNot(get_storage_guard("test-settings"), guard)
+
+    @override_settings(FTPSERVER_STORAGE_RETRIES=2)
+    def test_shared_per_storage(self):
+        self.assertIs(get_storage_guard("a"), get_storage_guard("a"))
+        self.assertIsNot(get_storage_guard("a"), get_storage_guard("b"))
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_storage_guard("test-disabled"))
+
+    def test_breaker_disabled(self):
+        with self.settings(FTPSERVER_STORAGE_RETRIES=2):
+            self.assertIsNone(get_storage_guard("test-no-breaker").breaker)
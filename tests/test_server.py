@@ -23,6 +23,8 @@ class TestFTPServerConfig:
         assert config.certfile is None
         assert config.keyfile is None
         assert config.sendfile is None
+        assert config.auth_workers is None
+        assert config.storage_workers is None
         assert config.handler_options == {}
 
     def test_config_with_all_options(self):
@@ -132,6 +134,28 @@ class TestFTPServerRunner:
         assert server.handler.passive_ports == [50000, 50001]
         server.close_all()
 
+    def test_create_server_with_auth_workers(self):
+        """Test server creation with auth workers."""
+        config = FTPServerConfig(host="127.0.0.1", port=2130, auth_workers=2)
+        runner = FTPServerRunner(config)
+
+        server = runner.create_server()
+
+        assert server.handler.auth_workers == 2
+        server.close_all()
+        server.handler.auth_workers = None
+
+    def test_create_server_with_storage_workers(self):
+        """Test server creation with storage workers."""
+        config = FTPServerConfig(host="127.0.0.1", port=2131, storage_workers=4)
+        runner = FTPServerRunner(config)
+
+        server = runner.create_server()
+
+        assert server.handler.storage_workers == 4
+        server.close_all()
+        server.handler.storage_workers = None
+
     def test_create_server_with_masquerade_address(self):
         """Test server creation with masquerade address."""
         config = FTPServerConfig(
@@ -0,0 +1,68 @@
+"""Tests for django_ftpserver.throttling module."""
+
+from unittest import mock
+
+from django.test import TestCase
+
+from django_ftpserver.throttling import LoginThrottle
+
+
+class LoginThrottleTest(TestCase):
+    """Tests for LoginThrottle."""
+
+    def test_burst(self):
+        """allow() accepts up to burst attempts, then rejects."""
+        throttle = LoginThrottle(rate=0.001, burst=3)
+        results = [throttle.allow("10.0.0.1", "user1") for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(throttle.allowed, 3)
+        self.assertEqual(throttle.rejected, 1)
+
+    def test_keyed_by_ip(self):
+        """An exhausted IP is rejected for any username."""
+        throttle = LoginThrottle(rate=0.001, burst=1)
+        self.assertTrue(throttle.allow("10.0.0.1", "user1"))
+        self.assertFalse(throttle.allow("10.0.0.1", "user2"))
+        self.assertTrue(throttle.allow("10.0.0.2", "user2"))
+
+    def test_keyed_by_username(self):
+        """An exhausted username is rejected from any IP."""
+        throttle = LoginThrottle(rate=0.001, burst=1)
+        self.assertTrue(throttle.allow("10.0.0.1", "user1"))
+        self.assertFalse(throttle.allow("10.0.0.2", "user1"))
+
+    def test_refill(self):
+        """Tokens are refilled at rate per second."""
+        throttle = LoginThrottle(rate=1, burst=1)
+        with mock.patch("time.monotonic", return_value=100.0):
+            self.assertTrue(throttle.allow("10.0.0.1", "user1"))
+            self.assertFalse(throttle.allow("10.0.0.1", "user1"))
+        with mock.patch("time.monotonic", return_value=101.0):
+            self.assertTrue(throttle.allow("10.0.0.1", "user1"))
+
+    def test_progressive_delay(self):
+        """failure_delay() doubles up to max_delay and success() resets it."""
+        throttle = LoginThrottle(rate=1, base_delay=1, max_delay=5)
+        delays = [throttle.failure_delay("10.0.0.1", "user1") for _ in range(4)]
+        self.assertEqual(delays, [1, 2, 4, 5])
+        throttle.success("10.0.0.1", "user1")
+        self.assertEqual(throttle.failure_delay("10.0.0.1", "user1"), 1)
+
+    def test_max_entries(self):
+        """Least recently used buckets are evicted beyond max_entries."""
+        throttle = LoginThrottle(rate=0.001, burst=1, max_entries=2)
+        throttle.allow("10.0.0.1", "user1")
+        throttle.allow("10.0.0.2", "user2")
+        self.assertEqual(throttle.get_stats()["entries"], 2)
+        self.assertEqual(throttle.evicted, 2)
+        # the bucket of 10.0.0.1 was evicted, so it starts full again
+        self.assertTrue(throttle.allow("10.0.0.1", "user3"))
+
+    def test_get_stats(self):
+        throttle = LoginThrottle(rate=1)
+        throttle.allow("10.0.0.1", "user1")
+        throttle.failure_delay("10.0.0.1", "user1")
+        self.assertEqual(
+            throttle.get_stats(),
+            {"allowed": 1, "rejected": 0, "failures": 1, "evicted": 0, "entries": 2},
+        )
@@ -0,0 +1,69 @@
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock, skipUnless
+
+from django.test import TestCase
+
+from django_ftpserver.watchers import InotifyWatcher
+
+
+@skipUnless(sys.platform.startswith("linux"), "inotify requires Linux")
+class InotifyWatcherTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.watcher = InotifyWatcher()
+        self.addCleanup(self.watcher.close)
+
+    def _touch(self, *names):
+        with open(os.path.join(self.root, *names), "wb") as f:
+            f.write(b"x")
+
+    def test_version_changes_on_create(self):
+        version = self.watcher.version(self.root)
+        self.assertEqual(self.watcher.version(self.root), version)
+
+        self._touch("a.txt")
+
+        self.assertNotEqual(self.watcher.version(self.root), version)
+        self.assertEqual(self.watcher.get_stats()["watches"], 1)
+
+    def test_subdirectory_removed(self):
+        sub = os.path.join(self.root, "sub")
+        os.mkdir(sub)
+        parent = self.watcher.version(self.root)
+        child = self.watcher.version(sub)
+
+        os.rmdir(sub)
+
+        self.assertNotEqual(self.watcher.version(self.root), parent)
+        self.assertIsNone(self.watcher.version(sub))
+        os.mkdir(sub)
+        self.assertNotEqual(self.watcher.version(sub), child)
+
+    def test_not_a_directory(self):
+        self._touch("a.txt")
+
+        self.assertIsNone(self.watcher.version(os.path.join(self.root, "a.txt")))
+
+    def test_max_watches(self):
+        os.mkdir(os.path.join(self.root, "sub"))
+        watcher = InotifyWatcher(max_watches=1)
+        self.addCleanup(watcher.close)
+
+        self.assertIsNotNone(watcher.version(self.root))
+        self.assertIsNone(watcher.version(os.path.join(self.root, "sub")))
+
+    def test_register_with_ioloop(self):
+        ioloop = mock.Mock()
+
+        self.watcher.register(ioloop)
+        ioloop.register.assert_called_once_with(
+            self.watcher.fileno(), self.watcher, ioloop.READ
+        )
+        self.watcher.close()
+
+        ioloop.unregister.assert_called_once()
+        self.assertEqual(self.watcher.fileno(), -1)